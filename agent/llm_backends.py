@@ -0,0 +1,211 @@
+# agent/llm_backends.py
+"""
+Wire formats for the LLM servers we can talk to.
+
+Every backend turns (prompt, stream, options) into an HTTP request and turns
+response lines back into text tokens plus one *final* stats dict, normalized to
+Ollama's field names (prompt_eval_count, prompt_eval_duration, eval_count,
+eval_duration; durations in ns) so callers never care which server answered.
+Servers that report prompt-cache reuse add `prompt_cached_count`.
+
+Options use Ollama's names (temperature, num_predict, stop) and are mapped
+per backend.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Optional, Tuple
+
+LLM_BACKEND = os.getenv("LLM_BACKEND", "ollama").strip().lower()
+
+DEFAULT_URLS = {
+    "ollama": "http://localhost:11434/api/generate",
+    "openai": "http://localhost:8000/v1/chat/completions",
+    "llamacpp": "http://localhost:8080/completion",
+}
+
+
+class LLMBackend(ABC):
+    """
+    One instance per generation: parse_line may keep per-stream state (e.g. to
+    emit the final stats exactly once).
+    """
+
+    name = "base"
+
+    def __init__(self, url: str, model: str, api_key: str = "", keep_alive: str = ""):
+        self.url = url
+        self.model = model
+        self.api_key = api_key
+        self.keep_alive = keep_alive
+
+    def headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+
+    @abstractmethod
+    def build_payload(self, prompt: str, stream: bool, options: Dict[str, Any]) -> Dict[str, Any]:
+        """(prompt, stream, Ollama-named options) → JSON request body."""
+
+    @abstractmethod
+    def parse_line(self, line: str) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """One streamed line → (token text, final stats or None)."""
+
+    @abstractmethod
+    def parse_response(self, data: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+        """Non-streamed JSON body → (full text, stats)."""
+
+    def end_of_stream(self) -> Optional[Dict[str, Any]]:
+        """Final stats still owed when the stream ended without a final line."""
+        return None
+
+
+class OllamaBackend(LLMBackend):
+    """Ollama /api/generate, NDJSON stream."""
+
+    name = "ollama"
+
+    def build_payload(self, prompt, stream, options):
+        payload = {"model": self.model, "prompt": prompt, "stream": stream, "options": options}
+        if self.keep_alive:
+            payload["keep_alive"] = self.keep_alive
+        return payload
+
+    def parse_line(self, line):
+        data = json.loads(line)
+        return data.get("response", ""), (data if data.get("done") else None)
+
+    def parse_response(self, data):
+        return data.get("response", ""), data
+
+
+class OpenAICompatBackend(LLMBackend):
+    """
+    OpenAI-compatible /v1/chat/completions (vLLM, LM Studio, llama.cpp, ...), SSE stream.
+
+    The final stats come from the usage chunk (`stream_options.include_usage`);
+    servers that ignore that option get an empty final on `[DONE]`, or at the
+    end of the stream once a `finish_reason` was seen.
+    """
+
+    name = "openai"
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self._finished = False
+        self._final_sent = False
+
+    def _final(self, usage: Dict[str, Any] | None) -> Optional[Dict[str, Any]]:
+        if self._final_sent:
+            return None
+        self._final_sent = True
+        return self._stats(usage)
+
+    def build_payload(self, prompt, stream, options):
+        payload: Dict[str, Any] = {
+            "model": self.model,
+            "messages": [{"role": "user", "content": prompt}],
+            "stream": stream,
+            "temperature": options.get("temperature", 0.3),
+            "max_tokens": options.get("num_predict", 2048),
+        }
+        if options.get("stop"):
+            payload["stop"] = options["stop"]
+        if stream:
+            payload["stream_options"] = {"include_usage": True}
+        return payload
+
+    @staticmethod
+    def _stats(usage: Dict[str, Any] | None) -> Dict[str, Any]:
+        usage = usage or {}
+        cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+        prompt_tokens = usage.get("prompt_tokens")
+        if cached is not None and prompt_tokens is not None:
+            prompt_tokens = max(0, prompt_tokens - cached)
+        return {
+            "done": True,
+            "prompt_eval_count": prompt_tokens,
+            "prompt_cached_count": cached,
+            "eval_count": usage.get("completion_tokens"),
+        }
+
+    def parse_line(self, line):
+        if not line.startswith("data:"):
+            return "", None
+        body = line[len("data:"):].strip()
+        if body == "[DONE]":
+            return "", self._final(None)
+        data = json.loads(body)
+        if data.get("usage"):
+            return "", self._final(data["usage"])
+        choices = data.get("choices") or [{}]
+        if choices[0].get("finish_reason"):
+            self._finished = True
+        return (choices[0].get("delta") or {}).get("content") or "", None
+
+    def end_of_stream(self):
+        return self._final(None) if self._finished else None
+
+    def parse_response(self, data):
+        choices = data.get("choices") or [{}]
+        text = (choices[0].get("message") or {}).get("content") or ""
+        return text, self._stats(data.get("usage"))
+
+
+class LlamaCppBackend(LLMBackend):
+    """llama.cpp server native /completion, SSE stream; keeps the prompt cache on."""
+
+    name = "llamacpp"
+
+    def build_payload(self, prompt, stream, options):
+        payload: Dict[str, Any] = {
+            "prompt": prompt,
+            "stream": stream,
+            "temperature": options.get("temperature", 0.3),
+            "n_predict": options.get("num_predict", 2048),
+            "cache_prompt": True,
+        }
+        if options.get("stop"):
+            payload["stop"] = options["stop"]
+        return payload
+
+    @staticmethod
+    def _stats(data: Dict[str, Any]) -> Dict[str, Any]:
+        t = data.get("timings") or {}
+        return {
+            "done": True,
+            "prompt_eval_count": t.get("prompt_n"),
+            "prompt_cached_count": t.get("cache_n"),
+            "prompt_eval_duration": int((t.get("prompt_ms") or 0) * 1e6),
+            "eval_count": t.get("predicted_n"),
+            "eval_duration": int((t.get("predicted_ms") or 0) * 1e6),
+        }
+
+    def parse_line(self, line):
+        if not line.startswith("data:"):
+            return "", None
+        data = json.loads(line[len("data:"):].strip())
+        return data.get("content", ""), (self._stats(data) if data.get("stop") else None)
+
+    def parse_response(self, data):
+        return data.get("content", ""), self._stats(data)
+
+
+BACKENDS = {
+    "ollama": OllamaBackend,
+    "openai": OpenAICompatBackend,
+    "llamacpp": LlamaCppBackend,
+}
+
+
+def make_backend(name: str, url: str = "", model: str = "", api_key: str = "",
+                 keep_alive: str = "") -> LLMBackend:
+    try:
+        cls = BACKENDS[name]
+    except KeyError as e:
+        raise ValueError(
+            f"Unknown LLM_BACKEND '{name}' (expected one of {sorted(BACKENDS)})"
+        ) from e
+    return cls(url or DEFAULT_URLS[name], model, api_key=api_key, keep_alive=keep_alive)
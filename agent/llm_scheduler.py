@@ -0,0 +1,181 @@
+# agent/llm_scheduler.py
+"""
+Admission control in front of the LLM backend.
+
+At most LLM_MAX_CONCURRENCY generations run at once; the rest wait in a bounded
+priority queue (planner calls ahead of composer calls). A request whose
+expected wait exceeds its deadline is rejected immediately with a Retry-After
+hint instead of slowing everyone down and timing out later.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from telemetry.metrics import LLM_QUEUE_WAIT_SECONDS, LLM_REJECTED, register_gauge
+
+# Lower value = served first
+PRIORITY_PLAN = 0
+PRIORITY_COMPOSE = 1
+PRIORITY_BACKGROUND = 2
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "2"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "32"))
+LLM_QUEUE_MAX_WAIT_SEC = float(os.getenv("LLM_QUEUE_MAX_WAIT_SEC", "20"))
+# Initial guess for one generation's slot time until we have measurements
+LLM_SERVICE_TIME_SEC = float(os.getenv("LLM_SERVICE_TIME_SEC", "5"))
+
+
+class LLMOverloaded(RuntimeError):
+    """Raised when a generation cannot start within its deadline."""
+
+    def __init__(self, retry_after: float, message: str = ""):
+        self.retry_after = max(1, int(retry_after + 0.999))
+        super().__init__(message or f"LLM is busy; retry after {self.retry_after}s")
+
+
+class LLMScheduler:
+    def __init__(
+        self,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        max_queue: int = LLM_MAX_QUEUE,
+        max_wait_sec: float = LLM_QUEUE_MAX_WAIT_SEC,
+        service_time_sec: float = LLM_SERVICE_TIME_SEC,
+    ):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self.max_wait_sec = max_wait_sec
+        self.service_time_sec = service_time_sec  # EMA of slot hold time
+        self.active = 0
+        self._queue: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        # counters
+        self.admitted = 0
+        self.rejected = 0
+        self.wait_sec_total = 0.0
+        self.wait_sec_max = 0.0
+        self._recent_waits: List[float] = []
+
+    # ---- estimates ----------------------------------------------------------
+
+    @property
+    def depth(self) -> int:
+        return sum(1 for _, _, f in self._queue if not f.done())
+
+    def _ahead_of(self, priority: int) -> int:
+        return sum(1 for p, _, f in self._queue if p <= priority and not f.done())
+
+    def estimate_wait(self, priority: int = PRIORITY_COMPOSE) -> float:
+        if self.active < self.max_concurrency and not self.depth:
+            return 0.0
+        rounds = (self._ahead_of(priority) + 1) / self.max_concurrency
+        return rounds * self.service_time_sec
+
+    def check_admission(self, priority: int = PRIORITY_PLAN,
+                        deadline_sec: Optional[float] = None) -> None:
+        """Fast pre-check for HTTP handlers (429 before a stream starts)."""
+        limit = self.max_wait_sec if deadline_sec is None else min(deadline_sec, self.max_wait_sec)
+        wait = self.estimate_wait(priority)
+        if self.depth >= self.max_queue and self.active >= self.max_concurrency:
+            self.rejected += 1
+            LLM_REJECTED.inc(reason="queue_full")
+            raise LLMOverloaded(wait, "LLM queue is full")
+        if wait > limit:
+            self.rejected += 1
+            LLM_REJECTED.inc(reason="expected_wait")
+            raise LLMOverloaded(wait, f"Expected LLM queue wait {wait:.1f}s exceeds {limit:.1f}s")
+
+    # ---- slots --------------------------------------------------------------
+
+    async def acquire(self, priority: int = PRIORITY_COMPOSE,
+                      deadline_sec: Optional[float] = None) -> float:
+        """Wait for a generation slot; returns seconds spent queued."""
+        t0 = time.monotonic()
+        if self.active < self.max_concurrency and not self.depth:
+            self.active += 1
+            self._record_wait(0.0, priority)
+            return 0.0
+
+        self.check_admission(priority, deadline_sec)
+        limit = self.max_wait_sec if deadline_sec is None else min(deadline_sec, self.max_wait_sec)
+        fut: asyncio.Future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._seq), fut))
+        try:
+            await asyncio.wait_for(asyncio.shield(fut), timeout=limit)
+        except asyncio.TimeoutError as e:
+            if not fut.done():
+                fut.cancel()
+                self.rejected += 1
+                LLM_REJECTED.inc(reason="queue_timeout")
+                raise LLMOverloaded(self.estimate_wait(priority), "Timed out in LLM queue") from e
+        except asyncio.CancelledError:
+            # Caller went away: give back a slot we were already handed, else leave the queue
+            if fut.done() and not fut.cancelled():
+                self.release()
+            else:
+                fut.cancel()
+            raise
+        waited = time.monotonic() - t0
+        self._record_wait(waited, priority)
+        return waited
+
+    def release(self, held_sec: Optional[float] = None) -> None:
+        if held_sec is not None:
+            self.service_time_sec = 0.8 * self.service_time_sec + 0.2 * held_sec
+        self.active = max(0, self.active - 1)
+        while self._queue and self.active < self.max_concurrency:
+            _, _, fut = heapq.heappop(self._queue)
+            if fut.done():
+                continue  # cancelled / timed out while queued
+            self.active += 1  # hand the slot over directly
+            fut.set_result(True)
+
+    @asynccontextmanager
+    async def slot(self, priority: int = PRIORITY_COMPOSE,
+                   deadline_sec: Optional[float] = None) -> AsyncIterator[float]:
+        waited = await self.acquire(priority, deadline_sec)
+        t0 = time.monotonic()
+        try:
+            yield waited
+        finally:
+            self.release(time.monotonic() - t0)
+
+    # ---- metrics ------------------------------------------------------------
+
+    def _record_wait(self, waited: float, priority: int) -> None:
+        LLM_QUEUE_WAIT_SECONDS.observe(waited, priority=str(priority))
+        self.admitted += 1
+        self.wait_sec_total += waited
+        self.wait_sec_max = max(self.wait_sec_max, waited)
+        self._recent_waits.append(waited)
+        del self._recent_waits[:-512]
+
+    def stats(self) -> Dict[str, Any]:
+        recent = sorted(self._recent_waits)
+        p95 = recent[int(0.95 * (len(recent) - 1))] if recent else 0.0
+        return {
+            "active": self.active,
+            "queue_depth": self.depth,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "wait_sec_avg": round(self.wait_sec_total / self.admitted, 4) if self.admitted else 0.0,
+            "wait_sec_p95": round(p95, 4),
+            "wait_sec_max": round(self.wait_sec_max, 4),
+            "service_time_sec": round(self.service_time_sec, 3),
+        }
+
+
+llm_scheduler = LLMScheduler()
+
+register_gauge("pci_llm_queue_depth", "Generations waiting for an LLM slot.",
+               lambda: llm_scheduler.depth)
+register_gauge("pci_llm_active", "Generations currently holding an LLM slot.",
+               lambda: llm_scheduler.active)
@@ -1,16 +1,121 @@
 # agent/llm_wrapper.py
-import json
 import os
-from typing import AsyncGenerator, Union
+import threading
+from typing import Any, AsyncGenerator, Callable, Dict, Optional, Union
 import httpx
 
+from agent.llm_backends import DEFAULT_URLS, LLM_BACKEND, LLMBackend, make_backend
+from agent.llm_scheduler import (
+    PRIORITY_BACKGROUND,
+    PRIORITY_COMPOSE,
+    PRIORITY_PLAN,
+    llm_scheduler,
+)
+from telemetry import tracing
+from telemetry.metrics import record_llm_final
+
 
 def get_env(var_name: str, default: str) -> str:
     return os.getenv(var_name, default)
 
 
-LLM_API_URL = get_env("LLM_API_URL", "http://localhost:11434/api/generate")
+LLM_API_URL = get_env("LLM_API_URL", DEFAULT_URLS.get(LLM_BACKEND, DEFAULT_URLS["ollama"]))
 LLM_MODEL = get_env("LLM_MODEL", "qwen2.5:7b-instruct")
+LLM_API_KEY = get_env("LLM_API_KEY", "")
+# Keep the model (and its KV cache with our static prompt prefixes) resident
+LLM_KEEP_ALIVE = get_env("LLM_KEEP_ALIVE", "30m")
+
+
+def get_backend() -> LLMBackend:
+    """Backend for LLM_BACKEND (ollama | openai | llamacpp) at the configured URL/model."""
+    return make_backend(
+        LLM_BACKEND, LLM_API_URL, LLM_MODEL, api_key=LLM_API_KEY, keep_alive=LLM_KEEP_ALIVE
+    )
+
+
+class PromptEvalStats:
+    """
+    Prompt-evaluation accounting from the final stream chunk, using only counts
+    the LLM server reports (never our own token estimate).
+
+    Tokens reused from the server's prompt cache per request:
+    - `prompt_cached_count` when the backend reports it (OpenAI-compatible
+      `cached_tokens`, llama.cpp `cache_n`);
+    - otherwise (Ollama reports only what it evaluated) the template's static
+      prefix as measured at priming: uncached minus primed `prompt_eval_count`
+      of the bare prefix. A request counts as a prefix hit when it evaluated
+      fewer tokens than the uncached prefix alone, which only a cache hit allows.
+    Labels with neither signal report reuse as unknown. Reuse is priced at the
+    observed ns/token of actual prompt evaluation.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.by_label: Dict[str, Dict[str, float]] = {}
+        # label -> server-side prompt_eval_count of the bare prefix {uncached, primed}
+        self.prefixes: Dict[str, Dict[str, int]] = {}
+
+    def record_prime(self, label: str, uncached: Dict[str, Any],
+                     primed: Dict[str, Any]) -> Optional[int]:
+        """
+        Learn a template prefix's size from two priming calls (cold, then warm);
+        returns the reusable tokens, or None when the first call was already warm
+        or the server kept nothing (size unknown).
+        """
+        cold = int(uncached.get("prompt_eval_count") or 0)
+        warm = int(primed.get("prompt_eval_count") or 0)
+        if cold <= warm:
+            return None
+        with self._lock:
+            self.prefixes[label] = {"uncached": cold, "primed": warm}
+        return cold - warm
+
+    def _reused(self, label: str, evaluated: int, final_chunk: Dict[str, Any]) -> Optional[int]:
+        cached = final_chunk.get("prompt_cached_count")
+        if cached is not None:
+            return int(cached)
+        prefix = self.prefixes.get(label)
+        if prefix is None:
+            return None
+        return prefix["uncached"] - prefix["primed"] if evaluated < prefix["uncached"] else 0
+
+    def record(self, label: str, final_chunk: Dict[str, Any]) -> Dict[str, Any]:
+        evaluated = int(final_chunk.get("prompt_eval_count") or 0)
+        eval_ns = int(final_chunk.get("prompt_eval_duration") or 0)
+        with self._lock:
+            st = self.by_label.setdefault(label, {
+                "requests": 0, "evaluated_tokens": 0, "eval_sec": 0.0, "reuse_unknown": 0,
+                "reused_tokens": 0, "saved_sec": 0.0, "ns_per_token": 0.0,
+            })
+            if evaluated and eval_ns:
+                rate = eval_ns / evaluated
+                st["ns_per_token"] = rate if not st["ns_per_token"] else (
+                    0.8 * st["ns_per_token"] + 0.2 * rate
+                )
+            reused = self._reused(label, evaluated, final_chunk)
+            saved = None if reused is None else reused * st["ns_per_token"] / 1e9
+            st["requests"] += 1
+            st["evaluated_tokens"] += evaluated
+            st["eval_sec"] += eval_ns / 1e9
+            if reused is None:
+                st["reuse_unknown"] += 1
+            else:
+                st["reused_tokens"] += reused
+                st["saved_sec"] += saved
+        return {"evaluated": evaluated, "eval_sec": eval_ns / 1e9,
+                "reused": reused, "saved_sec": saved}
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = {k: dict(v) for k, v in self.by_label.items()}
+            out["prefixes"] = {k: dict(v) for k, v in self.prefixes.items()}
+            return out
+
+
+prompt_eval_stats = PromptEvalStats()
+
+# Metric label for each scheduler priority
+_STAGE_LABELS = {PRIORITY_PLAN: "plan", PRIORITY_COMPOSE: "compose", PRIORITY_BACKGROUND: "prime"}
 
 
 async def query_llm(
@@ -18,48 +123,123 @@ async def query_llm(
     stream: bool = True,
     timeout: int = 10,
     max_retries: int = 3,
+    options: Optional[Dict[str, Any]] = None,
+    on_complete: Optional[Callable[[Dict[str, Any]], None]] = None,
+    priority: int = PRIORITY_COMPOSE,
+    queue_deadline: Optional[float] = None,
 ) -> Union[str, AsyncGenerator[str, None]]:
-    payload = {
-        "model": LLM_MODEL,
-        "prompt": prompt,
-        "stream": stream,
-        "options": {"temperature": 0.3, "num_predict": 2048},
-    }
+    """
+    `on_complete` receives the final stats chunk (Ollama field names:
+    prompt_eval_count, prompt_eval_duration, eval_count, eval_duration, ...)
+    when the generation ends, whichever backend served it.
+
+    Every generation holds an llm_scheduler slot for its whole duration;
+    `priority` orders the wait queue and `queue_deadline` (seconds) bounds the
+    wait, raising LLMOverloaded instead of queueing past it.
+    """
+    backend = get_backend()
+    stage = _STAGE_LABELS.get(priority, "other")
+    # Not made current: a stream's span stays open across the consumer's yields
+    span = tracing.start_span(
+        "llm.generate", stage=stage, backend=backend.name, prompt_chars=len(prompt), stream=stream
+    )
+
+    def finish(final: Dict[str, Any]) -> None:
+        record_llm_final(stage, final)
+        span.set(
+            prompt_eval_count=final.get("prompt_eval_count") or 0,
+            eval_count=final.get("eval_count") or 0,
+        )
+        if on_complete is not None:
+            on_complete(final)
+
+    payload = backend.build_payload(
+        prompt, stream, {"temperature": 0.3, "num_predict": 2048, **(options or {})}
+    )
 
     if not stream:
-        async with httpx.AsyncClient(timeout=timeout) as client:
-            for attempt in range(max_retries):
-                try:
-                    response = await client.post(LLM_API_URL, json=payload)
-                    response.raise_for_status()
-                    return (await response.json()).get("response", "")
-                except httpx.RequestError as e:
-                    if attempt == max_retries - 1:
-                        raise RuntimeError(
-                            f"LLM query failed after {max_retries} attempts: {e}"
-                        ) from e
-        return ""
+        try:
+            async with llm_scheduler.slot(priority, queue_deadline) as waited:
+                span.set(queue_wait_sec=round(waited, 4))
+                async with httpx.AsyncClient(timeout=timeout) as client:
+                    for attempt in range(max_retries):
+                        try:
+                            response = await client.post(
+                                backend.url, json=payload, headers=backend.headers()
+                            )
+                            response.raise_for_status()
+                            text, stats = backend.parse_response(response.json())
+                            finish(stats)
+                            return text
+                        except httpx.RequestError as e:
+                            if attempt == max_retries - 1:
+                                raise RuntimeError(
+                                    f"LLM query failed after {max_retries} attempts: {e}"
+                                ) from e
+            return ""
+        except BaseException as e:
+            span.error(e)
+            raise
+        finally:
+            span.end()
 
     async def token_generator() -> AsyncGenerator[str, None]:
-        for attempt in range(max_retries):
-            try:
-                async with httpx.AsyncClient(timeout=timeout) as client:
-                    async with client.stream(
-                        "POST", LLM_API_URL, json=payload
-                    ) as response:
-                        response.raise_for_status()
-                        async for line in response.aiter_lines():
-                            if line:
-                                data = json.loads(line)
-                                token = data.get("response", "")
-                                if token:
-                                    yield token
-                break
-            except httpx.RequestError as e:
-                if attempt == max_retries - 1:
-                    raise RuntimeError(
-                        f"LLM stream failed after {max_retries} attempts: {e}"
-                    ) from e
+        yielded = 0
+        try:
+            async with llm_scheduler.slot(priority, queue_deadline) as waited:
+                span.set(queue_wait_sec=round(waited, 4))
+                for attempt in range(max_retries):
+                    try:
+                        async with httpx.AsyncClient(timeout=timeout) as client:
+                            async with client.stream(
+                                "POST", backend.url, json=payload, headers=backend.headers()
+                            ) as response:
+                                response.raise_for_status()
+                                async for line in response.aiter_lines():
+                                    if not line:
+                                        continue
+                                    token, final = backend.parse_line(line)
+                                    if token:
+                                        yielded += 1
+                                        yield token
+                                    if final is not None:
+                                        finish(final)
+                                final = backend.end_of_stream()
+                                if final is not None:
+                                    finish(final)
+                        break
+                    except httpx.RequestError as e:
+                        # Retrying after tokens went out would duplicate them downstream
+                        if yielded or attempt == max_retries - 1:
+                            raise RuntimeError(
+                                f"LLM stream failed after {attempt + 1} attempts: {e}"
+                            ) from e
+        except GeneratorExit:
+            span.set(closed_early=True)
+            raise
+        except BaseException as e:
+            span.error(e)
+            raise
+        finally:
+            span.set(tokens=yielded)
+            span.end()
 
     return token_generator()
 
+
+async def prime_prefix(prefix: str, timeout: int = 120) -> Dict[str, Any]:
+    """
+    Evaluate a static prompt prefix once (1 token generated) so the LLM server
+    holds it in its KV cache; later prompts sharing the prefix skip re-evaluating it.
+    """
+    stats: Dict[str, Any] = {}
+    await query_llm(
+        prefix,
+        stream=False,
+        timeout=timeout,
+        max_retries=1,
+        options={"temperature": 0.0, "num_predict": 1},
+        on_complete=stats.update,
+        priority=PRIORITY_BACKGROUND,
+    )
+    return stats
@@ -1,4 +1,4 @@
-from typing import List
+from typing import List, Optional
 from pydantic import BaseModel
 from agent.models.base import BaseToolOutputSchema
 
@@ -7,6 +7,7 @@ class RequirementEntry(BaseModel):
     id: str
     text: str
     tags: List[str]
+    score: Optional[float] = None  # retrieval similarity (search hits only)
 
 
 class RequirementOutput(BaseToolOutputSchema):
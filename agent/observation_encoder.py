@@ -0,0 +1,211 @@
+# agent/observation_encoder.py
+"""
+Compact, token-budgeted encoding of tool observations for the composer prompt.
+
+One line per action, then one line per requirement (deduplicated across actions):
+
+    [1] get 10.2 -> success
+    [2] search "pci dss audit logs" -> success, 8 hits
+    10.2 (score 1.00; tags: logging) Audit logs are implemented to support ...
+
+Requirements are ranked by retrieval score (explicit `get` hits first) and
+kept while they fit the budget; kept lines are emitted in first-seen order.
+The "(omitted for length: ...)" note counts against the budget too.
+
+Token counts are exact only when PROMPT_TOKENIZER names a tokenizer that is
+available locally; otherwise they are a BPE-like estimate and the budget is
+approximate (see `token_counts_are_estimates()`).
+"""
+
+from __future__ import annotations
+
+import logging
+import math
+import os
+import re
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Explicitly requested IDs outrank any similarity score
+GET_SCORE = 1.0
+# Unscored hits (SQLite keyword fallback) rank below scored ones, by position
+UNSCORED_BASE = 0.5
+
+_PIECE_RX = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=1)
+def _load_tokenizer() -> Optional[Callable[[str], List[Any]]]:
+    """
+    PROMPT_TOKENIZER names a Hugging Face tokenizer matching the composer model
+    (e.g. Qwen/Qwen2.5-7B-Instruct). It must be available locally; without it we
+    fall back to a BPE-like estimate.
+    """
+    name = (os.getenv("PROMPT_TOKENIZER") or "").strip()
+    if not name:
+        return None
+    try:
+        from transformers import AutoTokenizer  # heavy import
+
+        tok = AutoTokenizer.from_pretrained(name, local_files_only=True)
+        return lambda text: tok.encode(text, add_special_tokens=False)
+    except Exception as e:
+        logger.warning("PROMPT_TOKENIZER=%s unavailable, estimating token counts: %s", name, e)
+        return None
+
+
+def token_counts_are_estimates() -> bool:
+    """True when count_tokens() uses the heuristic instead of a real tokenizer."""
+    return _load_tokenizer() is None
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    encode = _load_tokenizer()
+    if encode is not None:
+        return len(encode(text))
+    # ~4 chars per BPE piece for words, one per punctuation mark
+    return sum(max(1, math.ceil(len(p) / 4)) for p in _PIECE_RX.findall(text))
+
+
+def _one_line(s: Any) -> str:
+    return " ".join(str(s or "").split())
+
+
+def _items(result: Dict[str, Any]) -> List[Dict[str, Any]]:
+    payload = result.get("result")
+    if isinstance(payload, dict):
+        payload = [payload]
+    return [it for it in payload or [] if isinstance(it, dict) and it.get("id")]
+
+
+def _action_line(pos: int, obs: Dict[str, Any], n_items: int) -> str:
+    tool = obs.get("tool") or "tool"
+    tin = obs.get("input") or {}
+    result = obs.get("raw_result") if isinstance(obs.get("raw_result"), dict) else {}
+    status = obs.get("status") or result.get("status") or "unknown"
+
+    if tool == "search":
+        target = '"' + _one_line(tin.get("q") or tin.get("query")) + '"'
+    elif tool == "get":
+        ids = tin.get("ids") or [tin.get("id")]
+        target = ", ".join(str(i) for i in ids if i)
+    else:
+        target = ", ".join(f"{k}={_one_line(v)}" for k, v in tin.items())
+
+    line = f"[{pos}] {tool} {target} -> {status}"
+    if tool == "search" and n_items:
+        line += f", {n_items} hits"
+    meta = result.get("meta") if isinstance(result.get("meta"), dict) else {}
+    if meta.get("not_found"):
+        line += f" (missing: {', '.join(meta['not_found'])})"
+    if status == "error" and result.get("message"):
+        line += f" ({_one_line(result['message'])})"
+    return line
+
+
+def _requirement_line(item: Dict[str, Any], score: float) -> str:
+    tags = [t for t in item.get("tags") or [] if t]
+    attrs = f"score {score:.2f}" + (f"; tags: {','.join(tags)}" if tags else "")
+    text = _one_line(item.get("text"))
+    return f"{item['id']} ({attrs}) {text}".rstrip()
+
+
+def _fit_line(line: str, budget: int) -> str:
+    """Shorten a single over-budget line word by word (only used for the top item)."""
+    words = line.split(" ")
+    while len(words) > 2 and count_tokens(" ".join(words) + " …") > budget:
+        words = words[: max(2, int(len(words) * 0.8))]
+    return " ".join(words) + " …"
+
+
+def encode_observations(
+    observations: List[Dict[str, Any]],
+    token_budget: int,
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Returns (prompt_text, stats). `observations` are the pipeline's entries
+    ({tool, input, status, raw_result}). Stats: tokens, kept, omitted ids,
+    estimated (token counts are heuristic, see module docstring).
+    """
+    header: List[str] = []
+    best: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+    order: List[str] = []
+
+    for pos, obs in enumerate(observations, 1):
+        result = obs.get("raw_result") if isinstance(obs.get("raw_result"), dict) else {}
+        items = _items(result)
+        header.append(_action_line(pos, obs, len(items)))
+        for rank, it in enumerate(items):
+            rid = str(it["id"]).strip()
+            if obs.get("tool") == "get":
+                score = GET_SCORE
+            elif isinstance(it.get("score"), (int, float)):
+                score = float(it["score"])
+            else:
+                score = UNSCORED_BASE - rank * 0.01
+            if rid not in best:
+                order.append(rid)
+                best[rid] = (score, it)
+            else:
+                # keep the best score and a copy that actually carries text
+                old_score, old_it = best[rid]
+                best[rid] = (max(score, old_score), old_it if old_it.get("text") else it)
+
+    ranked = sorted(order, key=lambda r: -best[r][0])
+    used = count_tokens("\n".join(header))
+    kept, omitted, used = _fill(ranked, best, used, token_budget)
+
+    # Make room for the omitted note by dropping the lowest-ranked kept lines
+    note = _omitted_note(omitted)
+    while note and kept and used + count_tokens(note) + 1 > token_budget:
+        rid = next(r for r in reversed(ranked) if r in kept)
+        used -= kept.pop(rid)[1]
+        omitted = [r for r in ranked if r in omitted or r == rid]
+        note = _omitted_note(omitted)
+    if note and used + count_tokens(note) + 1 > token_budget:
+        note = f"(omitted for length: {len(omitted)} requirements)"
+
+    lines = header + [kept[rid][0] for rid in order if rid in kept]
+    if note:
+        lines.append(note)
+        used += count_tokens(note) + 1
+    stats = {
+        "tokens": used,
+        "kept": len(kept),
+        "omitted": omitted,
+        "estimated": token_counts_are_estimates(),
+    }
+    return "\n".join(lines), stats
+
+
+def _fill(
+    ranked: List[str],
+    best: Dict[str, Tuple[float, Dict[str, Any]]],
+    used: int,
+    token_budget: int,
+) -> Tuple[Dict[str, Tuple[str, int]], List[str], int]:
+    """Keep requirement lines best-first while they fit: (id -> (line, cost), omitted, used)."""
+    kept: Dict[str, Tuple[str, int]] = {}
+    omitted: List[str] = []
+    for rid in ranked:
+        score, item = best[rid]
+        line = _requirement_line(item, score)
+        cost = count_tokens(line) + 1
+        if used + cost > token_budget:
+            if not kept and token_budget - used > 8:
+                line = _fit_line(line, token_budget - used - 1)
+                cost = count_tokens(line) + 1
+            else:
+                omitted.append(rid)
+                continue
+        kept[rid] = (line, cost)
+        used += cost
+    return kept, omitted, used
+
+
+def _omitted_note(omitted: List[str]) -> str:
+    return f"(omitted for length: {', '.join(omitted)})" if omitted else ""
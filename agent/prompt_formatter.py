@@ -1,4 +1,68 @@
+import threading
 from pathlib import Path
+from typing import Dict, Tuple
+
+TEMPLATE_DIR = Path("agent")
+TEMPLATE_FILES = {
+    "main": "prompt_template.txt",
+    "followup": "followup_template.txt",
+    "smalltalk": "smalltalk_template.txt",
+}
+
+# Placeholders that change per request; everything before the first one is a
+# static prefix the LLM server can keep in its KV cache across requests.
+DYNAMIC_PLACEHOLDERS = ("{{ user_input }}", "{{ context }}", "{{ tool_result }}")
+
+
+class PromptTemplate:
+    """A template precompiled into a static prefix and a dynamic suffix."""
+
+    def __init__(self, name: str, text: str):
+        self.name = name
+        cut = min((i for p in DYNAMIC_PLACEHOLDERS if (i := text.find(p)) != -1),
+                  default=len(text))
+        self.prefix = text[:cut]
+        self.suffix = text[cut:]
+
+    def render(self, **values: str) -> str:
+        prefix, suffix = self.prefix, self.suffix
+        for key, value in values.items():
+            placeholder = "{{ " + key + " }}"
+            # only static values (e.g. tool_help) can appear in the prefix
+            if placeholder in prefix:
+                prefix = prefix.replace(placeholder, value)
+            suffix = suffix.replace(placeholder, value)
+        return prefix + suffix
+
+
+_templates: Dict[str, Tuple[Tuple[int, int], PromptTemplate]] = {}
+_templates_lock = threading.Lock()
+
+
+def _file_sig(path: Path) -> Tuple[int, int]:
+    st = path.stat()
+    return (st.st_mtime_ns, st.st_size)
+
+
+def get_template(template_type: str) -> PromptTemplate:
+    """
+    Loaded once and kept in memory; a cheap stat() picks up edits on disk
+    without a restart.
+    """
+    path = TEMPLATE_DIR / TEMPLATE_FILES[template_type]
+    sig = _file_sig(path)
+    cached = _templates.get(template_type)
+    if cached is not None and cached[0] == sig:
+        return cached[1]
+    with _templates_lock:
+        template = PromptTemplate(template_type, path.read_text(encoding="utf-8"))
+        _templates[template_type] = (sig, template)
+        return template
+
+
+def load_templates() -> Dict[str, PromptTemplate]:
+    """Preload every template (called at startup/warmup)."""
+    return {name: get_template(name) for name in TEMPLATE_FILES}
 
 
 def format_prompt(
@@ -9,21 +73,11 @@ def format_prompt(
     tool_result: str = "",
 ) -> str:
     if template_type == "followup":
-        template_path = Path("agent/followup_template.txt")
-        template = template_path.read_text(encoding="utf-8")
-        return template.replace("{{ tool_result }}", tool_result).replace(
-            "{{ user_input }}", user_input
-        )
+        return get_template("followup").render(tool_result=tool_result, user_input=user_input)
 
     if template_type == "smalltalk":
-        template_path = Path("agent/smalltalk_template.txt")
-        template = template_path.read_text(encoding="utf-8")
-        return template.replace("{{ user_input }}", user_input)
-
-    template_path = Path("agent/prompt_template.txt")
-    template = template_path.read_text(encoding="utf-8")
-    return (
-        template.replace("{{ user_input }}", user_input)
-        .replace("{{ context }}", context)
-        .replace("{{ tool_help }}", tool_help)
+        return get_template("smalltalk").render(user_input=user_input)
+
+    return get_template("main").render(
+        user_input=user_input, context=context, tool_help=tool_help
     )
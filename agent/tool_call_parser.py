@@ -1,11 +1,13 @@
 import json
 import re
-from typing import List, Any, Dict
+from typing import List, Any, Optional
 
 MAX_IDS = 50
 
 # 1..12 followed by up to 3 dotted segments (1–2 digits each)
 _ID_RX = re.compile(r"\b(1[0-2]|[1-9])(?:\.(\d{1,2})){0,3}\b")
+# get:"10.2" — a complete single-ID plan
+_SINGLE_QUOTED_ID_RX = re.compile(r'"\s*' + _ID_RX.pattern + r'\s*"')
 
 def _is_valid_pci_id(s: str) -> bool:
     if not s or " " in s:
@@ -42,7 +44,7 @@ def _parse_compact(text: str) -> Any:
     if ":" not in s:
         if s.lower() == "skip":
             return {"skip": True}
-        raise ValueError("Expected 'get:...' or 'search:...' or 'skip'")
+        raise ValueError("Expected 'get:...', 'search:...', 'related:...' or 'skip'")
 
     verb, payload = s.split(":", 1)
     verb = verb.strip().lower()
@@ -102,8 +104,74 @@ def _parse_compact(text: str) -> Any:
             return [{"tool_name": "search", "tool_input": {"q": q}}]
         raise ValueError('search expects a query, e.g., search:"topic"')
 
+    if verb == "related":
+        loose_ids = _extract_ids_loose(payload)
+        if not loose_ids:
+            raise ValueError('related expects one PCI ID, e.g., related:"10.2"')
+        return [{"tool_name": "related", "tool_input": {"id": loose_ids[0]}}]
+
     raise ValueError(f"Unknown verb: {verb}")
 
+def find_pci_ids(text: str) -> List[str]:
+    """Valid PCI IDs (1–12 roots) mentioned anywhere in free text, de-duplicated, in order."""
+    return _extract_ids_loose(text)
+
+class IncrementalPlanParser:
+    """
+    Accumulates planner tokens and reports the plan as soon as it is complete,
+    so the caller can dispatch tools and close the upstream stream early.
+
+    Complete means: the first non-empty DSL line ended (newline), a `get:[...]`
+    array / single quoted `get:"<ID>"` / quoted `search:"..."` or `related:"..."`
+    closed, or a JSON plan parsed. Multi-line JSON is only cut once it parses.
+    """
+
+    def __init__(self) -> None:
+        self.buffer = ""
+        self.complete: Optional[str] = None
+
+    def feed(self, token: str) -> Optional[str]:
+        if self.complete is not None:
+            return self.complete
+        self.buffer += token or ""
+        text = self.buffer.lstrip()
+        if not text:
+            return None
+
+        if text[0] in "{[":
+            try:
+                json.loads(text.rstrip())
+            except ValueError:
+                return None
+            self.complete = text.rstrip()
+            return self.complete
+
+        if "\n" in text:
+            self.complete = text.split("\n", 1)[0].strip()
+            return self.complete
+
+        verb, _, payload = text.partition(":")
+        verb = verb.strip().lower()
+        payload = payload.strip()
+        if verb == "get" and payload.startswith("[") and payload.endswith("]"):
+            try:
+                json.loads(payload)
+            except ValueError:
+                return None
+            self.complete = text.strip()
+        elif verb == "get" and _SINGLE_QUOTED_ID_RX.fullmatch(payload):
+            # The template asks for get:[...] when there are several IDs
+            self.complete = text.strip()
+        elif (verb in ("search", "related") and len(payload) >= 2
+              and payload[0] == payload[-1] == '"'):
+            self.complete = text.strip()
+        return self.complete
+
+    def finish(self) -> str:
+        """Plan text once the stream ended (complete line, or whatever was buffered)."""
+        return self.complete if self.complete is not None else self.buffer.strip()
+
+
 def extract_tool_call(text: str):
     return _parse_compact(text)
 
@@ -6,6 +6,9 @@ import time
 import logging
 from rich import print
 
+# Total time budget sent with each question; the server degrades to materials-only near it
+DEFAULT_DEADLINE_SEC = float(os.getenv("ASK_DEADLINE_SEC", "60"))
+
 logging.basicConfig(
     filename="cli.log", level=logging.INFO, format="%(asctime)s %(message)s"
 )
@@ -53,7 +56,7 @@ event_handlers = {
 }
 
 
-def process_message(message: str, use_mock=False):
+def process_message(message: str, use_mock=False, deadline=DEFAULT_DEADLINE_SEC):
     try:
         start = time.time()
         url = (
@@ -63,9 +66,10 @@ def process_message(message: str, use_mock=False):
         )
         response = requests.post(
             url,
-            json={"message": message},
+            json={"message": message, "deadline_sec": deadline},
             stream=True,
-            timeout=30,
+            # connect, then read: the server itself stops at the deadline
+            timeout=(5, deadline + 5),
         )
         response.raise_for_status()
 
@@ -99,6 +103,12 @@ def parse_args():
     parser.add_argument(
         "--mock", action="store_true", help="Use mock endpoint instead of live"
     )
+    parser.add_argument(
+        "--deadline",
+        type=float,
+        default=DEFAULT_DEADLINE_SEC,
+        help="Seconds the server may spend on each answer",
+    )
     return parser.parse_args()
 
 
@@ -107,7 +117,7 @@ def main():
     args = parse_args()
 
     if args.message:
-        process_message(args.message, use_mock=args.mock)
+        process_message(args.message, use_mock=args.mock, deadline=args.deadline)
         return
 
     while True:
@@ -115,7 +125,7 @@ def main():
             message = input("> ")
             if message.lower() in {"exit", "quit"}:
                 break
-            process_message(message, use_mock=args.mock)
+            process_message(message, use_mock=args.mock, deadline=args.deadline)
         except KeyboardInterrupt:
             print("\n[red]Exiting...[/red]")
             break
@@ -0,0 +1,96 @@
+# mcp_server/answer_cache.py
+
+from __future__ import annotations
+
+import itertools
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "256"))
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+
+
+@dataclass
+class CachedAnswer:
+    embedding: np.ndarray           # (d,) normalized message embedding
+    fingerprint: Hashable           # (artifact version, frozenset of requirement ids)
+    events: List[Dict[str, Any]]    # replayable stream (stages, materials, tokens)
+    similarity: float = 0.0         # filled on lookup
+
+
+class AnswerCache:
+    """
+    Semantic cache of complete /ask_full event streams.
+
+    An entry is only eligible when its fingerprint (artifact version + retrieved
+    requirement ids) matches exactly; among those, the nearest message embedding
+    wins if its cosine similarity clears the threshold. Bounded LRU.
+    """
+
+    def __init__(self, maxsize: int = ANSWER_CACHE_SIZE,
+                 threshold: float = ANSWER_CACHE_THRESHOLD):
+        self.maxsize = maxsize
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[int, CachedAnswer]" = OrderedDict()
+        self._by_fp: Dict[Hashable, List[int]] = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+
+    def lookup(self, embedding: np.ndarray, fingerprint: Hashable) -> Optional[CachedAnswer]:
+        vec = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        with self._lock:
+            keys = self._by_fp.get(fingerprint) or []
+            if not keys:
+                self.misses += 1
+                return None
+            mat = np.stack([self._entries[k].embedding for k in keys])
+            sims = mat @ vec
+            best = int(np.argmax(sims))
+            if float(sims[best]) < self.threshold:
+                self.misses += 1
+                return None
+            key = keys[best]
+            self._entries.move_to_end(key)
+            self.hits += 1
+            entry = self._entries[key]
+            return CachedAnswer(entry.embedding, entry.fingerprint, list(entry.events),
+                                similarity=float(sims[best]))
+
+    def store(self, embedding: np.ndarray, fingerprint: Hashable,
+              events: List[Dict[str, Any]]) -> None:
+        if self.maxsize <= 0 or not events:
+            return
+        vec = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        with self._lock:
+            key = next(self._ids)
+            self._entries[key] = CachedAnswer(vec, fingerprint, list(events))
+            self._by_fp.setdefault(fingerprint, []).append(key)
+            while len(self._entries) > self.maxsize:
+                old_key, old = self._entries.popitem(last=False)
+                bucket = self._by_fp.get(old.fingerprint, [])
+                if old_key in bucket:
+                    bucket.remove(old_key)
+                if not bucket:
+                    self._by_fp.pop(old.fingerprint, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._by_fp.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+
+def make_fingerprint(version: str, ids: List[str]) -> Tuple[str, frozenset]:
+    return (version, frozenset(i for i in ids if i))
+
+
+answer_cache = AnswerCache()
@@ -0,0 +1,248 @@
+# mcp_server/artifacts.py
+"""
+Download of the FAISS index and SQLite DB from S3 (or an S3-compatible store
+via S3_ENDPOINT_URL), run from the warmup thread so it gets the result directly.
+
+- Files download in parallel, each as ARTIFACT_PART_MB ranged GETs pinned to the
+  ETag seen at HEAD (If-Match), written at their offsets into `<dst>.download`.
+- Finished part numbers are recorded in `<dst>.download.json`, so a restarted
+  container resumes a partial download instead of starting over.
+- The result is checked against the checksum manifest (ARTIFACT_MANIFEST_KEY:
+  {"<key>": {"sha256": ..., "size": ...}}), fsynced and renamed into place.
+- `<dst>.etag` records what is on disk; a matching ETag skips the download.
+- A lock file makes concurrent uvicorn workers wait for one download.
+
+Build the manifest after an index rebuild and upload it next to the artifacts:
+
+    python -m mcp_server.artifacts --manifest data/pci_index.faiss=pci_index.faiss \\
+        data/pci_requirements.db=pci_requirements.db > manifest.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+DATA_BUCKET = os.getenv("DATA_BUCKET", "")
+FAISS_KEY = os.getenv("FAISS_KEY", "")
+DB_KEY = os.getenv("DB_KEY", "")
+# e.g. http://minio:9000 for an S3-compatible store; empty = AWS
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL", "")
+# Object key of the checksum manifest; empty = only sizes are checked
+ARTIFACT_MANIFEST_KEY = os.getenv("ARTIFACT_MANIFEST_KEY", "")
+ARTIFACT_PART_MB = int(os.getenv("ARTIFACT_PART_MB", "8"))
+ARTIFACT_MAX_WORKERS = int(os.getenv("ARTIFACT_MAX_WORKERS", "8"))
+
+
+class ArtifactError(RuntimeError):
+    pass
+
+
+def enabled() -> bool:
+    return bool(DATA_BUCKET and (FAISS_KEY or DB_KEY))
+
+
+def artifact_files(faiss_path: str, db_path: str) -> Dict[str, str]:
+    """S3 key -> local path for the configured artifacts."""
+    return {key: dst for key, dst in ((FAISS_KEY, faiss_path), (DB_KEY, db_path)) if key}
+
+
+def make_client():
+    import boto3
+
+    kwargs = {"endpoint_url": S3_ENDPOINT_URL} if S3_ENDPOINT_URL else {}
+    return boto3.client("s3", **kwargs)
+
+
+def sha256_file(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _part_ranges(size: int, part_size: int) -> List[Tuple[int, int, int]]:
+    return [(i, start, min(start + part_size, size) - 1)
+            for i, start in enumerate(range(0, size, part_size))]
+
+
+def _read_json(path: str) -> Dict[str, Any]:
+    try:
+        with open(path, encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_atomic(path: str, text: str) -> None:
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        fh.write(text)
+    os.replace(tmp, path)
+
+
+@contextmanager
+def _dir_lock(directory: str) -> Iterator[None]:
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, ".artifacts.lock"), "w") as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def download_file(client, bucket: str, key: str, dst: str, pool: ThreadPoolExecutor,
+                  expected: Optional[Dict[str, Any]] = None,
+                  part_size: int = ARTIFACT_PART_MB * 1024 * 1024) -> Dict[str, Any]:
+    t0 = time.perf_counter()
+    head = client.head_object(Bucket=bucket, Key=key)
+    etag, size = head["ETag"], int(head["ContentLength"])
+    etag_path = f"{dst}.etag"
+    result = {"key": key, "path": dst, "etag": etag, "bytes": size}
+
+    try:
+        on_disk = open(etag_path, encoding="utf-8").read().strip()
+    except OSError:
+        on_disk = ""
+    if on_disk == etag and os.path.exists(dst) and os.path.getsize(dst) == size:
+        return {**result, "status": "cached", "sec": round(time.perf_counter() - t0, 3)}
+
+    tmp, state_path = f"{dst}.download", f"{dst}.download.json"
+    state = _read_json(state_path)
+    done = set()
+    if state.get("etag") == etag and os.path.exists(tmp) and os.path.getsize(tmp) == size:
+        done = set(state.get("parts") or [])
+    else:
+        os.makedirs(os.path.dirname(dst) or ".", exist_ok=True)
+        with open(tmp, "wb") as fh:
+            fh.truncate(size)
+    resumed = len(done)
+
+    lock = threading.Lock()
+    fd = os.open(tmp, os.O_RDWR)
+
+    def fetch(part: int, start: int, end: int) -> None:
+        body = client.get_object(
+            Bucket=bucket, Key=key, Range=f"bytes={start}-{end}", IfMatch=etag,
+        )["Body"].read()
+        if len(body) != end - start + 1:
+            raise ArtifactError(f"{key}: short read for bytes {start}-{end}")
+        os.pwrite(fd, body, start)
+        with lock:
+            done.add(part)
+            _write_atomic(state_path, json.dumps({"etag": etag, "parts": sorted(done)}))
+
+    try:
+        futures = [
+            pool.submit(fetch, *r) for r in _part_ranges(size, part_size) if r[0] not in done
+        ]
+        # Let every part finish (or fail) before the fd closes; finished parts are kept for resume
+        wait(futures)
+        for f in futures:
+            f.result()
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+    if expected:
+        digest = sha256_file(tmp)
+        if int(expected.get("size", size)) != size or expected.get("sha256", digest) != digest:
+            os.remove(tmp)
+            os.remove(state_path)
+            raise ArtifactError(f"{key}: checksum mismatch (sha256 {digest})")
+        result["sha256"] = digest
+
+    os.replace(tmp, dst)
+    _write_atomic(etag_path, etag)
+    try:
+        os.remove(state_path)
+    except OSError:
+        pass
+    return {**result, "status": "downloaded", "resumed_parts": resumed,
+            "sec": round(time.perf_counter() - t0, 3)}
+
+
+def download_artifacts(files: Dict[str, str], client=None, bucket: str = DATA_BUCKET,
+                       manifest_key: str = ARTIFACT_MANIFEST_KEY,
+                       max_workers: int = ARTIFACT_MAX_WORKERS,
+                       part_size: int = ARTIFACT_PART_MB * 1024 * 1024,
+                       on_done: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+                       ) -> Dict[str, Dict[str, Any]]:
+    """
+    Download every `key -> local path` in parallel; per-key result (never raises).
+    `on_done(key, result)` fires as each file lands, so e.g. SQLite can come up
+    while the index is still downloading.
+    """
+    if not files:
+        return {}
+    manifest: Dict[str, Any] = {}
+    try:
+        client = client or make_client()
+        if manifest_key:
+            body = client.get_object(Bucket=bucket, Key=manifest_key)["Body"]
+            manifest = json.loads(body.read())
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        return {key: {"key": key, "path": dst, "status": "error", "error": error}
+                for key, dst in files.items()}
+
+    results: Dict[str, Dict[str, Any]] = {}
+    lock_dir = os.path.dirname(next(iter(files.values()))) or "."
+    with _dir_lock(lock_dir), \
+            ThreadPoolExecutor(max_workers=max(1, max_workers),
+                               thread_name_prefix="artifact-part") as parts, \
+            ThreadPoolExecutor(max_workers=len(files), thread_name_prefix="artifact") as per_file:
+        futures = {
+            key: per_file.submit(download_file, client, bucket, key, dst, parts,
+                                 manifest.get(key), part_size)
+            for key, dst in files.items()
+        }
+        keys = {future: key for key, future in futures.items()}
+        for future in as_completed(keys):
+            key = keys[future]
+            try:
+                results[key] = future.result()
+            except Exception as e:
+                results[key] = {"key": key, "path": files[key], "status": "error",
+                                "error": f"{type(e).__name__}: {e}"}
+            if on_done is not None:
+                on_done(key, results[key])
+    return results
+
+
+def build_manifest(pairs: List[str]) -> Dict[str, Dict[str, Any]]:
+    """`local_path=key` pairs -> manifest entries."""
+    out = {}
+    for pair in pairs:
+        path, _, key = pair.partition("=")
+        out[key or os.path.basename(path)] = {
+            "sha256": sha256_file(path), "size": os.path.getsize(path)
+        }
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Download artifacts or build their checksum manifest")
+    ap.add_argument("--manifest", nargs="+", metavar="PATH=KEY",
+                    help="print a checksum manifest for these local files")
+    ap.add_argument("--faiss", default=os.getenv("FAISS_LOCAL_PATH", "/app/data/pci_index.faiss"))
+    ap.add_argument("--db", default=os.getenv("DB_LOCAL_PATH", "/app/data/pci_requirements.db"))
+    args = ap.parse_args()
+    if args.manifest:
+        print(json.dumps(build_manifest(args.manifest), indent=2))
+        return
+    print(json.dumps(download_artifacts(artifact_files(args.faiss, args.db)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
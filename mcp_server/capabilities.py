@@ -0,0 +1,75 @@
+# mcp_server/capabilities.py
+"""
+Per-capability readiness (sqlite, vector_index, embedder, llm).
+
+Warmup moves each capability from pending -> loading -> ready (or unavailable)
+as it brings it up, so requests that only need what is already up are served
+while the rest is still loading:
+
+- the readiness gate holds /ask and /ask_full only until the LLM is checked,
+- tools declare `needs` in tools/manifest.json and are refused (503) while one
+  of them is still loading,
+- search falls back to the SQLite lexical path while the vector index or the
+  embedder is loading or unavailable.
+
+"unavailable" never blocks: handlers degrade or report the error as before.
+Outside the server (scripts, tests) nothing is tracked and nothing is gated.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Dict, Iterable, List
+
+PENDING = "pending"
+LOADING = "loading"
+READY = "ready"
+UNAVAILABLE = "unavailable"
+
+CAPABILITIES = ("sqlite", "vector_index", "embedder", "llm")
+
+
+class Capabilities:
+    def __init__(self, names: Iterable[str] = CAPABILITIES):
+        self._lock = threading.Lock()
+        self._state: Dict[str, Dict[str, Any]] = {
+            n: {"state": PENDING, "since": time.time()} for n in names
+        }
+        self.tracking = False
+
+    def track(self) -> None:
+        """Start gating on capability state (called when the server's warmup starts)."""
+        self.tracking = True
+
+    def set(self, name: str, state: str, **detail: Any) -> None:
+        with self._lock:
+            self._state[name] = {"state": state, "since": time.time(), **detail}
+
+    def state(self, name: str) -> str:
+        return self._state.get(name, {}).get("state", PENDING)
+
+    def ready(self, name: str) -> bool:
+        return self.state(name) == READY
+
+    def usable(self, name: str) -> bool:
+        """Worth trying now: not known to be loading or broken."""
+        return self.state(name) not in (LOADING, UNAVAILABLE)
+
+    def waiting_for(self, names: Iterable[str]) -> List[str]:
+        """Capabilities in `names` that are not up yet (empty when not tracking)."""
+        if not self.tracking:
+            return []
+        return [n for n in names if self.state(n) in (PENDING, LOADING)]
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            now = time.time()
+            return {
+                n: {**{k: v for k, v in s.items() if k != "since"},
+                    "for_sec": round(now - s["since"], 1)}
+                for n, s in self._state.items()
+            }
+
+
+capabilities = Capabilities()
@@ -0,0 +1,95 @@
+# mcp_server/coalesce.py
+"""
+Opt-in coalescing of token events on the NDJSON stream.
+
+Consecutive token events of the same segment are merged into one event and
+flushed when the time window closes or the text reaches the byte threshold.
+Any other event (stage, info, error) flushes pending text first and goes out
+immediately, so ordering is unchanged. Everything ready at the same moment is
+written as a single chunk.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+# 0 disables coalescing (one event per LLM token, as before)
+STREAM_COALESCE_MS = int(os.getenv("STREAM_COALESCE_MS", "0"))
+STREAM_COALESCE_BYTES = int(os.getenv("STREAM_COALESCE_BYTES", "512"))
+
+
+class TokenCoalescer:
+    def __init__(self, window_ms: int = STREAM_COALESCE_MS,
+                 max_bytes: int = STREAM_COALESCE_BYTES):
+        self.window = max(0, window_ms) / 1000.0
+        self.max_bytes = max(1, max_bytes)
+        self._pending: Optional[Dict[str, Any]] = None
+        self._pending_bytes = 0
+        self._flush_at = 0.0
+
+    def time_to_flush(self) -> Optional[float]:
+        """Seconds until pending text must go out; None when nothing is pending."""
+        if self._pending is None:
+            return None
+        return max(0.0, self._flush_at - time.monotonic())
+
+    def add(self, event: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Returns the events to write now (possibly none)."""
+        if event.get("type") != "token":
+            return self.flush() + [event]
+
+        out: List[Dict[str, Any]] = []
+        if self._pending is not None and self._pending.get("segment") != event.get("segment"):
+            out = self.flush()
+        if self._pending is None:
+            self._pending = dict(event)
+            self._pending_bytes = 0
+            self._flush_at = time.monotonic() + self.window
+        else:
+            self._pending["text"] += event.get("text", "")
+        self._pending_bytes += len(event.get("text", "").encode("utf-8"))
+        if self._pending_bytes >= self.max_bytes or self.window == 0:
+            out += self.flush()
+        return out
+
+    def flush(self) -> List[Dict[str, Any]]:
+        if self._pending is None:
+            return []
+        event, self._pending = self._pending, None
+        return [event]
+
+
+class StreamStats:
+    """Write accounting for streamed responses (process totals + per response)."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.responses = 0
+        self.events = 0
+        self.writes = 0
+        self.bytes = 0
+
+    def record(self, events: int, writes: int, nbytes: int) -> None:
+        with self._lock:
+            self.responses += 1
+            self.events += events
+            self.writes += writes
+            self.bytes += nbytes
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            n = self.responses or 1
+            return {
+                "responses": self.responses,
+                "events": self.events,
+                "writes": self.writes,
+                "bytes": self.bytes,
+                "writes_per_response": round(self.writes / n, 1),
+                "bytes_per_response": round(self.bytes / n, 1),
+            }
+
+
+stream_stats = StreamStats()
@@ -0,0 +1,72 @@
+# mcp_server/deadline.py
+"""
+Per-request time budget shared by the pipeline stages.
+
+A request gets one deadline (AskRequest.deadline_sec, the X-Deadline-Sec header,
+or ASK_DEADLINE_SEC). Planning and tools get a share of what is left when they
+start, so time a stage does not use rolls forward to the next one; composition
+gets the remainder, or is skipped when less than MIN_COMPOSE_SEC is left.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from typing import AsyncIterator, Optional, TypeVar
+
+T = TypeVar("T")
+
+ASK_DEADLINE_SEC = float(os.getenv("ASK_DEADLINE_SEC", "60"))
+MAX_DEADLINE_SEC = float(os.getenv("MAX_DEADLINE_SEC", "300"))
+# Stage weights; a stage gets weight / (its weight + later weights) of the remaining time
+PLAN_BUDGET_WEIGHT = float(os.getenv("PLAN_BUDGET_WEIGHT", "0.3"))
+TOOLS_BUDGET_WEIGHT = float(os.getenv("TOOLS_BUDGET_WEIGHT", "0.2"))
+COMPOSE_BUDGET_WEIGHT = float(os.getenv("COMPOSE_BUDGET_WEIGHT", "0.5"))
+# Below this, the composer is skipped and the user gets the materials only
+MIN_COMPOSE_SEC = float(os.getenv("MIN_COMPOSE_SEC", "3"))
+
+_LATER = {
+    "plan": PLAN_BUDGET_WEIGHT + TOOLS_BUDGET_WEIGHT + COMPOSE_BUDGET_WEIGHT,
+    "tools": TOOLS_BUDGET_WEIGHT + COMPOSE_BUDGET_WEIGHT,
+    "compose": COMPOSE_BUDGET_WEIGHT,
+}
+_WEIGHT = {
+    "plan": PLAN_BUDGET_WEIGHT,
+    "tools": TOOLS_BUDGET_WEIGHT,
+    "compose": COMPOSE_BUDGET_WEIGHT,
+}
+
+
+class Deadline:
+    def __init__(self, seconds: Optional[float] = None):
+        if seconds is None or seconds <= 0:
+            seconds = ASK_DEADLINE_SEC
+        self.total = min(float(seconds), MAX_DEADLINE_SEC)
+        self.started = time.monotonic()
+        self.expires_at = self.started + self.total
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def stage_budget(self, stage: str) -> float:
+        """Seconds the stage may use, given what is left now."""
+        later = _LATER.get(stage) or 1.0
+        return self.remaining() * (_WEIGHT.get(stage, later) / later)
+
+
+async def iter_until(stream: AsyncIterator[T], timeout: float) -> AsyncIterator[T]:
+    """Yield from `stream`, raising TimeoutError once `timeout` seconds have passed."""
+    stop_at = time.monotonic() + timeout
+    while True:
+        left = stop_at - time.monotonic()
+        if left <= 0:
+            raise TimeoutError
+        try:
+            item = await asyncio.wait_for(stream.__anext__(), timeout=left)
+        except StopAsyncIteration:
+            return
+        yield item
@@ -0,0 +1,532 @@
+# mcp_server/jobs.py
+"""
+Bulk question answering for offline evaluation.
+
+A job is a JSONL file of questions, one object per line:
+
+    {"id": "q1", "question": "What does 3.4.1 require?", "expected": "..."}
+
+(`message` is accepted for `question`; `id` defaults to the line number; other
+fields are copied into the result.) Each question runs through
+`run_full_pipeline` in-process, JOB_CONCURRENCY at a time, so the plan cache,
+answer cache, retriever and LLM scheduler are shared with live traffic and
+across questions. One result line per question is appended to the job's
+results.jsonl with the answer, materials, errors and per-stage timings.
+
+Results are the checkpoint: a job interrupted by a restart resumes on startup
+(or via POST /jobs/{id}/resume) and only runs the questions without a result.
+A per-job lock file keeps server workers that all resume on startup from
+running the same job twice.
+
+    POST /jobs?concurrency=2&deadline_sec=60   body: JSONL  -> 202 {job}
+    GET  /jobs                                  -> [{job}, ...]
+    GET  /jobs/{id}                             -> {job} with progress
+    GET  /jobs/{id}/results?offset=0&follow=1   -> NDJSON (follow tails until done)
+    POST /jobs/{id}/cancel | /jobs/{id}/resume
+
+The same runner works without a server:
+
+    python -m mcp_server.jobs questions.jsonl --out results.jsonl
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from mcp_server.capabilities import capabilities
+from mcp_server.deadline import Deadline
+
+logger = logging.getLogger(__name__)
+jobs_router = APIRouter()
+
+JOBS_DIR = os.getenv("JOBS_DIR", os.path.join(os.getenv("DATA_DIR", "/app/data"), "jobs"))
+# Questions in flight per job; the LLM scheduler still bounds generations overall
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", "2"))
+JOB_MAX_QUESTIONS = int(os.getenv("JOB_MAX_QUESTIONS", "20000"))
+JOBS_RESUME_ON_START = os.getenv("JOBS_RESUME_ON_START", "true").lower() in ("1", "true", "yes")
+# How often a followed results stream checks for new lines
+JOB_FOLLOW_POLL_SEC = float(os.getenv("JOB_FOLLOW_POLL_SEC", "0.5"))
+
+QUEUED, RUNNING, DONE, CANCELLED, FAILED = "queued", "running", "done", "cancelled", "failed"
+
+Pipeline = Callable[[str, Deadline], AsyncIterator[Dict[str, Any]]]
+
+
+# ---------------- Questions and results files ----------------
+
+def parse_questions(lines: Iterable[str]) -> List[Dict[str, Any]]:
+    """JSONL lines -> [{"id", "question", ...extra}]; ValueError names the bad line."""
+    questions: List[Dict[str, Any]] = []
+    seen = set()
+    for lineno, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError as e:
+            raise ValueError(f"line {lineno}: invalid JSON ({e})") from e
+        if isinstance(item, str):
+            item = {"question": item}
+        if not isinstance(item, dict):
+            raise ValueError(f"line {lineno}: expected an object or a string")
+        question = item.pop("question", None) or item.pop("message", None)
+        if not isinstance(question, str) or not question.strip():
+            raise ValueError(f"line {lineno}: missing 'question'")
+        qid = str(item.pop("id", lineno))
+        if qid in seen:
+            raise ValueError(f"line {lineno}: duplicate id {qid!r}")
+        seen.add(qid)
+        questions.append({"id": qid, "question": question, **item})
+    return questions
+
+
+def _parse_records(data: bytes) -> List[Dict[str, Any]]:
+    records = []
+    for line in data.decode("utf-8").splitlines():
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            continue
+    return records
+
+
+def read_new_results(path: str, pos: int = 0) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Complete records after byte `pos`, and the offset just past the last
+    complete line. A line still being appended (no newline yet) is left for
+    the next read; the file is never modified.
+    """
+    try:
+        with open(path, "rb") as fh:
+            fh.seek(pos)
+            data = fh.read()
+    except FileNotFoundError:
+        return [], pos
+    end = data.rfind(b"\n") + 1
+    return _parse_records(data[:end]), pos + end
+
+
+def read_results(path: str) -> List[Dict[str, Any]]:
+    """Result records on disk, without a torn or in-progress last line."""
+    return read_new_results(path)[0]
+
+
+def _cut_torn_tail(path: str) -> None:
+    """Before appending again: drop a last line torn by a crash mid-write."""
+    try:
+        with open(path, "r+b") as fh:
+            data = fh.read()
+            if data and not data.endswith(b"\n"):
+                fh.truncate(data.rfind(b"\n") + 1)
+    except FileNotFoundError:
+        pass
+
+
+@contextmanager
+def _job_lock(job_dir: str) -> Iterator[bool]:
+    """
+    Non-blocking per-job flock: True while this process owns the job. Server
+    workers that all resume on startup then run each job exactly once.
+    """
+    os.makedirs(job_dir, exist_ok=True)
+    with open(os.path.join(job_dir, ".job.lock"), "w") as fh:
+        try:
+            fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+# ---------------- One question ----------------
+
+async def answer_question(question: Dict[str, Any], deadline_sec: Optional[float] = None,
+                          pipeline: Optional[Pipeline] = None) -> Dict[str, Any]:
+    """
+    Run one question and fold its event stream into a result record. Stage
+    timings come from when the pipeline's stage events arrive: plan (until
+    Routing, or Answer for smalltalk), tools (Tools -> Answer), compose TTFT
+    and compose (Answer -> end).
+    """
+    if pipeline is None:
+        from mcp_server.pipeline import run_full_pipeline as pipeline
+
+    extra = {k: v for k, v in question.items() if k not in ("id", "question")}
+    answer: List[str] = []
+    materials: List[str] = []
+    errors: List[Dict[str, Any]] = []
+    marks: Dict[str, float] = {}
+    plan_cache_hit = answer_cache_hit = degraded = False
+
+    t0 = time.perf_counter()
+    try:
+        async for ev in pipeline(question["question"], Deadline(deadline_sec)):
+            now = time.perf_counter() - t0
+            marks.setdefault("first_event", now)
+            kind = ev.get("type")
+            if kind == "stage":
+                marks.setdefault(str(ev.get("label", "")).lower(), now)
+            elif kind == "token":
+                if ev.get("segment") == "answer":
+                    marks.setdefault("first_token", now)
+                    answer.append(ev.get("text", ""))
+                else:
+                    materials.append(ev.get("text", ""))
+            elif kind == "error":
+                errors.append({"stage": ev.get("stage"), "message": ev.get("message")})
+            elif kind == "info":
+                degraded = degraded or bool(ev.get("degraded"))
+                plan_cache_hit = plan_cache_hit or bool((ev.get("plan_cache") or {}).get("hit"))
+                hit = bool((ev.get("answer_cache") or {}).get("hit"))
+                answer_cache_hit = answer_cache_hit or hit
+    except Exception as e:
+        logger.exception("Job question %s failed", question["id"])
+        errors.append({"stage": "pipeline", "message": f"{type(e).__name__}: {e}"})
+    total = time.perf_counter() - t0
+
+    timings: Dict[str, float] = {"total_sec": total}
+    if "first_event" in marks:
+        timings["first_event_sec"] = marks["first_event"]
+    plan_end = marks.get("routing", marks.get("answer"))
+    if plan_end is not None:
+        timings["plan_sec"] = plan_end
+    if "tools" in marks:
+        timings["tools_sec"] = marks.get("answer", total) - marks["tools"]
+    if "answer" in marks:
+        timings["compose_sec"] = total - marks["answer"]
+        if "first_token" in marks:
+            timings["compose_ttft_sec"] = marks["first_token"] - marks["answer"]
+
+    return {
+        **extra,
+        "id": question["id"],
+        "question": question["question"],
+        "status": "error" if errors else "degraded" if degraded else "ok",
+        "answer": "".join(answer),
+        "materials": "".join(materials),
+        "errors": errors,
+        "plan_cache_hit": plan_cache_hit,
+        "answer_cache_hit": answer_cache_hit,
+        "timings": {k: round(v, 4) for k, v in timings.items()},
+    }
+
+
+# ---------------- Many questions ----------------
+
+async def run_questions(questions: List[Dict[str, Any]], out_path: str,
+                        concurrency: int = JOB_CONCURRENCY,
+                        deadline_sec: Optional[float] = None,
+                        pipeline: Optional[Pipeline] = None,
+                        on_record: Optional[Callable[[Dict[str, Any]], None]] = None,
+                        ) -> Dict[str, Any]:
+    """
+    Answer every question without a record in `out_path` yet, appending one
+    JSON line per question as it finishes (completion order).
+    """
+    _cut_torn_tail(out_path)
+    done = {str(r.get("id")) for r in read_results(out_path)}
+    pending = [q for q in questions if q["id"] not in done]
+    queue: asyncio.Queue = asyncio.Queue()
+    for q in pending:
+        queue.put_nowait(q)
+
+    t0 = time.perf_counter()
+    counts = {"ok": 0, "degraded": 0, "error": 0}
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    with open(out_path, "a", encoding="utf-8") as out:
+
+        async def worker() -> None:
+            while True:
+                try:
+                    q = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                record = await answer_question(q, deadline_sec, pipeline)
+                # One write per record, flushed, so a crash loses at most the torn last line
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                counts[record["status"]] = counts.get(record["status"], 0) + 1
+                if on_record is not None:
+                    on_record(record)
+
+        n_workers = max(1, min(concurrency, len(pending)))
+        workers = [asyncio.create_task(worker()) for _ in range(n_workers)]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for w in workers:
+                w.cancel()
+
+    return {
+        "questions": len(questions),
+        "skipped": len(questions) - len(pending),
+        "answered": sum(counts.values()),
+        **counts,
+        "elapsed_sec": round(time.perf_counter() - t0, 3),
+    }
+
+
+# ---------------- Jobs ----------------
+
+def _write_json(path: str, data: Dict[str, Any]) -> None:
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(data, fh, indent=2)
+    os.replace(tmp, path)
+
+
+class Job:
+    def __init__(self, root: str, job_id: str, meta: Dict[str, Any]):
+        self.id = job_id
+        self.dir = os.path.join(root, job_id)
+        self.meta = meta
+        self.task: Optional[asyncio.Task] = None
+        self.cancel_requested = False
+        self.counts = {"ok": 0, "degraded": 0, "error": 0}
+        self.stage_sum: Dict[str, float] = {}
+
+    @property
+    def questions_path(self) -> str:
+        return os.path.join(self.dir, "questions.jsonl")
+
+    @property
+    def results_path(self) -> str:
+        return os.path.join(self.dir, "results.jsonl")
+
+    def save(self) -> None:
+        _write_json(os.path.join(self.dir, "job.json"), self.meta)
+
+    def count(self, record: Dict[str, Any]) -> None:
+        status = str(record.get("status"))
+        self.counts[status] = self.counts.get(status, 0) + 1
+        for stage, sec in (record.get("timings") or {}).items():
+            self.stage_sum[stage] = self.stage_sum.get(stage, 0.0) + sec
+
+    def snapshot(self) -> Dict[str, Any]:
+        answered = sum(self.counts.values())
+        out = {**self.meta, "answered": answered, **self.counts}
+        if answered:
+            out["mean_timings"] = {k: round(v / answered, 4) for k, v in self.stage_sum.items()}
+        started, finished = self.meta.get("started_at"), self.meta.get("finished_at")
+        if started:
+            out["elapsed_sec"] = round((finished or time.time()) - started, 1)
+        return out
+
+
+class JobManager:
+    def __init__(self, root: str = JOBS_DIR, pipeline: Optional[Pipeline] = None):
+        self.root = root
+        self.pipeline = pipeline
+        self.jobs: Dict[str, Job] = {}
+
+    def load(self) -> None:
+        """Pick up jobs from disk (after a restart), recounting their results."""
+        if not os.path.isdir(self.root):
+            return
+        for job_id in sorted(os.listdir(self.root)):
+            if job_id in self.jobs:
+                continue
+            try:
+                with open(os.path.join(self.root, job_id, "job.json"), encoding="utf-8") as fh:
+                    meta = json.load(fh)
+            except (OSError, ValueError):
+                continue
+            job = Job(self.root, job_id, meta)
+            for record in read_results(job.results_path):
+                job.count(record)
+            self.jobs[job_id] = job
+
+    def submit(self, text: str, concurrency: Optional[int] = None,
+               deadline_sec: Optional[float] = None) -> Job:
+        questions = parse_questions(text.splitlines())
+        if not questions:
+            raise ValueError("no questions")
+        if len(questions) > JOB_MAX_QUESTIONS:
+            raise OverflowError(
+                f"At most {JOB_MAX_QUESTIONS} questions per job (got {len(questions)})"
+            )
+        job_id = uuid.uuid4().hex[:12]
+        job = Job(self.root, job_id, {
+            "id": job_id,
+            "status": QUEUED,
+            "total": len(questions),
+            "concurrency": max(1, concurrency or JOB_CONCURRENCY),
+            "deadline_sec": deadline_sec,
+            "created_at": time.time(),
+        })
+        os.makedirs(job.dir, exist_ok=True)
+        with open(job.questions_path, "w", encoding="utf-8") as fh:
+            fh.writelines(json.dumps(q, ensure_ascii=False) + "\n" for q in questions)
+        job.save()
+        self.jobs[job_id] = job
+        self.start(job)
+        return job
+
+    def start(self, job: Job) -> None:
+        if job.task is None or job.task.done():
+            job.cancel_requested = False
+            job.task = asyncio.create_task(self._run(job))
+
+    def resume_all(self) -> List[str]:
+        """Restart jobs that were queued or running when the process stopped."""
+        self.load()
+        resumed = [j.id for j in self.jobs.values() if j.meta.get("status") in (QUEUED, RUNNING)]
+        for job_id in resumed:
+            self.start(self.jobs[job_id])
+        return resumed
+
+    def cancel(self, job: Job) -> None:
+        job.cancel_requested = True
+        if job.task is not None and not job.task.done():
+            job.task.cancel()
+        elif job.meta.get("status") in (QUEUED, RUNNING):
+            job.meta["status"] = CANCELLED
+            job.save()
+
+    async def _run(self, job: Job) -> None:
+        with _job_lock(job.dir) as owned:
+            if not owned:
+                logger.info("Job %s is running in another process; not starting it here", job.id)
+                return
+            await self._run_locked(job)
+
+    async def _run_locked(self, job: Job) -> None:
+        job.meta.update(status=RUNNING, finished_at=None)
+        job.meta.setdefault("started_at", time.time())
+        job.save()
+        try:
+            # Resumed at startup: wait for the LLM check instead of failing every question
+            while capabilities.waiting_for(("llm",)):
+                await asyncio.sleep(1)
+            with open(job.questions_path, encoding="utf-8") as fh:
+                questions = [json.loads(line) for line in fh if line.strip()]
+            summary = await run_questions(
+                questions, job.results_path,
+                concurrency=job.meta["concurrency"],
+                deadline_sec=job.meta.get("deadline_sec"),
+                pipeline=self.pipeline,
+                on_record=job.count,
+            )
+            job.meta.update(status=DONE, last_run=summary)
+        except asyncio.CancelledError:
+            # Server shutdown leaves the job "running" so the next start resumes it
+            if job.cancel_requested:
+                job.meta["status"] = CANCELLED
+            raise
+        except Exception as e:
+            logger.exception("Job %s failed", job.id)
+            job.meta.update(status=FAILED, error=f"{type(e).__name__}: {e}")
+        finally:
+            job.meta["finished_at"] = time.time()
+            job.save()
+
+
+job_manager = JobManager()
+
+
+# ---------------- HTTP routes ----------------
+
+def _not_found(job_id: str) -> JSONResponse:
+    return JSONResponse(status_code=404, content={"detail": f"No job {job_id!r}"})
+
+
+@jobs_router.post("/jobs", status_code=202)
+async def submit_job(request: Request, concurrency: Optional[int] = None,
+                     deadline_sec: Optional[float] = None):
+    text = (await request.body()).decode("utf-8", errors="replace")
+    try:
+        job = job_manager.submit(text, concurrency, deadline_sec)
+    except OverflowError as e:
+        return JSONResponse(status_code=413, content={"detail": str(e)})
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"detail": f"Bad questions file: {e}"})
+    return job.snapshot()
+
+
+@jobs_router.get("/jobs")
+def list_jobs():
+    job_manager.load()
+    return [job.snapshot() for job in job_manager.jobs.values()]
+
+
+@jobs_router.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    job = job_manager.jobs.get(job_id)
+    return job.snapshot() if job else _not_found(job_id)
+
+
+@jobs_router.get("/jobs/{job_id}/results")
+async def job_results(job_id: str, offset: int = 0, follow: bool = False):
+    """Result lines from `offset`; with `follow`, keep streaming until the job stops."""
+    job = job_manager.jobs.get(job_id)
+    if job is None:
+        return _not_found(job_id)
+
+    async def lines() -> AsyncIterator[str]:
+        pos = seen = 0
+        while True:
+            running = job.task is not None and not job.task.done()
+            # Only the bytes appended since the last poll, off the event loop
+            records, pos = await asyncio.to_thread(read_new_results, job.results_path, pos)
+            for record in records:
+                if seen >= offset:
+                    yield json.dumps(record, ensure_ascii=False) + "\n"
+                seen += 1
+            if not (follow and running):
+                return
+            await asyncio.sleep(JOB_FOLLOW_POLL_SEC)
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@jobs_router.post("/jobs/{job_id}/cancel")
+def cancel_job(job_id: str):
+    job = job_manager.jobs.get(job_id)
+    if job is None:
+        return _not_found(job_id)
+    job_manager.cancel(job)
+    return job.snapshot()
+
+
+@jobs_router.post("/jobs/{job_id}/resume", status_code=202)
+async def resume_job(job_id: str):
+    job = job_manager.jobs.get(job_id)
+    if job is None:
+        return _not_found(job_id)
+    job_manager.start(job)
+    return job.snapshot()
+
+
+# ---------------- CLI ----------------
+
+def main():
+    ap = argparse.ArgumentParser(description="Answer a JSONL file of questions (resumable)")
+    ap.add_argument("questions", help="JSONL: {\"id\", \"question\", ...} per line")
+    ap.add_argument("--out", required=True, help="results JSONL; existing ids are skipped")
+    ap.add_argument("--concurrency", type=int, default=JOB_CONCURRENCY)
+    ap.add_argument("--deadline-sec", type=float, default=None)
+    args = ap.parse_args()
+    with open(args.questions, encoding="utf-8") as fh:
+        questions = parse_questions(fh)
+    summary = asyncio.run(run_questions(questions, args.out, args.concurrency, args.deadline_sec))
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,24 @@
 
+import asyncio
 import os
 import threading
 import time
+import uuid
 from contextlib import asynccontextmanager
 from typing import List, Callable
 
 from fastapi import FastAPI, Request, status
 from fastapi.middleware.cors import CORSMiddleware
-from starlette.responses import JSONResponse
+from starlette.responses import JSONResponse, Response
 
+from mcp_server import artifacts
+from mcp_server.capabilities import LOADING, capabilities
+from mcp_server.jobs import JOBS_RESUME_ON_START, job_manager, jobs_router
+from mcp_server.pipeline import prime_prompt_prefixes
 from mcp_server.router import router as ask_router
 from mcp_server.tool_dispatcher import tool_router
+from mcp_server.warmup import EARLY_STEPS, run_warmup, warmup_report
+from telemetry import metrics, tracing
 
 # ------------ Config ------------
 PORT = int(os.getenv("PORT", "8080"))
@@ -25,6 +33,9 @@ REQUIRE_FILES = [FAISS_FILE, DB_FILE]
 # If true, we won't block readiness on files; only log a warning
 READINESS_SOFT = os.getenv("READINESS_SOFT", "false").lower() in ("1", "true", "yes")
 
+# Evaluate the static prompt prefixes once at startup so Ollama caches them
+LLM_PRIME_PREFIXES = os.getenv("LLM_PRIME_PREFIXES", "true").lower() in ("1", "true", "yes")
+
 # ------------ App init ------------
 app = FastAPI(title="PCI Compliance Agent")
 
@@ -57,27 +68,57 @@ def healthz():
 
 @app.get("/readyz")
 def readyz():
-    """Readiness: heavy dependencies available / warmed."""
+    """
+    Readiness: warmup finished. Capabilities come up one by one before that
+    (requests needing only those are already served); both are reported here.
+    """
+    body = {
+        "ready": _ready.is_set(),
+        "capabilities": capabilities.snapshot(),
+        "warmup": warmup_report.snapshot(),
+    }
     if _ready.is_set():
-        return {"ready": True}
-    return JSONResponse({"ready": False}, status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
+        return body
+    return JSONResponse(body, status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Prometheus scrape endpoint (text exposition format)."""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+# ------------ Gate routes until their capabilities are up ------------
+ALWAYS_OK_PATHS = {"/", "/healthz", "/readyz", "/metrics", "/docs", "/openapi.json"}
 
-# ------------ Gate routes until ready ------------
-ALWAYS_OK_PATHS = {"/", "/healthz", "/readyz", "/docs", "/openapi.json"}
+# Routes that can't do anything useful without these; tools declare their own
+# `needs` in tools/manifest.json and are checked by the dispatcher.
+ROUTE_CAPABILITIES = {
+    "/ask": ("llm",),
+    "/ask_full": ("llm",),
+}
 
 @app.middleware("http")
 async def readiness_gate(request: Request, call_next: Callable):
     path = request.url.path
     if path in ALWAYS_OK_PATHS or path.startswith("/static/"):
         return await call_next(request)
-    if not _ready.is_set():
+    waiting = capabilities.waiting_for(ROUTE_CAPABILITIES.get(path, ()))
+    if waiting:
         return JSONResponse(
-            {"detail": "Service warming up. Try again shortly."},
+            {"detail": "Service warming up. Try again shortly.", "waiting_for": waiting},
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             headers={"Retry-After": "10"},
         )
     return await call_next(request)
 
+@app.middleware("http")
+async def request_id_middleware(request: Request, call_next: Callable):
+    """Request id for logs/traces: taken from X-Request-ID or generated, echoed back."""
+    request_id = request.headers.get("x-request-id") or uuid.uuid4().hex
+    tracing.set_request_id(request_id)
+    response = await call_next(request)
+    response.headers["X-Request-ID"] = request_id
+    return response
+
 # ------------ Root ------------
 @app.get("/")
 def root():
@@ -86,6 +127,7 @@ def root():
 # ------------ Include routers ------------
 app.include_router(ask_router)
 app.include_router(tool_router)
+app.include_router(jobs_router)
 
 # ------------ Background warmup ------------
 def _log(msg: str):
@@ -94,10 +136,33 @@ def _log(msg: str):
 def check_files(paths: list[str]) -> bool:
     return all(os.path.exists(p) for p in paths if p)
 
+def _warm_sqlite_early():
+    """SQLite is enough for `get`, hierarchy expansion and lexical search: bring it up first."""
+    if os.path.exists(DB_FILE) and not warmup_report.ok("sqlite"):
+        run_warmup(log=_log, only=("sqlite",))
+
+def _download_artifacts():
+    """Fetch artifacts from S3 in this thread; the result goes straight into the warmup report."""
+    t0 = time.perf_counter()
+
+    def on_done(key: str, result: dict):
+        _log(f"artifact {key}: {result.get('status')} {result.get('error') or ''}".rstrip())
+        if result.get("path") == DB_FILE and result.get("status") != "error":
+            _warm_sqlite_early()
+
+    results = artifacts.download_artifacts(
+        artifacts.artifact_files(FAISS_FILE, DB_FILE), on_done=on_done
+    )
+    failed = [k for k, r in results.items() if r.get("status") == "error"]
+    warmup_report.record("artifacts", "error" if failed else "ok", time.perf_counter() - t0,
+                         files=results)
+
 def do_warmup():
     """
-    Wait for artifacts from start.sh (which downloads S3 in background)
-    and perform any one-time lazy initializations that are safe in background.
+    Bring capabilities up as early as each allows: the LLM check and templates
+    right away, SQLite as soon as the DB is on disk, then the FAISS index and
+    embedder once the artifacts are downloaded (or appear). Marks the service
+    ready when everything has been tried (mcp_server/warmup.py).
     """
     start = time.time()
     deadline = start + int(os.getenv("READINESS_MAX_WAIT_SEC", "600"))  # 10m default
@@ -108,26 +173,61 @@ def do_warmup():
         _ready.set()
         return
 
-    # Poll for required files, but don't block forever.
-    while time.time() < deadline:
-        if check_files(REQUIRE_FILES):
-            _log(f"All required files present. (t+{int(time.time()-start)}s)")
-            break
-        missing = [p for p in REQUIRE_FILES if p and not os.path.exists(p)]
-        _log(f"Waiting for artifacts: missing={missing}")
-        time.sleep(2)
+    run_warmup(log=_log, only=EARLY_STEPS)
+    for cap in ("sqlite", "vector_index", "embedder"):
+        capabilities.set(cap, LOADING, reason="waiting for artifacts")
+
+    if artifacts.enabled():
+        _download_artifacts()
+    else:
+        # Files provided some other way (volume, init container): poll, but don't block forever.
+        while time.time() < deadline:
+            _warm_sqlite_early()
+            if check_files(REQUIRE_FILES):
+                _log(f"All required files present. (t+{int(time.time()-start)}s)")
+                break
+            missing = [p for p in REQUIRE_FILES if p and not os.path.exists(p)]
+            _log(f"Waiting for artifacts: missing={missing}")
+            time.sleep(2)
 
     if not check_files(REQUIRE_FILES):
         if READINESS_SOFT:
             _log("Missing artifacts but READINESS_SOFT=true. Marking ready anyway.")
         else:
-            _log("Required artifacts missing at deadline. Marking ready to avoid deploy block, "
-                 "but requests will still be gated by middleware until files appear.")
-    # Any additional non-blocking initializations can go here (e.g., touch caches)
+            _log("Required artifacts missing at deadline. Marking ready to avoid deploy block; "
+                 "capabilities that need them are reported unavailable.")
 
+    run_warmup(log=_log)
     _ready.set()
 
 @app.on_event("startup")
 def schedule_warmup():
+    capabilities.track()
     t = threading.Thread(target=do_warmup, name="warmup", daemon=True)
     t.start()
+
+async def _prime_prompts():
+    try:
+        timings = await prime_prompt_prefixes()
+    except Exception as e:
+        _log(f"Priming LLM prompt prefixes failed: {type(e).__name__}: {e}")
+        return
+    _log(f"Primed LLM prompt prefixes: {timings}")
+
+@app.on_event("startup")
+async def schedule_prompt_priming():
+    # Keep a reference: the loop holds tasks weakly, and shutdown must cancel it
+    app.state.prime_task = asyncio.create_task(_prime_prompts()) if LLM_PRIME_PREFIXES else None
+
+@app.on_event("shutdown")
+async def cancel_prompt_priming():
+    task = getattr(app.state, "prime_task", None)
+    if task is not None and not task.done():
+        task.cancel()
+
+@app.on_event("startup")
+async def resume_jobs():
+    if JOBS_RESUME_ON_START:
+        resumed = job_manager.resume_all()
+        if resumed:
+            _log(f"Resuming bulk jobs: {resumed}")
@@ -2,29 +2,44 @@
 
 from __future__ import annotations
 
-import json
-import re
-from typing import Any, Dict, List
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, List, Tuple
 
 from tools import get_tool_overview
-from agent.llm_wrapper import query_llm
-from agent.prompt_formatter import format_prompt
-from agent.tool_call_parser import extract_tool_call, normalize_actions
+from agent.llm_scheduler import PRIORITY_PLAN, LLMOverloaded
+from agent.llm_wrapper import prime_prefix, prompt_eval_stats, query_llm
+from agent.observation_encoder import encode_observations
+from agent.prompt_formatter import format_prompt, load_templates
+from agent.tool_call_parser import (
+    IncrementalPlanParser,
+    extract_tool_call,
+    normalize_actions,
+)
+from mcp_server.answer_cache import answer_cache
+from mcp_server.deadline import MIN_COMPOSE_SEC, Deadline, iter_until
+from mcp_server.pipeline_stats import cancellation_stats, speculation_stats
+from mcp_server.plan_actions import normalize_actions_list
+from mcp_server.plan_cache import plan_cache, render_plan_line
+from mcp_server.speculation import Speculation, guess_actions, probe_message
 from mcp_server.tool_dispatcher import handle_tool_call_async
-from retrieval.hierarchy import expand_requirement_ids, looks_like_parent
+from telemetry import tracing
+from telemetry.metrics import PIPELINE_REQUESTS, PIPELINE_STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
 
 # Safety limits so the follow-up prompt can't explode
 MAX_ACTIONS = 6
-MAX_PER_OBS_CHARS = 6000
-MAX_TOTAL_OBS_CHARS = 24000
-
+# Composer prompt budget for encoded observations. Real tokens only when PROMPT_TOKENIZER
+# names a locally available tokenizer; otherwise counts are a chars-per-piece estimate.
+OBS_TOKEN_BUDGET = int(os.getenv("OBS_TOKEN_BUDGET", "1500"))
+# Independent plan actions run concurrently, at most this many at a time
+MAX_TOOL_CONCURRENCY = int(os.getenv("MAX_TOOL_CONCURRENCY", "4"))
 
-def _truncate_for_prompt(s: str | None, limit: int) -> str:
-    if not s:
-        return ""
-    if len(s) <= limit:
-        return s
-    return s[: limit - 20] + "... [truncated]"
+# The plan is one DSL line; don't let the planner ramble for 2048 tokens
+PLAN_NUM_PREDICT = int(os.getenv("PLAN_NUM_PREDICT", "256"))
 
 
 def _format_tool_output(
@@ -41,7 +56,7 @@ def _format_tool_output(
         status = res.get("status")
         payload = res.get("result")
 
-        if tool_name == "search":
+        if tool_name in ("search", "related"):
             if isinstance(payload, list) and payload:
                 lines: List[str] = []
                 for item in payload[:10]:  # cap to 10 items
@@ -100,136 +115,155 @@ def _format_tool_output(
         return "Tool completed.\n"
 
 
-# ---- Normalization helpers ---------------------------------------------------
-
-_ID_REGEX = re.compile(r"\b\d+(?:\.\d+){0,3}\b")
-
-def _extract_pci_ids(s: str) -> List[str]:
-    if not s:
-        return []
-    return [m.group(0) for m in _ID_REGEX.finditer(s)]
-
-
-def _normalize_get_action(action: Dict[str, Any]) -> Dict[str, Any]:
-    if (action or {}).get("tool_name") != "get":
-        return action
+async def _run_action(
+    sem: asyncio.Semaphore,
+    idx: int,
+    tool_name: str,
+    tool_input: Dict[str, Any],
+    speculative: asyncio.Task | None = None,
+) -> Tuple[int, str, Dict[str, Any], Dict[str, Any], str | None]:
+    """
+    Run one plan action under the fan-out limit (or await the speculative task
+    already running it); never raises (errors are returned).
+    """
+    try:
+        if speculative is not None:
+            result = await speculative
+        else:
+            async with sem:
+                result = await handle_tool_call_async(tool_name, tool_input)
+        return idx, tool_name, tool_input, result, None
+    except Exception as e:
+        result = {"status": "error", "tool_name": tool_name, "message": str(e)}
+        return idx, tool_name, tool_input, result, str(e)
 
-    tin = action.get("tool_input") or {}
-    if not isinstance(tin, dict):
-        return action
 
-    id_val = tin.get("id")
-    ids_val = tin.get("ids")
+# ---- Prompt prefix reuse ------------------------------------------------------
 
-    # Prefer a single id if provided, else first of ids
-    rid = None
-    if isinstance(id_val, str):
-        rid = id_val.strip()
-    elif isinstance(ids_val, str):
-        rid = ids_val.strip()
-    elif isinstance(id_val, list) and id_val:
-        rid = id_val[0].strip()
-    elif isinstance(ids_val, list) and ids_val:
-        rid = ids_val[0].strip()
+def _prompt_eval_recorder(label: str):
+    """on_complete callback for query_llm + the dict it fills with this call's stats."""
+    info: Dict[str, Any] = {}
 
-    if not rid:
-        return action  # nothing to expand
+    def on_complete(final_chunk: Dict[str, Any]) -> None:
+        info.update(prompt_eval_stats.record(label, final_chunk))
 
-    try:
-        if looks_like_parent(rid):
-            expanded = expand_requirement_ids(rid, include_root=True)
-            if expanded:
-                action["tool_input"] = {"ids": expanded[:50]}  # cap for safety
-            else:
-                action["tool_input"] = {"id": rid}
-        else:
-            # Could expand children of sub-sections too, but keep as-is for now
-            action["tool_input"] = {"id": rid}
-    except Exception:
-        action["tool_input"] = {"id": rid}
+    return on_complete, info
 
-    return action
 
-    # de-dup, preserve order
-    seen = set()
-    clean: List[str] = []
-    for rid in found:
-        if rid not in seen:
-            clean.append(rid)
-            seen.add(rid)
+def _prompt_eval_event(info: Dict[str, Any]) -> Dict[str, Any]:
+    message = f"Prompt eval: {info['evaluated']} tokens in {info['eval_sec']:.2f}s"
+    if info["reused"] is not None:
+        message += f" ({info['reused']} reused from cache, ~{info['saved_sec']:.2f}s saved)"
+    return {"type": "info", "message": message + ".", "prompt_eval": info}
 
-    if not clean and isinstance(id_val, str) and _ID_REGEX.fullmatch(id_val):
-        clean = [id_val]
 
-    if not clean:
-        return action
+async def prime_prompt_prefixes() -> Dict[str, float]:
+    """
+    Load templates and have the LLM evaluate each static prefix twice: the
+    first call puts it in the server's prompt cache (so the first real
+    requests already hit it), and the cold vs. warm prompt_eval_count tells
+    prompt_eval_stats how many tokens a hit reuses.
+    Returns seconds spent per template.
+    """
+    timings: Dict[str, float] = {}
+    for name, template in load_templates().items():
+        if not template.prefix.strip():
+            continue
+        t0 = time.perf_counter()
+        try:
+            cold = await prime_prefix(template.prefix)
+            warm = await prime_prefix(template.prefix)
+        except Exception as e:
+            logger.warning("Priming %s prompt prefix failed: %s", name, e)
+            continue
+        prompt_eval_stats.record_prime(name, cold, warm)
+        timings[name] = round(time.perf_counter() - t0, 3)
+    return timings
 
-    if len(clean) == 1:
-        action["tool_input"] = {"id": clean[0]}
-    else:
-        action["tool_input"] = {"ids": clean}
-    return action
 
+def _deadline_event(message: str) -> Dict[str, Any]:
+    return {"type": "info", "message": message, "degraded": True}
 
-def _normalize_actions_list(actions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    out: List[Dict[str, Any]] = []
-    for a in actions or []:
-        if not isinstance(a, dict):
-            continue
-        if a.get("tool_name") == "get":
-            a = _normalize_get_action(a)
-        out.append(a)
-    return out
 
+async def run_full_pipeline(message: str, deadline: Deadline | None = None):
+    """
+    Answer-cache front for `_run_pipeline`: on a semantic hit the cached event
+    stream is replayed immediately; otherwise the live stream is recorded and
+    stored once it completes without errors or deadline degradation.
+    """
+    deadline = deadline or Deadline()
+    probe = await asyncio.to_thread(probe_message, message)
+    if probe is not None:
+        hit = answer_cache.lookup(probe.vector, probe.key)
+        if hit is not None:
+            yield {
+                "type": "info",
+                "message": f"Answer cache hit (similarity={hit.similarity:.3f}).",
+                "answer_cache": {"hit": True, **answer_cache.stats()},
+            }
+            PIPELINE_REQUESTS.inc(outcome="cache_hit")
+            for ev in hit.events:
+                yield ev
+            return
 
-async def run_full_pipeline(message: str):
+    recorded: List[Dict[str, Any]] = []
+    errored = degraded = False
+    speculation = Speculation()
+    t0 = time.perf_counter()
+    try:
+        search_hits = probe.hits if probe is not None else None
+        async for ev in _run_pipeline(message, speculation, deadline, search_hits):
+            if ev.get("type") == "error":
+                errored = True
+            elif ev.get("degraded"):
+                degraded = True
+            elif ev.get("type") != "info":
+                recorded.append(ev)
+            yield ev
+    except (asyncio.CancelledError, GeneratorExit):
+        # Client gone: the cancellation already unwound tool tasks and closed the LLM stream
+        cancellation_stats.record_cancelled(time.perf_counter() - t0)
+        PIPELINE_REQUESTS.inc(outcome="cancelled")
+        raise
+    finally:
+        speculation.settle()
+    elapsed = time.perf_counter() - t0
+    cancellation_stats.record_completed(elapsed)
+    PIPELINE_STAGE_SECONDS.observe(elapsed, stage="total")
+    PIPELINE_REQUESTS.inc(outcome="error" if errored else "degraded" if degraded else "ok")
+
+    if probe is not None and not (errored or degraded):
+        answer_cache.store(probe.vector, probe.key, recorded)
+
+
+async def _run_pipeline(message: str, speculation: Speculation, deadline: Deadline,
+                        search_hits: List[Dict[str, Any]] | None = None):
     """
     Orchestrates: plan → tools → compose. Yields streaming dict events:
     - {type:'stage', label:'Routing'|'Tools'|'Answer'}
     - {type:'token', segment:'materials'|'answer', text:'...'}
+    - {type:'info', message:'...'}  (plan cache status, truncation notices;
+      `degraded: true` when the deadline forced a shortcut)
     - {type:'error', stage:'...', message:'...'}
+    Each stage is bounded by its share of `deadline`.
     """
-    # 1) Ask LLM for compact plan — BUFFER tokens first (so skip hides panel)
-    try:
-        prompt = format_prompt(
-            user_input=message,
-            context="",
-            tool_help=get_tool_overview(),
-            template_type="main",
-        )
-        token_stream = await query_llm(prompt, stream=True)
-    except Exception as e:
-        yield {"type": "error", "stage": "llm_plan", "message": str(e)}
+    # 1) Compact plan — from cache, or ask the LLM and BUFFER tokens (so skip hides panel)
+    plan: Dict[str, Any] = {}
+    async for ev in _resolve_plan(message, speculation, deadline, search_hits, plan):
+        yield ev
+    if plan.get("failed"):
         return
 
-    plan_buffer = ""
-    async for tok in token_stream:
-        plan_buffer += tok
-
-    plan_text = plan_buffer.strip()
-
     # 2) Parse plan → actions or skip
     try:
-        parsed = extract_tool_call(plan_text)
+        parsed = plan["parsed"]
+        if parsed is None:
+            parsed = extract_tool_call(plan["text"])
+            plan_cache.put(message, parsed)
         if isinstance(parsed, dict) and parsed.get("skip") is True:
-            # Smalltalk / direct answer path — DO NOT show materials panel
-            smalltalk_prompt = format_prompt(
-                user_input=message,
-                context="",
-                tool_help="",
-                template_type="smalltalk",
-            )
-            yield {"type": "stage", "label": "Answer"}
-            try:
-                token_stream = await query_llm(smalltalk_prompt, stream=True)
-                async for token in token_stream:
-                    yield {"type": "token", "segment": "answer", "text": token}
-            except (ConnectionError, TimeoutError, RuntimeError) as e:
-                yield {"type": "error", "stage": "llm_smalltalk", "message": str(e)}
-            return
-
-        actions, final_answer = normalize_actions(parsed)
-
+            actions, final_answer = None, ""
+        else:
+            actions, final_answer = normalize_actions(parsed)
     except Exception as e:
         yield {
             "type": "error",
@@ -238,15 +272,16 @@ async def run_full_pipeline(message: str):
         }
         return
 
+    if actions is None:
+        # Smalltalk / direct answer path — DO NOT show materials panel
+        async for ev in _answer_smalltalk(message, deadline):
+            yield ev
+        return
+
     # If router already produced final text with no tools, just answer
     if (not actions) and final_answer:
-        yield {"type": "stage", "label": "Answer"}
-        try:
-            token_stream = await query_llm(final_answer, stream=True)
-            async for token in token_stream:
-                yield {"type": "token", "segment": "answer", "text": token}
-        except (ConnectionError, TimeoutError, RuntimeError) as e:
-            yield {"type": "error", "stage": "llm_followup", "message": str(e)}
+        async for ev in _answer_directly(final_answer):
+            yield ev
         return
 
     # Safety cap on action count
@@ -258,7 +293,7 @@ async def run_full_pipeline(message: str):
         }
 
     # Normalize actions (fix messy get inputs like `get:"10.5" "10.6"`)
-    actions = _normalize_actions_list(actions)
+    actions = normalize_actions_list(actions)
 
     if not actions:
         yield {
@@ -268,89 +303,292 @@ async def run_full_pipeline(message: str):
         }
         return
 
-    # 3) Execute actions sequentially
+    # 3) Execute actions concurrently (bounded), stream summaries as they finish
     yield {"type": "stage", "label": "Routing"}
-    if plan_text:
-        yield {"type": "token", "segment": "materials", "text": plan_text + "\n"}
+    if plan["text"]:
+        yield {"type": "token", "segment": "materials", "text": plan["text"] + "\n"}
 
     yield {"type": "stage", "label": "Tools"}
 
-    observations: List[Dict[str, Any]] = []
-    total_chars = 0
+    valid, invalid = _validate_actions(actions)
+    for ev in invalid:
+        yield ev
+
+    results: Dict[int, Dict[str, Any]] = {}
+    async for ev in _run_tools(valid, speculation, deadline, results):
+        yield ev
+
+    tool_result_str, obs_stats = _encode_results(valid, results)
+    if obs_stats["omitted"]:
+        yield {
+            "type": "info",
+            "message": (
+                f"{len(obs_stats['omitted'])} lower-ranked requirement(s) omitted "
+                f"to fit the {OBS_TOKEN_BUDGET}-token observation budget"
+                f"{' (estimated token counts)' if obs_stats['estimated'] else ''}."
+            ),
+        }
+
+    # 4) Follow-up reasoning using all observations
+    async for ev in _compose(message, deadline, tool_result_str, obs_stats["tokens"]):
+        yield ev
+
 
+def _validate_actions(
+    actions: List[Dict[str, Any]],
+) -> Tuple[List[Tuple[int, str, Dict[str, Any]]], List[Dict[str, Any]]]:
+    """(runnable (step, tool_name, tool_input) triples, error events for the rest)."""
+    valid: List[Tuple[int, str, Dict[str, Any]]] = []
+    errors: List[Dict[str, Any]] = []
     for idx, action in enumerate(actions, 1):
         tool_name = action.get("tool_name")
         tool_input = action.get("tool_input", {}) or {}
 
         if not tool_name or not isinstance(tool_input, dict):
-            yield {
+            errors.append({
                 "type": "error",
                 "stage": "tool_validation",
                 "message": f"Invalid action at step {idx}: {action}",
-            }
+            })
             continue
+        valid.append((idx, tool_name, tool_input))
+    return valid, errors
 
-        try:
-            result = await handle_tool_call_async(tool_name, tool_input)
-        except Exception as e:
-            yield {
-                "type": "error",
-                "stage": "tool_execution",
-                "message": f"{tool_name} failed: {e}",
-            }
-            result = {"status": "error", "tool_name": tool_name, "message": str(e)}
-
-        # Human-readable tool output (no raw JSON)
-        summary = _format_tool_output(tool_name, result, tool_input=tool_input)
-        yield {"type": "token", "segment": "materials", "text": summary}
-
-        # Keep both raw and truncated strings for follow-up
-        try:
-            raw_json_str = json.dumps(result, ensure_ascii=False)
-        except Exception:
-            raw_json_str = str(result)
-
-        result_str = _truncate_for_prompt(raw_json_str, MAX_PER_OBS_CHARS)
-        total_chars += len(result_str)
-        if total_chars > MAX_TOTAL_OBS_CHARS:
-            result_str = "[omitted due to total size limit]"
 
-        # Extract quick, machine-readable IDs for the follow-up composer
-        ids_for_prompt: List[str] = []
-        try:
-            if isinstance(result, dict):
-                payload = result.get("result")
-                if isinstance(payload, list):
-                    for it in payload:
-                        if isinstance(it, dict) and it.get("id"):
-                            ids_for_prompt.append(str(it["id"]).strip())
-                elif isinstance(payload, dict) and payload.get("id"):
-                    ids_for_prompt.append(str(payload["id"]).strip())
-        except Exception:
-            ids_for_prompt = []
-
-        # Append observation
+def _encode_results(valid: List[Tuple[int, str, Dict[str, Any]]],
+                    results: Dict[int, Dict[str, Any]]) -> Tuple[str, Dict[str, Any]]:
+    """Observations in plan order (deterministic composer prompt), then token budget."""
+    observations: List[Dict[str, Any]] = []
+    for idx, tool_name, tool_input in valid:
+        result = results[idx]
         observations.append({
             "tool": tool_name,
             "input": tool_input,
             "status": (result.get("status") if isinstance(result, dict) else None),
-            "meta": (result.get("meta") if isinstance(result, dict) else None),
-            "ids": ids_for_prompt,
-            "result": result_str,
             "raw_result": result,
         })
+    return encode_observations(observations, OBS_TOKEN_BUDGET)
 
-        if total_chars > MAX_TOTAL_OBS_CHARS:
-            yield {
-                "type": "info",
-                "message": "Further observations omitted due to size limits.",
-            }
-            break
 
-    # 4) Follow-up reasoning using all observations
+async def _answer_directly(final_answer: str):
+    yield {"type": "stage", "label": "Answer"}
+    try:
+        token_stream = await query_llm(final_answer, stream=True)
+        async for token in token_stream:
+            yield {"type": "token", "segment": "answer", "text": token}
+    except (ConnectionError, TimeoutError, RuntimeError) as e:
+        yield {"type": "error", "stage": "llm_followup", "message": str(e)}
+
+
+async def _resolve_plan(message: str, speculation: Speculation, deadline: Deadline,
+                        search_hits: List[Dict[str, Any]] | None, plan: Dict[str, Any]):
+    """
+    Fill `plan` with the plan line ("text") and, when already known (cache hit
+    or heuristic fallback), its parsed form ("parsed", else None); sets
+    "failed" after yielding an error.
+    """
+    parsed = plan_cache.get(message)
+    cache_hit = parsed is not None
+    yield {
+        "type": "info",
+        "message": (
+            f"Plan cache {'hit' if cache_hit else 'miss'} "
+            f"(hits={plan_cache.hits}, misses={plan_cache.misses})."
+        ),
+        "plan_cache": {"hit": cache_hit, **plan_cache.stats()},
+    }
+    plan.update(parsed=parsed, text=render_plan_line(parsed) if cache_hit else "")
+    if not cache_hit:
+        async for ev in _plan_with_llm(message, speculation, deadline, search_hits, plan):
+            yield ev
+
+
+async def _plan_with_llm(message: str, speculation: Speculation, deadline: Deadline,
+                         search_hits: List[Dict[str, Any]] | None, plan: Dict[str, Any]):
+    """
+    Plan-cache miss: start speculative retrieval, then stream the planner within
+    its stage budget. Fills `plan["text"]` (and `plan["parsed"]` with the
+    heuristic plan when the budget ran out).
+    """
+    # Planning takes seconds on CPU — let retrieval guess in the meantime
+    t_plan = time.perf_counter()
+    plan_span = tracing.start_span("plan", message_chars=len(message))
+    with tracing.use_span(plan_span):
+        speculation.start(message, search_hits)
+    try:
+        prompt = format_prompt(
+            user_input=message,
+            context="",
+            tool_help=get_tool_overview(),
+            template_type="main",
+        )
+        plan_budget = deadline.stage_budget("plan")
+        with tracing.use_span(plan_span):
+            token_stream = await query_llm(
+                prompt,
+                stream=True,
+                timeout=max(1.0, plan_budget),
+                options={"num_predict": PLAN_NUM_PREDICT},
+                priority=PRIORITY_PLAN,
+                queue_deadline=plan_budget,
+            )
+    except Exception as e:
+        plan_span.error(e)
+        plan_span.end()
+        plan["failed"] = True
+        yield {"type": "error", "stage": "llm_plan", "message": str(e)}
+        return
+
+    # Parse as tokens arrive; once the DSL line is complete, close the upstream
+    # stream (stops generation) and dispatch tools right away.
+    plan_parser = IncrementalPlanParser()
+    plan_shortfall = ""
+    try:
+        async for tok in iter_until(token_stream, plan_budget):
+            if plan_parser.feed(tok) is not None:
+                break
+    except TimeoutError:
+        plan_shortfall = f"Planner did not finish within its {plan_budget:.1f}s budget"
+    except LLMOverloaded as e:
+        plan_shortfall = f"Planner unavailable ({e})"
+    except (ConnectionError, RuntimeError) as e:
+        plan_span.error(e)
+        plan["failed"] = True
+        yield {"type": "error", "stage": "llm_plan", "message": str(e)}
+        return
+    finally:
+        await token_stream.aclose()
+        plan_span.set(budget_sec=round(plan_budget, 2), heuristic=bool(plan_shortfall))
+        plan_span.end()
+
+    if plan_shortfall:
+        # Out of planning time: fall back to the same guess speculation runs
+        guesses = guess_actions(message)
+        plan["parsed"] = [a for a in guesses if a["tool_name"] == "get"] or guesses
+        plan["text"] = render_plan_line(plan["parsed"])
+        yield _deadline_event(f"{plan_shortfall}; using a heuristic plan.")
+    else:
+        plan["text"] = plan_parser.finish()
+    PIPELINE_STAGE_SECONDS.observe(time.perf_counter() - t_plan, stage="plan")
+
+
+async def _answer_smalltalk(message: str, deadline: Deadline):
+    """Skip plan: answer directly from the smalltalk template within the deadline."""
+    smalltalk_prompt = format_prompt(
+        user_input=message,
+        context="",
+        tool_help="",
+        template_type="smalltalk",
+    )
+    yield {"type": "stage", "label": "Answer"}
+    on_complete, eval_info = _prompt_eval_recorder("smalltalk")
+    budget = deadline.remaining()
+    try:
+        token_stream = await query_llm(
+            smalltalk_prompt,
+            stream=True,
+            timeout=max(1.0, budget),
+            on_complete=on_complete,
+            queue_deadline=budget,
+        )
+        async for token in iter_until(token_stream, budget):
+            yield {"type": "token", "segment": "answer", "text": token}
+    except TimeoutError:
+        yield _deadline_event(f"Reply cut off at the {deadline.total:g}s deadline.")
+    except (ConnectionError, RuntimeError) as e:
+        yield {"type": "error", "stage": "llm_smalltalk", "message": str(e)}
+    if eval_info:
+        yield _prompt_eval_event(eval_info)
+
+
+async def _run_tools(valid: List[Tuple[int, str, Dict[str, Any]]], speculation: Speculation,
+                     deadline: Deadline, results: Dict[int, Dict[str, Any]]):
+    """
+    Run the plan's actions (adopting matching speculative tasks) within the
+    tools budget, streaming each summary as it finishes. Fills `results` by
+    step index; steps still running at the budget get a timeout error.
+    """
+    tools_span = tracing.start_span("tools", actions=len(valid))
+    with tracing.use_span(tools_span):  # tasks copy the context: tool spans nest here
+        tasks = _start_actions(valid, speculation)
+    if speculation.active:
+        yield _speculation_event(speculation.settle())
+    tools_budget = deadline.stage_budget("tools")
+    t_tools = time.perf_counter()
+    try:
+        for next_done in asyncio.as_completed(tasks, timeout=tools_budget):
+            idx, tool_name, tool_input, result, error = await next_done
+            if error:
+                yield {
+                    "type": "error",
+                    "stage": "tool_execution",
+                    "message": f"{tool_name} failed: {error}",
+                }
+            results[idx] = result
+
+            # Human-readable tool output (no raw JSON)
+            yield {"type": "token", "segment": "materials",
+                   "text": _format_tool_output(tool_name, result, tool_input=tool_input)}
+    except TimeoutError:
+        yield _mark_late(valid, results, tools_budget)
+    finally:
+        for t in tasks:
+            if not t.done():
+                t.cancel()
+    PIPELINE_STAGE_SECONDS.observe(time.perf_counter() - t_tools, stage="tools")
+    tools_span.set(completed=len(results))
+    tools_span.end()
+
+
+def _start_actions(valid: List[Tuple[int, str, Dict[str, Any]]],
+                   speculation: Speculation) -> List[asyncio.Task]:
+    """One task per step, bounded by MAX_TOOL_CONCURRENCY unless speculation already runs it."""
+    sem = asyncio.Semaphore(max(1, MAX_TOOL_CONCURRENCY))
+    return [
+        asyncio.create_task(_run_action(
+            sem, idx, tool_name, tool_input,
+            speculative=speculation.take(tool_name, tool_input),
+        ))
+        for idx, tool_name, tool_input in valid
+    ]
+
+
+def _speculation_event(spec: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "type": "info",
+        "message": (
+            f"Speculative retrieval reused {spec['hits']}/{spec['launched']} "
+            f"(saved {spec['saved_sec']:.2f}s)."
+        ),
+        "speculation": {**spec, "totals": speculation_stats.snapshot()},
+    }
+
+
+def _mark_late(valid: List[Tuple[int, str, Dict[str, Any]]],
+               results: Dict[int, Dict[str, Any]], tools_budget: float) -> Dict[str, Any]:
+    """Timeout results for the steps still running at the tools budget."""
+    late = [(idx, tool_name) for idx, tool_name, _ in valid if idx not in results]
+    for idx, _ in late:
+        results[idx] = {"status": "error", "message": f"timed out after {tools_budget:.1f}s"}
+    return _deadline_event(
+        f"Skipped {', '.join(name for _, name in late)}: "
+        f"tools ran past their {tools_budget:.1f}s budget."
+    )
+
+
+async def _compose(message: str, deadline: Deadline, tool_result_str: str,
+                   observation_tokens: int):
+    """Written answer from the observations — skipped when time is nearly up."""
+    budget = deadline.remaining()
+    if budget < MIN_COMPOSE_SEC:
+        yield _deadline_event(
+            f"Only {budget:.1f}s of the {deadline.total:g}s deadline left; "
+            "skipped the written answer, the materials above are the result."
+        )
+        return
+
     yield {"type": "stage", "label": "Answer"}
 
-    tool_result_str = json.dumps(observations, ensure_ascii=False)
     followup_prompt = format_prompt(
         user_input=message,
         context="",
@@ -359,9 +597,36 @@ async def run_full_pipeline(message: str):
         tool_result=tool_result_str,
     )
 
+    on_complete, eval_info = _prompt_eval_recorder("followup")
+    t_compose = time.perf_counter()
+    ttft = None
+    compose_span = tracing.start_span(
+        "compose", prompt_chars=len(followup_prompt), observation_tokens=observation_tokens
+    )
     try:
-        token_stream = await query_llm(followup_prompt, stream=True)
-        async for token in token_stream:
+        with tracing.use_span(compose_span):
+            token_stream = await query_llm(
+                followup_prompt,
+                stream=True,
+                timeout=max(1.0, budget),
+                on_complete=on_complete,
+                queue_deadline=budget,
+            )
+        async for token in iter_until(token_stream, budget):
+            if ttft is None:
+                ttft = time.perf_counter() - t_compose
+                PIPELINE_STAGE_SECONDS.observe(ttft, stage="compose_ttft")
+                compose_span.set(ttft_sec=round(ttft, 4))
             yield {"type": "token", "segment": "answer", "text": token}
-    except (ConnectionError, TimeoutError, RuntimeError) as e:
+    except TimeoutError:
+        yield _deadline_event(f"Answer cut off at the {deadline.total:g}s deadline.")
+    except LLMOverloaded as e:
+        yield _deadline_event(f"{e}; the materials above are the result.")
+    except (ConnectionError, RuntimeError) as e:
+        compose_span.error(e)
         yield {"type": "error", "stage": "llm_followup", "message": str(e)}
+    finally:
+        compose_span.end()
+    PIPELINE_STAGE_SECONDS.observe(time.perf_counter() - t_compose, stage="compose")
+    if eval_info:
+        yield _prompt_eval_event(eval_info)
@@ -0,0 +1,73 @@
+# mcp_server/pipeline_stats.py
+"""Process-wide counters for speculative retrieval and client cancellations."""
+
+from __future__ import annotations
+
+import threading
+from typing import Any, Dict
+
+
+class SpeculationStats:
+    """Process-wide counters for speculative retrieval."""
+
+    def __init__(self) -> None:
+        self.launched = 0
+        self.hits = 0
+        self.saved_sec = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, launched: int, hits: int, saved_sec: float) -> None:
+        with self._lock:
+            self.launched += launched
+            self.hits += hits
+            self.saved_sec += saved_sec
+
+    def snapshot(self) -> Dict[str, Any]:
+        rate = (self.hits / self.launched) if self.launched else 0.0
+        return {
+            "launched": self.launched,
+            "hits": self.hits,
+            "hit_rate": round(rate, 3),
+            "saved_sec": round(self.saved_sec, 3),
+        }
+
+
+speculation_stats = SpeculationStats()
+
+
+class CancellationStats:
+    """
+    Pipelines cut short because the client went away.
+
+    `estimated_saved_sec` is an estimate, not measured compute: the running
+    mean wall time of completed (uncached) pipelines minus the wall time
+    already spent when the cancellation landed, summed over cancellations.
+    """
+
+    def __init__(self) -> None:
+        self.completed = 0
+        self.cancelled = 0
+        self.mean_sec = 0.0
+        self.estimated_saved_sec = 0.0
+        self._lock = threading.Lock()
+
+    def record_completed(self, elapsed: float) -> None:
+        with self._lock:
+            self.completed += 1
+            self.mean_sec += (elapsed - self.mean_sec) / self.completed
+
+    def record_cancelled(self, elapsed: float) -> None:
+        with self._lock:
+            self.cancelled += 1
+            self.estimated_saved_sec += max(0.0, self.mean_sec - elapsed)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "completed": self.completed,
+            "cancelled": self.cancelled,
+            "mean_sec": round(self.mean_sec, 3),
+            "estimated_saved_sec": round(self.estimated_saved_sec, 3),
+        }
+
+
+cancellation_stats = CancellationStats()
@@ -0,0 +1,91 @@
+# mcp_server/plan_actions.py
+"""
+Normalization of planned tool actions: PCI IDs pulled from text, and `get`
+inputs reshaped (a parent requirement expands to its sub-requirements).
+"""
+
+from __future__ import annotations
+
+import re
+from typing import Any, Dict, List
+
+from retrieval.hierarchy import expand_requirement_ids, looks_like_parent
+
+_ID_REGEX = re.compile(r"\b\d+(?:\.\d+){0,3}\b")
+
+def extract_pci_ids(s: str) -> List[str]:
+    if not s:
+        return []
+    return [m.group(0) for m in _ID_REGEX.finditer(s)]
+
+
+def normalize_get_action(action: Dict[str, Any]) -> Dict[str, Any]:
+    if (action or {}).get("tool_name") != "get":
+        return action
+
+    tin = action.get("tool_input") or {}
+    if not isinstance(tin, dict):
+        return action
+
+    id_val = tin.get("id")
+    ids_val = tin.get("ids")
+
+    # Prefer a single id if provided, else first of ids
+    rid = None
+    if isinstance(id_val, str):
+        rid = id_val.strip()
+    elif isinstance(ids_val, str):
+        rid = ids_val.strip()
+    elif isinstance(id_val, list) and id_val:
+        rid = id_val[0].strip()
+    elif isinstance(ids_val, list) and ids_val:
+        rid = ids_val[0].strip()
+
+    if not rid:
+        return action  # nothing to expand
+
+    try:
+        if looks_like_parent(rid):
+            expanded = expand_requirement_ids(rid, include_root=True)
+            if expanded:
+                action["tool_input"] = {"ids": expanded[:50]}  # cap for safety
+            else:
+                action["tool_input"] = {"id": rid}
+        else:
+            # Could expand children of sub-sections too, but keep as-is for now
+            action["tool_input"] = {"id": rid}
+    except Exception:
+        action["tool_input"] = {"id": rid}
+
+    return action
+
+    # de-dup, preserve order
+    seen = set()
+    clean: List[str] = []
+    for rid in found:
+        if rid not in seen:
+            clean.append(rid)
+            seen.add(rid)
+
+    if not clean and isinstance(id_val, str) and _ID_REGEX.fullmatch(id_val):
+        clean = [id_val]
+
+    if not clean:
+        return action
+
+    if len(clean) == 1:
+        action["tool_input"] = {"id": clean[0]}
+    else:
+        action["tool_input"] = {"ids": clean}
+    return action
+
+
+def normalize_actions_list(actions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    out: List[Dict[str, Any]] = []
+    for a in actions or []:
+        if not isinstance(a, dict):
+            continue
+        if a.get("tool_name") == "get":
+            a = normalize_get_action(a)
+        out.append(a)
+    return out
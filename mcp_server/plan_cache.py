@@ -0,0 +1,129 @@
+# mcp_server/plan_cache.py
+"""
+Cache of parsed planner output, keyed by the normalized message, plus the
+compact DSL line a cached plan is shown as.
+"""
+
+from __future__ import annotations
+
+import copy
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+from agent import llm_wrapper
+
+# Planner output cache (parsed actions, keyed by normalized message)
+PLAN_CACHE_SIZE = int(os.getenv("PLAN_CACHE_SIZE", "256"))
+PLAN_CACHE_TTL_SEC = float(os.getenv("PLAN_CACHE_TTL_SEC", "3600"))
+PLAN_TEMPLATE_PATH = Path("agent/prompt_template.txt")
+
+_TRAILING_PUNCT_RX = re.compile(r"[\s?!.]+$")
+_WS_RX = re.compile(r"\s+")
+
+
+def normalize_message(message: str) -> str:
+    """
+    Cache key for planner output: case-folded, whitespace-collapsed,
+    trailing punctuation dropped ("What is requirement 10?" == "what is requirement 10").
+    """
+    s = _WS_RX.sub(" ", (message or "").casefold()).strip()
+    return _TRAILING_PUNCT_RX.sub("", s)
+
+
+def file_sig(path: Path) -> Tuple[int, int]:
+    try:
+        st = path.stat()
+        return (st.st_mtime_ns, st.st_size)
+    except OSError:
+        return (0, 0)
+
+
+def plan_cache_version() -> Tuple[Any, ...]:
+    """Changes whenever the planner template or the planner model changes."""
+    return (llm_wrapper.LLM_MODEL, file_sig(PLAN_TEMPLATE_PATH))
+
+
+class PlanCache:
+    """
+    LRU + TTL cache of *parsed* planner output (actions list or skip marker).
+    Entries are dropped wholesale when the template/model version changes.
+    """
+
+    def __init__(self, maxsize: int = PLAN_CACHE_SIZE, ttl_sec: float = PLAN_CACHE_TTL_SEC):
+        self.maxsize = maxsize
+        self.ttl_sec = ttl_sec
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._version: Tuple[Any, ...] | None = None
+        self._lock = threading.Lock()
+
+    def _check_version(self) -> None:
+        version = plan_cache_version()
+        if version != self._version:
+            self._data.clear()
+            self._version = version
+
+    def get(self, message: str) -> Any | None:
+        key = normalize_message(message)
+        with self._lock:
+            self._check_version()
+            entry = self._data.get(key)
+            if entry is not None and time.monotonic() - entry[0] > self.ttl_sec:
+                del self._data[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            # Callers mutate actions during normalization; never hand out the cached object
+            return copy.deepcopy(entry[1])
+
+    def put(self, message: str, parsed: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        key = normalize_message(message)
+        with self._lock:
+            self._check_version()
+            self._data[key] = (time.monotonic(), copy.deepcopy(parsed))
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._data)}
+
+
+plan_cache = PlanCache()
+
+
+def render_plan_line(parsed: Any) -> str:
+    """Re-create the compact DSL line for a cached plan (shown in the Routing panel)."""
+    if isinstance(parsed, dict) and parsed.get("skip") is True:
+        return "skip"
+    lines: List[str] = []
+    for a in parsed if isinstance(parsed, list) else []:
+        tin = (a or {}).get("tool_input") or {}
+        if a.get("tool_name") == "get" and isinstance(tin.get("ids"), list):
+            lines.append("get:" + json.dumps(tin["ids"], ensure_ascii=False))
+        elif a.get("tool_name") == "get" and tin.get("id"):
+            lines.append("get:" + json.dumps(tin["id"], ensure_ascii=False))
+        elif a.get("tool_name") == "search" and (tin.get("q") or tin.get("query")):
+            query = tin.get("q") or tin.get("query")
+            lines.append("search:" + json.dumps(query, ensure_ascii=False))
+        elif a.get("tool_name") == "related" and tin.get("id"):
+            lines.append("related:" + json.dumps(tin["id"], ensure_ascii=False))
+        else:
+            lines.append(json.dumps(a, ensure_ascii=False))
+    return "\n".join(lines)
@@ -2,12 +2,17 @@ import json
 import asyncio
 import random
 import time
+from typing import Optional
 from fastapi import APIRouter, Request
-from fastapi.responses import StreamingResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 
-from agent.llm_wrapper import query_llm
-from mcp_server.pipeline import run_full_pipeline
+from agent.llm_scheduler import PRIORITY_COMPOSE, PRIORITY_PLAN, LLMOverloaded, llm_scheduler
+from agent.llm_wrapper import prompt_eval_stats, query_llm
+from mcp_server.coalesce import STREAM_COALESCE_MS, TokenCoalescer, stream_stats
+from mcp_server.deadline import Deadline
+from mcp_server.pipeline import cancellation_stats, run_full_pipeline
+from mcp_server.streaming import stream_until_disconnect
 
 router = APIRouter()
 
@@ -19,46 +24,84 @@ def _clear_caches_lazy():
     _clear()
 
 
+def _overloaded_response(e: LLMOverloaded) -> JSONResponse:
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(e), "retry_after": e.retry_after},
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
+
 # --- GET /ask — Raw LLM response (SSE/EventSource) -------------------------
 
 @router.get("/ask")
 async def ask_stream_handler(request: Request):
     message = request.query_params.get("message", "")
-
-    async def event_stream():
-        try:
-            async for token in query_llm(message, stream=True):
-                # stop if client disconnected
-                if await request.is_disconnected():
-                    break
-                yield f"data: {token}\n\n"
-        except asyncio.CancelledError:
-            # client dropped; just exit quietly
-            pass
-
-    return StreamingResponse(event_stream(), media_type="text/event-stream")
+    try:
+        llm_scheduler.check_admission(PRIORITY_COMPOSE)
+    except LLMOverloaded as e:
+        return _overloaded_response(e)
+
+    async def tokens():
+        token_stream = await query_llm(message, stream=True)
+        async for token in token_stream:
+            yield token
+
+    return StreamingResponse(
+        stream_until_disconnect(
+            request,
+            tokens(),
+            lambda token: f"data: {token}\n\n",
+            trace_name="ask",
+            message_chars=len(message),
+        ),
+        media_type="text/event-stream",
+    )
 
 
 # --- POST /ask_full — JSON ND streaming -----------------------------------
 
 class AskRequest(BaseModel):
     message: str
+    # Total time budget in seconds (also accepted as the X-Deadline-Sec header)
+    deadline_sec: Optional[float] = None
+    # Merge token events over this window (ms); 0 = one event per token
+    coalesce_ms: Optional[int] = None
+
+
+def _request_deadline(payload: AskRequest, request: Request) -> Deadline:
+    seconds = payload.deadline_sec
+    if seconds is None:
+        try:
+            seconds = float(request.headers.get("x-deadline-sec", ""))
+        except ValueError:
+            seconds = None
+    return Deadline(seconds)
 
 
 @router.post("/ask_full")
 async def ask_full_handler(payload: AskRequest, request: Request):
     message = payload.message
-
-    async def stream():
-        try:
-            async for item in run_full_pipeline(message):
-                if await request.is_disconnected():
-                    break
-                yield json.dumps(item) + "\n"
-        except asyncio.CancelledError:
-            pass
-
-    return StreamingResponse(stream(), media_type="application/x-ndjson")
+    deadline = _request_deadline(payload, request)
+    # Reject before streaming starts: a 429 is cheaper than a 200 that times out
+    try:
+        llm_scheduler.check_admission(PRIORITY_PLAN, deadline_sec=deadline.stage_budget("plan"))
+    except LLMOverloaded as e:
+        return _overloaded_response(e)
+
+    window_ms = STREAM_COALESCE_MS if payload.coalesce_ms is None else payload.coalesce_ms
+    return StreamingResponse(
+        stream_until_disconnect(
+            request,
+            run_full_pipeline(message, deadline),
+            lambda item: json.dumps(item) + "\n",
+            coalescer=TokenCoalescer(window_ms) if window_ms > 0 else None,
+            trace_name="ask_full",
+            message_chars=len(message),
+            deadline_sec=deadline.total,
+        ),
+        media_type="application/x-ndjson",
+    )
 
 
 # --- GET /ask_mock — mock SSE ---------------------------------------------
@@ -138,6 +181,18 @@ async def ask_mock_full_handler(payload: AskRequest, request: Request):
     return StreamingResponse(stream(), media_type="application/x-ndjson")
 
 
+# --- GET /llm/stats — scheduler queue + prompt-eval counters ---------------
+
+@router.get("/llm/stats")
+def llm_stats():
+    return {
+        "scheduler": llm_scheduler.stats(),
+        "prompt_eval": prompt_eval_stats.snapshot(),
+        "cancellations": cancellation_stats.snapshot(),
+        "stream": stream_stats.snapshot(),
+    }
+
+
 # --- Reload retriever (clears FAISS/model caches) -------------------------
 
 @router.post("/reload_index")
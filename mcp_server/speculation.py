@@ -0,0 +1,164 @@
+# mcp_server/speculation.py
+"""
+Work done on the raw message before (or instead of) planning: the message
+probe (embedding + ANN hits, which also key the answer cache) and
+speculative retrieval started while the planner LLM is still running.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, Hashable, List, NamedTuple, Tuple
+
+import numpy as np
+
+from agent.tool_call_parser import find_pci_ids
+from mcp_server.answer_cache import make_fingerprint
+from mcp_server.capabilities import capabilities
+from mcp_server.pipeline_stats import speculation_stats
+from mcp_server.plan_actions import extract_pci_ids, normalize_actions_list
+from mcp_server.plan_cache import file_sig, normalize_message, plan_cache_version
+from mcp_server.tool_dispatcher import handle_tool_call_async
+from retrieval.retriever import artifact_version, get_retriever
+from tools import get_tool_module
+
+logger = logging.getLogger(__name__)
+
+# Answer cache: how many ANN neighbours of the message go into the cache key
+ANSWER_CACHE_ID_K = int(os.getenv("ANSWER_CACHE_ID_K", "5"))
+FOLLOWUP_TEMPLATE_PATH = Path("agent/followup_template.txt")
+
+
+# ---- Message probe -----------------------------------------------------------
+
+def _answer_cache_version() -> str:
+    return "|".join([
+        artifact_version(),
+        str(plan_cache_version()),
+        str(file_sig(FOLLOWUP_TEMPLATE_PATH)),
+    ])
+
+
+class MessageProbe(NamedTuple):
+    """The message's embedding and ANN hits, computed once per request."""
+    vector: np.ndarray
+    key: Hashable
+    # Nearest requirements for the message, enough for the speculative search to reuse
+    hits: List[Dict[str, Any]]
+
+
+def probe_message(message: str) -> MessageProbe | None:
+    """
+    Blocking (embedding + one ANN lookup) — call via asyncio.to_thread.
+    Answer-cache key = message embedding + (artifact version, explicit IDs ∪
+    top-k retrieved IDs). The hits are fetched at the search tool's k so the
+    speculative search can be built from them instead of embedding and
+    searching the same message again.
+    Returns None when the embedder/index is unavailable; the cache is then bypassed.
+    """
+    query = (message or "").strip()
+    if not query:
+        return None
+    if not (capabilities.usable("vector_index") and capabilities.usable("embedder")):
+        return None
+    try:
+        search_k = int(get_tool_module("search").DEFAULT_K)
+        retriever = get_retriever()
+        qv = retriever.embed(query)
+        hits = retriever.search_by_vector(qv, k=max(ANSWER_CACHE_ID_K, search_k))
+    except Exception as e:
+        logger.debug("Answer cache bypassed: %s", e)
+        return None
+    ids = extract_pci_ids(message) + [d["id"] for d in hits[:ANSWER_CACHE_ID_K]]
+    return MessageProbe(qv[0], make_fingerprint(_answer_cache_version(), ids), hits)
+
+
+# ---- Speculative retrieval ----------------------------------------------------
+
+def _action_key(tool_name: str, tool_input: Dict[str, Any]) -> str:
+    tin = dict(tool_input or {})
+    if tool_name == "search":
+        q = tin.pop("q", None) or tin.pop("query", None) or ""
+        tin["q"] = normalize_message(q)
+    return f"{tool_name}:{json.dumps(tin, sort_keys=True, ensure_ascii=False)}"
+
+
+def guess_actions(message: str) -> List[Dict[str, Any]]:
+    """Plan guessed without the LLM: a search on the message plus a get on any PCI IDs in it."""
+    candidates: List[Dict[str, Any]] = [
+        {"tool_name": "search", "tool_input": {"q": message.strip()}},
+    ]
+    ids = find_pci_ids(message)
+    if ids:
+        tin = {"id": ids[0]} if len(ids) == 1 else {"ids": ids}
+        candidates.append({"tool_name": "get", "tool_input": tin})
+    return normalize_actions_list(candidates)
+
+
+class Speculation:
+    """
+    Retrieval started on the raw message while the planner LLM is still running:
+    a search on the message and a get on any regex-detected PCI IDs (normalized
+    exactly like planned actions, so a matching plan can adopt the task).
+    """
+
+    def __init__(self) -> None:
+        self._tasks: Dict[str, Tuple[asyncio.Task, float]] = {}
+        self._finished_at: Dict[str, float] = {}
+        self.hits = 0
+        self.saved_sec = 0.0
+        self._started = False
+        self._settled = False
+
+    @property
+    def active(self) -> bool:
+        return self._started and not self._settled
+
+    def start(self, message: str, search_hits: List[Dict[str, Any]] | None = None) -> None:
+        """`search_hits`: ANN hits already fetched for the message (no second embed/search)."""
+        self._started = True
+        for action in guess_actions(message):
+            tool_name, tool_input = action["tool_name"], action["tool_input"]
+            key = _action_key(tool_name, tool_input)
+            if key in self._tasks:
+                continue
+            prefetched = search_hits if tool_name == "search" else None
+            task = asyncio.create_task(
+                handle_tool_call_async(tool_name, dict(tool_input), prefetched=prefetched)
+            )
+            task.add_done_callback(
+                lambda _t, k=key: self._finished_at.setdefault(k, time.perf_counter())
+            )
+            self._tasks[key] = (task, time.perf_counter())
+
+    def take(self, tool_name: str, tool_input: Dict[str, Any]) -> asyncio.Task | None:
+        """Adopt the speculative task matching a planned action, if any."""
+        key = _action_key(tool_name, tool_input)
+        entry = self._tasks.pop(key, None)
+        if entry is None:
+            return None
+        task, started = entry
+        now = time.perf_counter()
+        self.hits += 1
+        # Work that overlapped with planning: until it finished or until the plan was ready
+        self.saved_sec += min(now, self._finished_at.get(key, now)) - started
+        return task
+
+    def settle(self) -> Dict[str, Any]:
+        """Cancel whatever the plan did not use and fold this request into the stats."""
+        launched = self.hits + len(self._tasks)
+        self.cancel()
+        if self.active:
+            self._settled = True
+            speculation_stats.record(launched, self.hits, self.saved_sec)
+        return {"launched": launched, "hits": self.hits, "saved_sec": round(self.saved_sec, 3)}
+
+    def cancel(self) -> None:
+        for task, _ in self._tasks.values():
+            task.cancel()
+        self._tasks.clear()
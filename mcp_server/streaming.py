@@ -0,0 +1,115 @@
+# mcp_server/streaming.py
+"""
+Streaming responses that stop working when the client goes away.
+
+The response body is produced in its own task while a watcher polls for a
+dropped client and cancels that task, unwinding everything it awaits (tool
+tasks, upstream LLM streams). A bounded queue between the two applies
+backpressure to the producer when the client reads slowly.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+from typing import Any, AsyncIterator, Callable, Optional
+
+from fastapi import Request
+
+from mcp_server.coalesce import TokenCoalescer, stream_stats
+from telemetry import tracing
+
+# How often the per-request watcher checks for a dropped client
+DISCONNECT_POLL_SEC = float(os.getenv("DISCONNECT_POLL_SEC", "0.25"))
+# Events buffered between the pipeline and a slow client before the pipeline waits
+STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", "64"))
+
+
+async def _watch_disconnect(request: Request, task: asyncio.Task) -> None:
+    while not task.done():
+        if await request.is_disconnected():
+            task.cancel()
+            return
+        await asyncio.sleep(DISCONNECT_POLL_SEC)
+
+
+_END = object()
+
+
+async def stream_until_disconnect(
+    request: Request,
+    items: AsyncIterator[Any],
+    encode: Callable[[Any], str],
+    coalescer: Optional[TokenCoalescer] = None,
+    trace_name: str = "",
+    **trace_attrs: Any,
+) -> AsyncIterator[str]:
+    """
+    Drive `items` in its own task next to a disconnect watcher. When the client
+    goes away the producer task is cancelled, which unwinds the whole pipeline
+    (tool tasks, the upstream LLM stream) instead of letting it run to the end.
+
+    With a `coalescer`, token events are merged and everything ready at once is
+    written as one chunk; a closing info event reports the bytes/writes used.
+    The producer runs inside a `trace_name` root span when tracing samples it.
+    At most STREAM_QUEUE_SIZE events wait for the client; beyond that the
+    producer (and so the pipeline) pauses until the client catches up.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, STREAM_QUEUE_SIZE))
+
+    async def produce() -> None:
+        try:
+            with tracing.trace(trace_name or "stream", **trace_attrs) as root:
+                first = True
+                async for item in items:
+                    tag = first and root.trace_id and tracing.TRACE_ID_IN_STREAM
+                    if tag and isinstance(item, dict):
+                        item = {**item, "trace_id": root.trace_id}
+                    first = False
+                    await queue.put(item)
+        finally:
+            # Can't hang: if the consumer is gone, its cleanup cancels this task again
+            await queue.put(_END)
+
+    producer = asyncio.create_task(produce())
+    watcher = asyncio.create_task(_watch_disconnect(request, producer))
+    events = writes = nbytes = 0
+    try:
+        while True:
+            wait = coalescer.time_to_flush() if coalescer else None
+            if wait is None:
+                item = await queue.get()
+            else:
+                try:
+                    item = await asyncio.wait_for(queue.get(), wait)
+                except TimeoutError:
+                    item = None  # window closed with nothing new
+
+            if item is None:
+                ready = coalescer.flush()
+            elif item is _END:
+                ready = coalescer.flush() if coalescer else []
+            else:
+                events += 1
+                ready = coalescer.add(item) if coalescer else [item]
+            if ready:
+                chunk = "".join(encode(i) for i in ready)
+                writes += 1
+                nbytes += len(chunk.encode("utf-8"))
+                yield chunk
+            if item is _END:
+                break
+        if not producer.cancelled():
+            producer.result()  # surface pipeline exceptions
+        if coalescer is not None:
+            yield encode({
+                "type": "info",
+                "message": f"Streamed {events} events in {writes} writes ({nbytes} bytes).",
+                "stream": {"events": events, "writes": writes, "bytes": nbytes},
+            })
+    except asyncio.CancelledError:
+        pass
+    finally:
+        stream_stats.record(events, writes, nbytes)
+        producer.cancel()
+        watcher.cancel()
@@ -3,30 +3,48 @@
 from __future__ import annotations
 
 import asyncio
-import importlib
+import functools
 import inspect
+import json
 import logging
-from typing import Any, Dict, Optional
+import os
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
 
-from fastapi import APIRouter
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel, ValidationError
 
+from mcp_server.capabilities import capabilities
+from mcp_server.streaming import stream_until_disconnect
+from tools import TOOL_REGISTRY, get_tool_module
+
+from telemetry import tracing
+from telemetry.metrics import TOOL_SECONDS
+
 logger = logging.getLogger(__name__)
 tool_router = APIRouter()
 
+# /tools/call_batch limits; per tool, `max_concurrency` in tools/manifest.json wins
+TOOL_BATCH_MAX_CALLS = int(os.getenv("TOOL_BATCH_MAX_CALLS", "500"))
+TOOL_BATCH_CONCURRENCY = int(os.getenv("TOOL_BATCH_CONCURRENCY", "4"))
+# Calls handed to a tool's run_many() at once (e.g. queries per embedding batch)
+TOOL_BATCH_GROUP_SIZE = int(os.getenv("TOOL_BATCH_GROUP_SIZE", "32"))
+
 # ---------------- Models ----------------
 
 class ToolCall(BaseModel):
     tool_name: str
     tool_input: Dict[str, Any] = {}
 
+class ToolCallBatch(BaseModel):
+    calls: List[ToolCall]
+
 # ---------------- Helpers ----------------
 
 def _import_tool_module(tool_name: str):
-    try:
-        return importlib.import_module(f"tools.{tool_name}")
-    except ModuleNotFoundError as e:
-        raise ModuleNotFoundError(f"Tool '{tool_name}' not found (tried tools.{tool_name})") from e
+    # Manifest tools only: a caller-supplied name never reaches import_module
+    return get_tool_module(tool_name)
 
 def _error_response(stage: str, message: str, tool_name: str,
                     details: Optional[Any] = None) -> Dict[str, Any]:
@@ -52,7 +70,48 @@ def _serialize_output(obj: Any) -> Dict[str, Any]:
 
 # ---------------- Dispatcher ----------------
 
-async def handle_tool_call_async(tool_name: str, tool_input: Dict[str, Any]) -> Dict[str, Any]:
+async def handle_tool_call_async(tool_name: str, tool_input: Dict[str, Any],
+                                 prefetched: Any = None) -> Dict[str, Any]:
+    """
+    Run one tool call. `prefetched` is data the caller already computed for
+    this call (search: the ANN hits for the query); tools that define
+    `run_prefetched(params, prefetched)` use it instead of redoing the work.
+    """
+    t0 = time.perf_counter()
+    attrs = _input_attrs(tool_input)
+    if prefetched is not None:
+        attrs["prefetched"] = True
+    with tracing.span("tool.call", tool=tool_name, **attrs) as span:
+        result = await _dispatch(tool_name, tool_input, prefetched)
+        status = str(result.get("status", "unknown"))
+        span.set(status=status)
+    TOOL_SECONDS.observe(time.perf_counter() - t0, tool=tool_name, status=status)
+    return result
+
+def _input_attrs(tool_input: Dict[str, Any]) -> Dict[str, Any]:
+    """Small span attributes describing a tool input (no raw text)."""
+    tin = tool_input or {}
+    attrs: Dict[str, Any] = {}
+    if isinstance(tin.get("ids"), list):
+        attrs["id_count"] = len(tin["ids"])
+    elif tin.get("id"):
+        attrs["id_count"] = 1
+    if tin.get("k") is not None:
+        attrs["k"] = tin["k"]
+    query = tin.get("q") or tin.get("query")
+    if query:
+        attrs["query_chars"] = len(str(query))
+    return attrs
+
+async def _dispatch(tool_name: str, tool_input: Dict[str, Any],
+                    prefetched: Any = None) -> Dict[str, Any]:
+    waiting = capabilities.waiting_for(TOOL_REGISTRY.get(tool_name, {}).get("needs", ()))
+    if waiting:
+        return _error_response(
+            "unavailable", f"Tool '{tool_name}' is waiting for: {', '.join(waiting)}", tool_name,
+            details={"waiting_for": waiting},
+        )
+
     try:
         module = _import_tool_module(tool_name)
     except ModuleNotFoundError as e:
@@ -61,9 +120,16 @@ async def handle_tool_call_async(tool_name: str, tool_input: Dict[str, Any]) ->
     run_fn = getattr(module, "run", None)
     if run_fn is None or not callable(run_fn):
         return _error_response("dispatch", f"Tool '{tool_name}' has no callable 'run'", tool_name)
+    run_prefetched = getattr(module, "run_prefetched", None)
+    if prefetched is not None and callable(run_prefetched):
+        run_fn = functools.partial(run_prefetched, prefetched=prefetched)
 
     try:
-        result_obj = run_fn(tool_input or {})
+        if inspect.iscoroutinefunction(run_fn):
+            result_obj = run_fn(tool_input or {})
+        else:
+            # Sync tools (FAISS, SQLite) must not block the loop for concurrent calls
+            result_obj = await asyncio.to_thread(run_fn, tool_input or {})
         if inspect.isawaitable(result_obj):
             result_obj = await result_obj
     except ValidationError as ve:
@@ -76,6 +142,112 @@ async def handle_tool_call_async(tool_name: str, tool_input: Dict[str, Any]) ->
 
     return _serialize_output(result_obj)
 
+def _run_many_fn(tool_name: str):
+    try:
+        run_many = getattr(_import_tool_module(tool_name), "run_many", None)
+    except ModuleNotFoundError:
+        return None
+    return run_many if callable(run_many) else None
+
+def _tool_concurrency(tool_name: str) -> int:
+    meta = TOOL_REGISTRY.get(tool_name, {})
+    return max(1, int(meta.get("max_concurrency") or TOOL_BATCH_CONCURRENCY))
+
+async def handle_tool_calls_many_async(tool_name: str, inputs: List[Dict[str, Any]],
+                                       sem: Optional[asyncio.Semaphore] = None,
+                                       ) -> List[Dict[str, Any]]:
+    """
+    Several calls to one tool, one result per input in order. Tools with a
+    `run_many` (search: one encode and one FAISS lookup for all queries) get
+    them in one go; otherwise, or if the batched path fails, the calls run
+    concurrently through handle_tool_call_async. `sem` bounds the tool's
+    concurrent work (default: its max_concurrency).
+    """
+    sem = sem or asyncio.Semaphore(_tool_concurrency(tool_name))
+    run_many = _run_many_fn(tool_name)
+    waiting = capabilities.waiting_for(TOOL_REGISTRY.get(tool_name, {}).get("needs", ()))
+    if len(inputs) > 1 and run_many is not None and not waiting:
+        t0 = time.perf_counter()
+        with tracing.span("tool.call_many", tool=tool_name, calls=len(inputs)):
+            try:
+                async with sem:
+                    outputs = await asyncio.to_thread(run_many, [dict(i or {}) for i in inputs])
+            except Exception as e:
+                logger.warning("Batched %s failed, running calls one by one: %s", tool_name, e)
+            else:
+                results = [_serialize_output(o) for o in outputs][:len(inputs)]
+                # Per-call share of the batch, so counts and sums stay per call
+                per_call = (time.perf_counter() - t0) / max(1, len(results))
+                for r in results:
+                    TOOL_SECONDS.observe(per_call, tool=tool_name,
+                                         status=str(r.get("status", "unknown")))
+                # Every call gets a line, even if run_many came back short
+                missing = _error_response(
+                    "runtime", f"run_many returned {len(outputs)} results for {len(inputs)} calls",
+                    tool_name,
+                )
+                return results + [dict(missing) for _ in range(len(inputs) - len(results))]
+
+    async def one(tool_input: Dict[str, Any]) -> Dict[str, Any]:
+        async with sem:
+            return await handle_tool_call_async(tool_name, tool_input)
+
+    return list(await asyncio.gather(*(one(tin) for tin in inputs)))
+
+def _call_key(tool_name: str, tool_input: Dict[str, Any]) -> str:
+    return json.dumps([tool_name, tool_input or {}], sort_keys=True, default=str)
+
+async def run_tool_batch(calls: List[ToolCall]) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Execute a batch: identical calls run once, distinct calls run concurrently
+    (at most `max_concurrency` jobs per tool), and each result is yielded as
+    soon as it is ready, once per request index. Ends with a "done" event.
+    """
+    t0 = time.perf_counter()
+    unique: Dict[str, Dict[str, Any]] = {}
+    for index, call in enumerate(calls):
+        key = _call_key(call.tool_name, call.tool_input)
+        entry = unique.setdefault(
+            key, {"tool_name": call.tool_name, "tool_input": call.tool_input, "indices": []}
+        )
+        entry["indices"].append(index)
+
+    by_tool: Dict[str, List[Dict[str, Any]]] = {}
+    for entry in unique.values():
+        by_tool.setdefault(entry["tool_name"], []).append(entry)
+
+    async def job(tool_name: str, group: List[Dict[str, Any]], sem: asyncio.Semaphore):
+        results = await handle_tool_calls_many_async(
+            tool_name, [e["tool_input"] for e in group], sem
+        )
+        return tool_name, group, results
+
+    tasks: List[asyncio.Task] = []
+    for tool_name, entries in by_tool.items():
+        sem = asyncio.Semaphore(_tool_concurrency(tool_name))
+        # Without run_many every call is its own job, so they overlap up to the tool's limit
+        size = max(1, TOOL_BATCH_GROUP_SIZE) if _run_many_fn(tool_name) is not None else 1
+        for start in range(0, len(entries), size):
+            tasks.append(asyncio.create_task(job(tool_name, entries[start:start + size], sem)))
+
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            tool_name, group, results = await next_done
+            for entry, result in zip(group, results):
+                for index in entry["indices"]:
+                    yield {"type": "result", "index": index, "tool_name": tool_name,
+                           "result": result}
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    yield {
+        "type": "done",
+        "calls": len(calls),
+        "unique": len(unique),
+        "elapsed_sec": round(time.perf_counter() - t0, 3),
+    }
+
 def handle_tool_call(tool_name: str, tool_input: Dict[str, Any]) -> Dict[str, Any]:
     """
     Synchronous wrapper — ONLY safe when no event loop is running.
@@ -96,4 +268,28 @@ def handle_tool_call(tool_name: str, tool_input: Dict[str, Any]) -> Dict[str, An
 
 @tool_router.post("/tools/call")
 async def call_tool(tc: ToolCall) -> Dict[str, Any]:
-    return await handle_tool_call_async(tc.tool_name, tc.tool_input)
+    with tracing.trace("tools_call", tool=tc.tool_name):
+        result = await handle_tool_call_async(tc.tool_name, tc.tool_input)
+    if result.get("stage") == "unavailable":
+        return JSONResponse(result, status_code=503, headers={"Retry-After": "10"})
+    return result
+
+@tool_router.post("/tools/call_batch")
+async def call_tool_batch(payload: ToolCallBatch, request: Request):
+    """NDJSON, one line per call as it finishes, then a "done" line."""
+    if len(payload.calls) > TOOL_BATCH_MAX_CALLS:
+        return JSONResponse(
+            status_code=413,
+            content={"detail": f"At most {TOOL_BATCH_MAX_CALLS} calls per batch "
+                               f"(got {len(payload.calls)})"},
+        )
+    return StreamingResponse(
+        stream_until_disconnect(
+            request,
+            run_tool_batch(payload.calls),
+            lambda item: json.dumps(item) + "\n",
+            trace_name="tools_call_batch",
+            calls=len(payload.calls),
+        ),
+        media_type="application/x-ndjson",
+    )
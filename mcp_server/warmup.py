@@ -0,0 +1,184 @@
+# mcp_server/warmup.py
+"""
+Startup warmup run by the background thread in main.py before readiness.
+
+Each step loads something the first request would otherwise pay for (FAISS
+index, SentenceTransformer import + weights, SQLite pages, tool registry,
+prompt templates, the LLM connection) and exercises it once. Steps are timed
+and never raise: failures are recorded and the remaining steps still run, so
+/readyz shows exactly what is warm and what is not.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from mcp_server.capabilities import LOADING, READY, UNAVAILABLE, Capabilities, capabilities
+
+logger = logging.getLogger(__name__)
+
+WARMUP_QUERY = os.getenv("WARMUP_QUERY", "protect stored cardholder data with encryption")
+WARMUP_LLM_TIMEOUT_SEC = float(os.getenv("WARMUP_LLM_TIMEOUT_SEC", "5"))
+# Read the SQLite file once so its pages are in the OS cache (skipped above this size)
+WARMUP_DB_READ_MAX_MB = int(os.getenv("WARMUP_DB_READ_MAX_MB", "512"))
+
+
+class WarmupReport:
+    """Per-step status and timings, shared between the warmup thread and /readyz."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.steps: Dict[str, Dict[str, Any]] = {}
+        self.started_at: Optional[float] = None
+        self.total_sec: Optional[float] = None
+
+    def record(self, name: str, status: str, sec: float, **detail: Any) -> None:
+        with self._lock:
+            self.steps[name] = {"status": status, "sec": round(sec, 3), **detail}
+
+    def ok(self, name: str) -> bool:
+        return self.steps.get(name, {}).get("status") == "ok"
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "done": self.total_sec is not None,
+                "total_sec": self.total_sec,
+                "steps": {k: dict(v) for k, v in self.steps.items()},
+            }
+
+
+warmup_report = WarmupReport()
+
+
+# ---- Steps (each returns details for the report) ------------------------------
+
+def _step_sqlite() -> Dict[str, Any]:
+    from retrieval.retriever import _db_path
+
+    path = _db_path()
+    size = os.path.getsize(path)
+    if size <= WARMUP_DB_READ_MAX_MB * 1024 * 1024:
+        with open(path, "rb") as fh:
+            while fh.read(1 << 20):
+                pass
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        requirements = conn.execute("SELECT COUNT(*) FROM requirements").fetchone()[0]
+        mapped = conn.execute("SELECT COUNT(*) FROM faiss_map").fetchone()[0]
+    finally:
+        conn.close()
+    return {"bytes": size, "requirements": requirements, "faiss_map": mapped}
+
+
+def _step_faiss_index() -> Dict[str, Any]:
+    from retrieval.retriever import get_retriever
+
+    retriever = get_retriever()
+    return {"ntotal": retriever.ntotal, "dim": retriever.dim}
+
+
+def _step_embedder() -> Dict[str, Any]:
+    from retrieval.retriever import get_retriever
+
+    qv = get_retriever().embed(WARMUP_QUERY)
+    return {"dim": int(qv.shape[1])}
+
+
+def _step_search() -> Dict[str, Any]:
+    from retrieval.retriever import get_retriever
+
+    return {"hits": len(get_retriever().search(WARMUP_QUERY, k=4))}
+
+
+def _step_tools() -> Dict[str, Any]:
+    from tools import get_tool_overview, load_tools
+
+    get_tool_overview()
+    return {"tools": load_tools()}
+
+
+def _step_templates() -> Dict[str, Any]:
+    from agent.prompt_formatter import load_templates
+
+    return {"templates": sorted(load_templates())}
+
+
+def _step_llm() -> Dict[str, Any]:
+    """Resolve and connect to the LLM server once; any HTTP answer counts as reachable."""
+    import httpx
+
+    from agent.llm_wrapper import LLM_API_URL
+
+    parts = urlsplit(LLM_API_URL)
+    resp = httpx.get(f"{parts.scheme}://{parts.netloc}/", timeout=WARMUP_LLM_TIMEOUT_SEC)
+    return {"url": LLM_API_URL, "http_status": resp.status_code}
+
+
+# name, function, steps that must have succeeded first
+STEPS: List[Tuple[str, Callable[[], Dict[str, Any]], Tuple[str, ...]]] = [
+    ("llm", _step_llm, ()),
+    ("templates", _step_templates, ()),
+    ("sqlite", _step_sqlite, ()),
+    ("tools", _step_tools, ()),
+    ("faiss_index", _step_faiss_index, ()),
+    ("embedder", _step_embedder, ("faiss_index",)),
+    ("search", _step_search, ("embedder", "sqlite")),
+]
+# Steps that don't need the downloaded artifacts (run before waiting for them)
+EARLY_STEPS = ("llm", "templates")
+# Capability each step brings up (see mcp_server/capabilities.py)
+STEP_CAPABILITY = {
+    "llm": "llm",
+    "sqlite": "sqlite",
+    "faiss_index": "vector_index",
+    "embedder": "embedder",
+}
+
+
+def run_warmup(report: WarmupReport = warmup_report,
+               log: Callable[[str], None] = logger.info,
+               only: Optional[Tuple[str, ...]] = None,
+               caps: Capabilities = capabilities) -> WarmupReport:
+    """
+    Run the steps (or just `only`), skipping ones already done; a full run
+    marks the report done.
+    """
+    if report.started_at is None:
+        report.started_at = time.time()
+    for name, fn, needs in STEPS:
+        if (only is not None and name not in only) or report.ok(name):
+            continue
+        cap = STEP_CAPABILITY.get(name)
+        missing = [n for n in needs if not report.ok(n)]
+        if missing:
+            report.record(name, "skipped", 0.0, reason=f"needs {', '.join(missing)}")
+            log(f"{name}: skipped (needs {', '.join(missing)})")
+            if cap:
+                caps.set(cap, UNAVAILABLE, reason=f"needs {', '.join(missing)}")
+            continue
+        if cap:
+            caps.set(cap, LOADING)
+        t0 = time.perf_counter()
+        try:
+            detail = fn() or {}
+        except Exception as e:
+            report.record(name, "error", time.perf_counter() - t0, error=f"{type(e).__name__}: {e}")
+            log(f"{name}: failed after {time.perf_counter() - t0:.2f}s: {e}")
+            if cap:
+                caps.set(cap, UNAVAILABLE, error=f"{type(e).__name__}: {e}")
+            continue
+        report.record(name, "ok", time.perf_counter() - t0, **detail)
+        log(f"{name}: ok in {time.perf_counter() - t0:.2f}s {detail}")
+        if cap:
+            caps.set(cap, READY)
+    if only is None:
+        report.total_sec = round(time.time() - report.started_at, 3)
+        log(f"done in {report.total_sec:.2f}s")
+    return report
@@ -6,6 +6,9 @@ from typing import List, Optional
 
 import os
 
+from telemetry import tracing
+from telemetry.metrics import SQLITE_SECONDS, timed
+
 # Reuse the same env vars/paths you already use for tools/search.py
 def _db_path() -> Path:
     override = (os.getenv("DB_LOCAL_PATH") or os.getenv("SQLITE_DB_PATH") or "").strip()
@@ -14,6 +17,8 @@ def _db_path() -> Path:
     # fallback to repo data/
     return Path(__file__).resolve().parents[1] / "data" / "pci_requirements.db"
 
+@timed(SQLITE_SECONDS, helper="hierarchy.expand")
+@tracing.traced("sqlite.hierarchy.expand")
 def expand_requirement_ids(root_id: str, include_root: bool = True) -> List[str]:
     """
     Returns [root_id, root_id.*] ordered by numeric segments.
@@ -0,0 +1,126 @@
+# retrieval/related.py
+"""
+Precomputed "related requirements" graph.
+
+Every requirement vector is compared with every other one (cosine, as chunked
+matrix products so memory stays at RELATED_CHUNK x N scores), and the top
+RELATED_TOP_M neighbours of each are stored in the SQLite `related` table:
+
+    related(rid, rank, neighbor, score)  PRIMARY KEY (rid, rank), WITHOUT ROWID
+
+The `related` tool then answers with one primary-key range read. The graph is
+written by scripts/build_index.py; for an existing index (no model needed,
+vectors are read back from FAISS):
+
+    python -m retrieval.related --index data/pci_index.faiss --db data/pci_requirements.db
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sqlite3
+import time
+from typing import List, Tuple
+
+import numpy as np
+
+RELATED_TOP_M = int(os.getenv("RELATED_TOP_M", "10"))
+# Rows per matrix product; peak scratch memory is RELATED_CHUNK x N float32
+RELATED_CHUNK = int(os.getenv("RELATED_CHUNK", "1024"))
+
+
+def knn_graph(X: np.ndarray, m: int = RELATED_TOP_M,
+              chunk: int = RELATED_CHUNK) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Top-m cosine neighbours of every row of X (self excluded), best first:
+    (neighbour row indices, scores), both n x min(m, n - 1).
+    """
+    X = np.asarray(X, dtype=np.float32)
+    n = len(X)
+    m = max(0, min(m, n - 1))
+    norms = np.linalg.norm(X, axis=1, keepdims=True)
+    X = X / np.where(norms > 0, norms, 1.0)
+    idx = np.zeros((n, m), dtype=np.int64)
+    scores = np.zeros((n, m), dtype=np.float32)
+    if m == 0:
+        return idx, scores
+    for start in range(0, n, max(1, chunk)):
+        stop = min(start + max(1, chunk), n)
+        block = X[start:stop] @ X.T
+        block[np.arange(stop - start), np.arange(start, stop)] = -np.inf
+        top = np.argpartition(-block, m - 1, axis=1)[:, :m]
+        top_scores = np.take_along_axis(block, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind="stable")
+        idx[start:stop] = np.take_along_axis(top, order, axis=1)
+        scores[start:stop] = np.take_along_axis(top_scores, order, axis=1)
+    return idx, scores
+
+
+def write_related(conn: sqlite3.Connection, rids: List[str],
+                  idx: np.ndarray, scores: np.ndarray) -> int:
+    """Replace the `related` table with the graph; returns the number of edges."""
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS related(
+        rid TEXT NOT NULL,
+        rank INTEGER NOT NULL,
+        neighbor TEXT NOT NULL,
+        score REAL NOT NULL,
+        PRIMARY KEY (rid, rank)
+    ) WITHOUT ROWID
+    """)
+    conn.execute("DELETE FROM related")
+    rows = (
+        (rids[i], rank, rids[j], round(float(s), 4))
+        for i in range(len(rids))
+        for rank, (j, s) in enumerate(zip(idx[i].tolist(), scores[i].tolist()))
+    )
+    conn.executemany("INSERT INTO related(rid, rank, neighbor, score) VALUES(?,?,?,?)", rows)
+    conn.commit()
+    return int(idx.size)
+
+
+def vectors_from_index(index) -> Tuple[np.ndarray, np.ndarray]:
+    """(FAISS ids, stored vectors) for everything in a flat index (IndexIDMap or not)."""
+    import faiss
+
+    if hasattr(index, "id_map"):
+        ids = faiss.vector_to_array(index.id_map).astype(np.int64)
+        base = faiss.downcast_index(index.index)
+    else:
+        ids = np.arange(index.ntotal, dtype=np.int64)
+        base = index
+    return ids, np.asarray(base.reconstruct_n(0, base.ntotal), dtype=np.float32)
+
+
+def build_from_index(index_path: str, db_path: str, m: int = RELATED_TOP_M,
+                     chunk: int = RELATED_CHUNK) -> int:
+    import faiss
+
+    fids, X = vectors_from_index(faiss.read_index(index_path))
+    conn = sqlite3.connect(db_path)
+    try:
+        by_fid = dict(conn.execute("SELECT faiss_id, rid FROM faiss_map").fetchall())
+        keep = [i for i, f in enumerate(fids.tolist()) if f in by_fid]
+        idx, scores = knn_graph(X[keep], m, chunk)
+        return write_related(conn, [by_fid[int(fids[i])] for i in keep], idx, scores)
+    finally:
+        conn.close()
+
+
+def main():
+    ap = argparse.ArgumentParser(
+        description="Build the related-requirements kNN graph from a FAISS index"
+    )
+    ap.add_argument("--index", default=os.getenv("FAISS_INDEX_PATH", "data/pci_index.faiss"))
+    ap.add_argument("--db", default=os.getenv("SQLITE_DB_PATH", "data/pci_requirements.db"))
+    ap.add_argument("--m", type=int, default=RELATED_TOP_M)
+    ap.add_argument("--chunk", type=int, default=RELATED_CHUNK)
+    args = ap.parse_args()
+    t0 = time.perf_counter()
+    edges = build_from_index(args.index, args.db, args.m, args.chunk)
+    print(f"✅ Wrote {edges} related edges to {args.db} in {time.perf_counter() - t0:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
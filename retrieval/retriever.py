@@ -2,11 +2,13 @@ import threading
 import os
 import sqlite3
 from functools import lru_cache
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple
 
-import faiss
 import numpy as np
 
+from telemetry import tracing
+from telemetry.metrics import RETRIEVAL_SECONDS, timed
+
 _index_lock = threading.Lock()
 _embedder_lock = threading.Lock()
 
@@ -21,6 +23,8 @@ def _db_path() -> str:
 
 @lru_cache(maxsize=1)
 def get_index(path: str | None = None):
+    import faiss  # deferred so importing the tools/pipeline stays cheap
+
     p = path or _index_path()
     with _index_lock:
         return faiss.read_index(p)
@@ -43,9 +47,12 @@ def get_embedder():
         model_name = _env("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
         return SentenceTransformer(model_name)
 
+@timed(RETRIEVAL_SECONDS, step="id_map")
+@tracing.traced("sqlite.faiss_map")
 def _map_faiss_ids_to_rids(db_path: str, ids: List[int]) -> Dict[int, str]:
     if not ids:
         return {}
+    tracing.annotate(ids=len(ids))
     conn = sqlite3.connect(db_path)
     try:
         q = ",".join(["?"] * len(ids))
@@ -57,33 +64,169 @@ def _map_faiss_ids_to_rids(db_path: str, ids: List[int]) -> Dict[int, str]:
     finally:
         conn.close()
 
+@timed(RETRIEVAL_SECONDS, step="id_map")
+@tracing.traced("sqlite.faiss_map")
+def _map_rids_to_faiss_ids(db_path: str, rids: List[str]) -> Dict[str, int]:
+    if not rids:
+        return {}
+    tracing.annotate(ids=len(rids))
+    conn = sqlite3.connect(db_path)
+    try:
+        q = ",".join(["?"] * len(rids))
+        rows = conn.execute(
+            f"SELECT rid, faiss_id FROM faiss_map WHERE rid IN ({q})",
+            rids,
+        ).fetchall()
+        return {rid: int(fid) for (rid, fid) in rows}
+    finally:
+        conn.close()
+
 class PCIDocumentRetriever:
     def __init__(self, index_path: str | None = None, db_path: str | None = None):
         self.index = get_index(index_path)
         self.db_path = db_path or _db_path()
         self._dim = self.index.d  # sanity
+        # (flat index, sorted FAISS ids, their positions), built on first get_vectors()
+        self._storage = None
+
+    @property
+    def dim(self) -> int:
+        return int(self._dim)
 
-    def _embed_query(self, q: str) -> np.ndarray:
+    @property
+    def ntotal(self) -> int:
+        return int(self.index.ntotal)
+
+    def _embed_texts(self, texts: List[str]) -> np.ndarray:
         model = get_embedder()
-        v = model.encode([q], normalize_embeddings=True)
-        return v.astype(np.float32)
+        v = model.encode(texts, normalize_embeddings=True, batch_size=max(1, len(texts)))
+        return np.asarray(v, dtype=np.float32).reshape(len(texts), -1)
 
-    def search(self, query: str, k: int = 8) -> List[Dict[str, Any]]:
-        if not query or not query.strip():
-            return []
-        qv = self._embed_query(query.strip())
+    def _check_dim(self, qv: np.ndarray) -> np.ndarray:
         if qv.shape[1] != self._dim:
             # Mismatched index/model ⇒ clear cache and raise
             get_embedder.cache_clear()
             raise RuntimeError(f"Embedding dim {qv.shape[1]} != index dim {self._dim}")
+        return qv
+
+    def embed(self, query: str) -> np.ndarray:
+        """Normalized (1, d) query embedding; validates it against the index dim."""
+        with timed(RETRIEVAL_SECONDS, step="embed"), \
+                tracing.span("embed", query_chars=len(query.strip())):
+            qv = self._embed_texts([query.strip()])
+        return self._check_dim(qv)
+
+    def embed_many(self, texts: List[str]) -> np.ndarray:
+        """Normalized (n, d) embeddings from a single encode() call."""
+        if not texts:
+            return np.zeros((0, self._dim), dtype=np.float32)
+        with timed(RETRIEVAL_SECONDS, step="embed"), tracing.span("embed", queries=len(texts)):
+            qv = self._embed_texts([t.strip() for t in texts])
+        return self._check_dim(qv)
 
-        D, I = self.index.search(qv, k)
-        ids = [int(x) for x in I[0].tolist() if x != -1]
-        if not ids:
+    def _storage_lookup(self):
+        if self._storage is None:
+            import faiss
+
+            if hasattr(self.index, "id_map"):
+                # IndexIDMap can't reconstruct by id: go through the wrapped index by position
+                ids = faiss.vector_to_array(self.index.id_map)
+                base = faiss.downcast_index(self.index.index)
+            else:
+                ids = np.arange(self.index.ntotal, dtype=np.int64)
+                base = self.index
+            order = np.argsort(ids, kind="stable")
+            self._storage = (base, ids[order], order)
+        return self._storage
+
+    def get_vectors(self, rids: List[str]) -> Tuple[List[str], np.ndarray]:
+        """
+        Stored vectors (L2-normalized) for requirement ids, in input order; ids
+        not in the index are dropped. One faiss_map query and one
+        reconstruct_batch(), no model inference.
+        """
+        rids = list(dict.fromkeys(str(r) for r in rids))
+        fids = _map_rids_to_faiss_ids(self.db_path, rids)
+        found = [r for r in rids if r in fids]
+        if not found:
+            return [], np.zeros((0, self._dim), dtype=np.float32)
+        base, sorted_ids, positions = self._storage_lookup()
+        wanted = np.asarray([fids[r] for r in found], dtype=np.int64)
+        at = np.searchsorted(sorted_ids, wanted).clip(max=len(sorted_ids) - 1)
+        present = sorted_ids[at] == wanted
+        found = [r for r, ok in zip(found, present.tolist()) if ok]
+        with timed(RETRIEVAL_SECONDS, step="reconstruct"), \
+                tracing.span("faiss.reconstruct", ids=len(found)):
+            X = np.asarray(base.reconstruct_batch(positions[at[present]]), dtype=np.float32)
+        norms = np.linalg.norm(X, axis=1, keepdims=True)
+        return found, X / np.where(norms > 0, norms, 1.0)
+
+    def search(self, query: str, k: int = 8) -> List[Dict[str, Any]]:
+        if not query or not query.strip():
+            return []
+        return self.search_by_vector(self.embed(query), k=k)
+
+    def search_many(self, queries: List[str], k: int = 8) -> List[List[Dict[str, Any]]]:
+        """One encode() and one index.search() for all queries (blank ones get [])."""
+        live = [i for i, q in enumerate(queries) if q and q.strip()]
+        out: List[List[Dict[str, Any]]] = [[] for _ in queries]
+        if live:
+            hits = self.search_many_by_vectors(self.embed_many([queries[i] for i in live]), k=k)
+            for i, h in zip(live, hits):
+                out[i] = h
+        return out
+
+    def search_by_vector(self, qv: np.ndarray, k: int = 8) -> List[Dict[str, Any]]:
+        return self.search_many_by_vectors(qv[:1], k=k)[0]
+
+    def search_many_by_vectors(self, qv: np.ndarray, k: int = 8) -> List[List[Dict[str, Any]]]:
+        if len(qv) == 0:
             return []
-        by_id = _map_faiss_ids_to_rids(self.db_path, ids)
-        return [{"id": rid} for fid in ids if (rid := by_id.get(fid))]
+        with timed(RETRIEVAL_SECONDS, step="faiss"), \
+                tracing.span("faiss.search", k=k, ntotal=int(self.index.ntotal),
+                             queries=len(qv)) as span:
+            D, I = self.index.search(np.ascontiguousarray(qv, dtype=np.float32), k)
+            span.set(hits=int((I != -1).sum()))
+        rows = [
+            [(int(x), float(d)) for x, d in zip(ids.tolist(), dists.tolist()) if x != -1]
+            for ids, dists in zip(I, D)
+        ]
+        # One SQLite lookup for the whole batch
+        fids = sorted({fid for row in rows for fid, _ in row})
+        by_id = _map_faiss_ids_to_rids(self.db_path, fids)
+        return [
+            [{"id": rid, "score": score} for fid, score in row if (rid := by_id.get(fid))]
+            for row in rows
+        ]
+
+@lru_cache(maxsize=1)
+def get_retriever() -> PCIDocumentRetriever:
+    """
+    In-process retriever, or a client for the shared retrieval sidecar when
+    RETRIEVAL_SIDECAR_SOCKET is set (same interface; see retrieval/sidecar.py).
+    """
+    socket_path = _env("RETRIEVAL_SIDECAR_SOCKET", "")
+    if socket_path:
+        from retrieval.sidecar import SidecarRetriever
+
+        return SidecarRetriever(socket_path)
+    return PCIDocumentRetriever()
+
+def artifact_version() -> str:
+    """
+    Cheap fingerprint of the FAISS index + SQLite DB on disk (mtime/size).
+    Changes whenever start.sh downloads new artifacts or an index rebuild lands.
+    """
+    parts: List[str] = []
+    for p in (_index_path(), _db_path()):
+        try:
+            st = os.stat(p)
+            parts.append(f"{st.st_mtime_ns}:{st.st_size}")
+        except OSError:
+            parts.append("missing")
+    return "|".join(parts)
 
 def clear_caches():
+    get_retriever.cache_clear()
     get_index.cache_clear()
     get_embedder.cache_clear()
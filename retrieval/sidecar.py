@@ -0,0 +1,392 @@
+# retrieval/sidecar.py
+"""
+Optional retrieval sidecar for multi-worker deployments.
+
+One process owns the SentenceTransformer and the FAISS index and serves
+embed/search (and stored-vector lookups) over a Unix socket. Each uvicorn
+worker talks to it through `SidecarRetriever`, which has the same interface as PCIDocumentRetriever
+(`get_retriever()` returns it when RETRIEVAL_SIDECAR_SOCKET is set). Requests
+that arrive within RETRIEVAL_SIDECAR_BATCH_MS of each other are embedded with
+one `encode()` call and searched with one `index.search()`.
+
+    python -m retrieval.sidecar --socket /tmp/pci-retrieval.sock
+    RETRIEVAL_SIDECAR_SOCKET=/tmp/pci-retrieval.sock uvicorn mcp_server.main:app --workers 4
+
+Frame: 8-byte header (JSON length, payload length; big-endian uint32), the
+JSON, then an optional payload of row-major float32 vectors.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import queue
+import socket
+import struct
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from telemetry import tracing
+from telemetry.metrics import RETRIEVAL_SECONDS, timed
+
+logger = logging.getLogger(__name__)
+
+RETRIEVAL_SIDECAR_SOCKET = os.getenv("RETRIEVAL_SIDECAR_SOCKET", "/tmp/pci-retrieval.sock")
+# How long the sidecar waits for more requests before running a batch
+RETRIEVAL_SIDECAR_BATCH_MS = int(os.getenv("RETRIEVAL_SIDECAR_BATCH_MS", "5"))
+RETRIEVAL_SIDECAR_MAX_BATCH = int(os.getenv("RETRIEVAL_SIDECAR_MAX_BATCH", "64"))
+# Client-side; covers the sidecar loading the model on a cold start
+RETRIEVAL_SIDECAR_TIMEOUT_SEC = float(os.getenv("RETRIEVAL_SIDECAR_TIMEOUT_SEC", "60"))
+
+_HEADER = struct.Struct(">II")
+
+
+# ---- Wire format --------------------------------------------------------------
+
+def _pack(meta: Dict[str, Any], vectors: Optional[np.ndarray] = None) -> bytes:
+    payload = b""
+    if vectors is not None:
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        meta = {**meta, "shape": list(vectors.shape)}
+        payload = vectors.tobytes()
+    head = json.dumps(meta).encode("utf-8")
+    return _HEADER.pack(len(head), len(payload)) + head + payload
+
+
+def _unpack(head: bytes, payload: bytes) -> Tuple[Dict[str, Any], Optional[np.ndarray]]:
+    meta = json.loads(head.decode("utf-8"))
+    vectors = None
+    if payload:
+        vectors = np.frombuffer(payload, dtype=np.float32).reshape(meta["shape"])
+    return meta, vectors
+
+
+def _recv_exact(sock: socket.socket, n: int) -> bytes:
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError("retrieval sidecar closed the connection")
+        buf += chunk
+    return bytes(buf)
+
+
+def _recv_frame(sock: socket.socket) -> Tuple[Dict[str, Any], Optional[np.ndarray]]:
+    head_len, payload_len = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    return _unpack(_recv_exact(sock, head_len), _recv_exact(sock, payload_len))
+
+
+async def _read_frame(reader: asyncio.StreamReader) -> Tuple[Dict[str, Any], Optional[np.ndarray]]:
+    head_len, payload_len = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+    return _unpack(await reader.readexactly(head_len), await reader.readexactly(payload_len))
+
+
+# ---- Server -------------------------------------------------------------------
+
+class _Item:
+    __slots__ = ("op", "texts", "vectors", "k", "future")
+
+    def __init__(self, op: str, texts: List[str], vectors: Optional[np.ndarray], k: int,
+                 future: asyncio.Future):
+        self.op = op
+        self.texts = texts
+        self.vectors = vectors
+        self.k = k
+        self.future = future
+
+
+def _check_search(texts: List[str], vectors: Optional[np.ndarray], k: Any) -> None:
+    """Reject a malformed search before it is batched with other clients' requests."""
+    if not texts and (vectors is None or vectors.ndim != 2 or len(vectors) == 0):
+        raise ValueError("search needs texts or a non-empty 2-D array of vectors")
+    if k is not None and int(k) < 1:
+        raise ValueError(f"k must be >= 1, got {k}")
+
+
+class RetrievalSidecar:
+    """Owns the retriever; batches concurrent embed/search requests from all clients."""
+
+    def __init__(self, retriever_factory: Optional[Callable[[], Any]] = None,
+                 batch_ms: int = RETRIEVAL_SIDECAR_BATCH_MS,
+                 max_batch: int = RETRIEVAL_SIDECAR_MAX_BATCH):
+        if retriever_factory is None:
+            from retrieval.retriever import PCIDocumentRetriever
+
+            retriever_factory = PCIDocumentRetriever
+        self._factory = retriever_factory
+        self._retriever = None
+        self._lock = threading.Lock()
+        self.window = max(0, batch_ms) / 1000.0
+        self.max_batch = max(1, max_batch)
+        self._queue: Optional[asyncio.Queue] = None
+        self.requests = 0
+        self.batches = 0
+
+    def retriever(self):
+        # Built on first use (and retried after a failure, e.g. artifacts not there yet)
+        with self._lock:
+            if self._retriever is None:
+                self._retriever = self._factory()
+            return self._retriever
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "loaded": self._retriever is not None,
+            "requests": self.requests,
+            "batches": self.batches,
+            "mean_batch": round(self.requests / self.batches, 2) if self.batches else 0.0,
+        }
+
+    async def submit(self, op: str, texts: List[str], vectors: Optional[np.ndarray], k: int):
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(_Item(op, texts, vectors, k, future))
+        return await future
+
+    async def _batch_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            close_at = loop.time() + self.window
+            while len(batch) < self.max_batch:
+                left = close_at - loop.time()
+                if left <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout=left))
+                except asyncio.TimeoutError:
+                    break
+            self.requests += len(batch)
+            self.batches += 1
+            await self._settle(batch)
+
+    async def _settle(self, batch: List[_Item]) -> None:
+        """Run a batch; if it fails, rerun its items alone so only the bad one errors."""
+        try:
+            results = await asyncio.to_thread(self._run_batch, batch)
+        except Exception as e:
+            if len(batch) > 1:
+                for item in batch:
+                    await self._settle([item])
+                return
+            if not batch[0].future.done():
+                batch[0].future.set_exception(e)
+            return
+        for item, result in zip(batch, results):
+            if not item.future.done():
+                item.future.set_result(result)
+
+    def _run_batch(self, batch: List[_Item]) -> List[Any]:
+        retriever = self.retriever()
+
+        # One encode() for every text in the batch
+        texts = [t for item in batch for t in item.texts]
+        encoded = retriever.embed_many(texts) if texts else None
+        vectors: List[np.ndarray] = []
+        offset = 0
+        for item in batch:
+            if item.texts:
+                vectors.append(encoded[offset:offset + len(item.texts)])
+                offset += len(item.texts)
+            else:
+                vectors.append(item.vectors)
+
+        # One index.search() for every search in the batch, at the largest k
+        searches = [i for i, item in enumerate(batch) if item.op == "search"]
+        hits_by_item: Dict[int, List[List[Dict[str, Any]]]] = {}
+        if searches:
+            k = max(batch[i].k for i in searches)
+            hits = retriever.search_many_by_vectors(np.vstack([vectors[i] for i in searches]), k=k)
+            row = 0
+            for i in searches:
+                n = len(vectors[i])
+                hits_by_item[i] = [h[:batch[i].k] for h in hits[row:row + n]]
+                row += n
+
+        return [
+            hits_by_item[i] if item.op == "search" else vectors[i]
+            for i, item in enumerate(batch)
+        ]
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                try:
+                    meta, vectors = await _read_frame(reader)
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    return
+                try:
+                    writer.write(await self._dispatch(meta, vectors))
+                except Exception as e:
+                    writer.write(_pack({"ok": False, "error": f"{type(e).__name__}: {e}"}))
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def _dispatch(self, meta: Dict[str, Any], vectors: Optional[np.ndarray]) -> bytes:
+        op = meta.get("op")
+        if op == "info":
+            r = await asyncio.to_thread(self.retriever)
+            return _pack({"ok": True, "dim": r.dim, "ntotal": r.ntotal, **self.stats()})
+        if op == "vectors":
+            # Stored vectors: no model, nothing to batch
+            r = await asyncio.to_thread(self.retriever)
+            rids = [str(i) for i in meta.get("ids") or []]
+            ids, vecs = await asyncio.to_thread(r.get_vectors, rids)
+            return _pack({"ok": True, "ids": ids}, vecs)
+        texts = [str(t) for t in meta.get("texts") or []]
+        if op == "embed":
+            return _pack({"ok": True}, await self.submit("embed", texts, None, 0))
+        if op == "search":
+            _check_search(texts, vectors, meta.get("k"))
+            hits = await self.submit("search", texts, vectors, int(meta.get("k") or 8))
+            return _pack({"ok": True, "hits": hits})
+        raise ValueError(f"unknown op {op!r}")
+
+    async def serve(self, path: str, warm: bool = True) -> None:
+        self._queue = asyncio.Queue()
+        if os.path.exists(path):
+            os.unlink(path)
+        server = await asyncio.start_unix_server(self._handle, path=path)
+        batcher = asyncio.create_task(self._batch_loop())
+        logger.info("Retrieval sidecar listening on %s", path)
+        warmer = asyncio.create_task(self._warm()) if warm else None
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+            if warmer is not None:
+                warmer.cancel()
+
+    async def _warm(self) -> None:
+        wait_until = time.monotonic() + int(os.getenv("READINESS_MAX_WAIT_SEC", "600"))
+        while True:
+            t0 = time.perf_counter()
+            try:
+                await self.submit("embed", ["warmup"], None, 0)
+                logger.info("Retrieval sidecar warm in %.2fs", time.perf_counter() - t0)
+                return
+            except Exception as e:
+                if time.monotonic() >= wait_until:
+                    logger.warning("Retrieval sidecar warmup failed: %s", e)
+                    return
+                await asyncio.sleep(2)
+
+
+# ---- Client -------------------------------------------------------------------
+
+class SidecarRetriever:
+    """PCIDocumentRetriever interface backed by the sidecar (thread-safe, pooled sockets)."""
+
+    def __init__(self, socket_path: str = RETRIEVAL_SIDECAR_SOCKET,
+                 timeout: float = RETRIEVAL_SIDECAR_TIMEOUT_SEC):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._pool: "queue.LifoQueue[socket.socket]" = queue.LifoQueue()
+        self._info: Optional[Dict[str, Any]] = None
+
+    def _connect(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        return sock
+
+    def _call(self, meta: Dict[str, Any], vectors: Optional[np.ndarray] = None):
+        try:
+            sock = self._pool.get_nowait()
+        except queue.Empty:
+            sock = self._connect()
+        try:
+            sock.sendall(_pack(meta, vectors))
+            reply, out = _recv_frame(sock)
+        except Exception:
+            sock.close()
+            raise
+        self._pool.put(sock)
+        if not reply.get("ok"):
+            raise RuntimeError(reply.get("error") or "retrieval sidecar error")
+        return reply, out
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def info(self) -> Dict[str, Any]:
+        reply, _ = self._call({"op": "info"})
+        self._info = reply
+        return reply
+
+    @property
+    def dim(self) -> int:
+        return int((self._info or self.info())["dim"])
+
+    @property
+    def ntotal(self) -> int:
+        return int((self._info or self.info())["ntotal"])
+
+    def embed_many(self, texts: List[str]) -> np.ndarray:
+        with timed(RETRIEVAL_SECONDS, step="sidecar"), \
+                tracing.span("sidecar.embed", queries=len(texts)):
+            _, vectors = self._call({"op": "embed", "texts": [t.strip() for t in texts]})
+        return vectors
+
+    def embed(self, query: str) -> np.ndarray:
+        return self.embed_many([query])
+
+    def search_many(self, queries: List[str], k: int = 8) -> List[List[Dict[str, Any]]]:
+        live = [i for i, q in enumerate(queries) if q and q.strip()]
+        out: List[List[Dict[str, Any]]] = [[] for _ in queries]
+        if live:
+            with timed(RETRIEVAL_SECONDS, step="sidecar"), \
+                    tracing.span("sidecar.search", queries=len(live), k=k):
+                texts = [queries[i].strip() for i in live]
+                reply, _ = self._call({"op": "search", "texts": texts, "k": k})
+            for i, hits in zip(live, reply["hits"]):
+                out[i] = hits
+        return out
+
+    def search(self, query: str, k: int = 8) -> List[Dict[str, Any]]:
+        return self.search_many([query], k=k)[0]
+
+    def search_many_by_vectors(self, qv: np.ndarray, k: int = 8) -> List[List[Dict[str, Any]]]:
+        if len(qv) == 0:
+            return []
+        with timed(RETRIEVAL_SECONDS, step="sidecar"), \
+                tracing.span("sidecar.search", queries=len(qv), k=k):
+            reply, _ = self._call({"op": "search", "k": k}, qv)
+        return reply["hits"]
+
+    def search_by_vector(self, qv: np.ndarray, k: int = 8) -> List[Dict[str, Any]]:
+        return self.search_many_by_vectors(qv[:1], k=k)[0]
+
+    def get_vectors(self, rids: List[str]) -> Tuple[List[str], np.ndarray]:
+        with timed(RETRIEVAL_SECONDS, step="sidecar"), \
+                tracing.span("sidecar.vectors", ids=len(rids)):
+            reply, vectors = self._call({"op": "vectors", "ids": [str(r) for r in rids]})
+        if vectors is None:
+            vectors = np.zeros(reply.get("shape") or (0, 0), dtype=np.float32)
+        return reply["ids"], vectors
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Shared embedding/FAISS sidecar")
+    ap.add_argument("--socket", default=RETRIEVAL_SIDECAR_SOCKET)
+    ap.add_argument("--batch-ms", type=int, default=RETRIEVAL_SIDECAR_BATCH_MS)
+    ap.add_argument("--max-batch", type=int, default=RETRIEVAL_SIDECAR_MAX_BATCH)
+    args = ap.parse_args()
+    logging.basicConfig(level=logging.INFO, format="[retrieval-sidecar] %(message)s")
+    sidecar = RetrievalSidecar(batch_ms=args.batch_ms, max_batch=args.max_batch)
+    asyncio.run(sidecar.serve(args.socket))
+
+
+if __name__ == "__main__":
+    main()
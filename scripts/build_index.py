@@ -6,16 +6,22 @@ build_index.py — Build FAISS index from SQLite "requirements" table.
 - Saves index to data/pci_index.faiss.
 - Also creates/refreshes "faiss_map(faiss_id INTEGER PRIMARY KEY, rid TEXT NOT NULL)"
   to map FAISS vector IDs to requirement IDs.
+- Precomputes the related-requirements graph (top-M neighbours of every
+  requirement, retrieval/related.py) into the "related" table.
 
 Usage:
-  python scripts/build_index.py [--model all-MiniLM-L6-v2]
+  python scripts/build_index.py [--model all-MiniLM-L6-v2] [--related-m 10]
 """
 
-import argparse, os, sqlite3, numpy as np, faiss
+import argparse, os, sqlite3, sys, numpy as np, faiss
 from pathlib import Path
 from sentence_transformers import SentenceTransformer
 
 ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from retrieval.related import RELATED_CHUNK, RELATED_TOP_M, knn_graph, write_related  # noqa: E402
+
 DATA = ROOT / "data"
 DB_FILE = DATA / "pci_requirements.db"
 INDEX_FILE = DATA / "pci_index.faiss"
@@ -41,6 +47,8 @@ def ensure_map_table(conn):
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--model", default="all-MiniLM-L6-v2")
+    ap.add_argument("--related-m", type=int, default=RELATED_TOP_M,
+                    help="neighbours stored per requirement")
     args = ap.parse_args()
 
     rows = read_rows()
@@ -67,10 +75,14 @@ def main():
         conn.execute("DELETE FROM faiss_map")
         conn.executemany("INSERT INTO faiss_map(faiss_id, rid) VALUES(?,?)", list(zip(ids.tolist(), [r[0] for r in rows])))
         conn.commit()
+        # Same vectors, all pairs, chunked: no second encode
+        nbr, scores = knn_graph(X, args.related_m, RELATED_CHUNK)
+        edges = write_related(conn, [r[0] for r in rows], nbr, scores)
     finally:
         conn.close()
 
-    print(f"✅ Saved {INDEX_FILE.name} with {len(rows)} vectors. Mapping written to faiss_map.")
+    print(f"✅ Saved {INDEX_FILE.name} with {len(rows)} vectors. Mapping written to faiss_map, "
+          f"{edges} related edges to related.")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+"""
+load_test.py — Load generator for /ask_full, /tools/call and /ask.
+
+- Closed loop (--concurrency N workers back to back) or open loop (--rate R
+  requests/sec, Poisson arrivals) for --duration seconds or --requests total.
+- Realistic question mix: requirement ID lookups, topic searches, smalltalk
+  (--questions id=0.4,topic=0.5,smalltalk=0.1, or your own JSONL file with
+  {"kind": ..., "message": ...} lines).
+- Endpoint mix (--mix ask_full=0.8,tools=0.2,ask=0): ID lookups map to the
+  `get` tool, topics to `search` on /tools/call.
+- Reports throughput, TTFB / TTFT (first answer token) / total latency
+  percentiles, error + 429 rates and, with --server-pid, the server's CPU
+  seconds and peak RSS (from /proc) as JSON.
+
+Usage:
+  python scripts/mock_llm_server.py --port 11434 &
+  LLM_API_URL=http://localhost:11434/api/generate uvicorn mcp_server.main:app --port 8000 &
+  python scripts/load_test.py --url http://localhost:8000 --concurrency 8 --duration 60 \\
+      --server-pid $(pgrep -f "uvicorn mcp_server.main") --out load.json
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+from pathlib import Path
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from agent.tool_call_parser import find_pci_ids  # noqa: E402
+
+ID_QUESTIONS = [
+    "What is requirement 10.2?", "Show me 3.4", "Explain requirement 8.3.6",
+    "what does 12.10 require", "Requirements 1.2 and 1.3", "Tell me about section 6",
+    "What is 11.3.1?", "Show requirement 7.2.1",
+]
+TOPIC_QUESTIONS = [
+    "How should audit logs be protected?", "What are the password length rules?",
+    "Which requirements cover encryption of cardholder data in transit?",
+    "How often must vulnerability scans be run?", "What is required for MFA?",
+    "How do we handle security awareness training?",
+    "What are the rules for storing PAN?", "Firewall configuration review requirements",
+]
+SMALLTALK = ["hello", "thanks", "what can you do?", "hi"]
+BUILTIN = {"id": ID_QUESTIONS, "topic": TOPIC_QUESTIONS, "smalltalk": SMALLTALK}
+PCTS = (50, 90, 95, 99)
+
+
+def parse_weights(spec: str) -> dict:
+    out = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        name, _, w = part.partition("=")
+        out[name.strip()] = float(w or 1)
+    return {k: v for k, v in out.items() if v > 0}
+
+
+def pick(weights: dict, rng: random.Random) -> str:
+    names = list(weights)
+    return rng.choices(names, weights=[weights[n] for n in names])[0]
+
+
+def load_questions(path: str) -> dict:
+    pool = {}
+    for line in Path(path).read_text(encoding="utf-8").splitlines():
+        if line.strip():
+            row = json.loads(line)
+            pool.setdefault(row.get("kind", "topic"), []).append(row["message"])
+    return pool
+
+
+def percentiles(values):
+    if not values:
+        return None
+    vals = sorted(values)
+    out = {f"p{p}": round(vals[min(len(vals) - 1, int(p / 100 * len(vals)))], 4) for p in PCTS}
+    out.update(mean=round(sum(vals) / len(vals), 4), max=round(vals[-1], 4), n=len(vals))
+    return out
+
+
+# ---- one request per endpoint -------------------------------------------------
+
+async def ask_full(client, base, kind, message):
+    r = {"endpoint": "ask_full", "kind": kind}
+    t0 = time.perf_counter()
+    async with client.stream("POST", f"{base}/ask_full", json={"message": message}) as resp:
+        r["status"] = resp.status_code
+        if resp.status_code != 200:
+            await resp.aread()
+            r["total"] = time.perf_counter() - t0
+            return r
+        async for line in resp.aiter_lines():
+            if not line.strip():
+                continue
+            now = time.perf_counter() - t0
+            r.setdefault("ttfb", now)
+            ev = json.loads(line)
+            if ev.get("type") == "token" and ev.get("segment") == "answer":
+                r.setdefault("ttft", now)
+            elif ev.get("type") == "error":
+                r["stream_errors"] = r.get("stream_errors", 0) + 1
+            elif ev.get("degraded"):
+                r["degraded"] = True
+    r["total"] = time.perf_counter() - t0
+    return r
+
+
+async def tools_call(client, base, kind, message):
+    ids = find_pci_ids(message)
+    if ids:
+        body = {"tool_name": "get", "tool_input": {"ids": ids}}
+    else:
+        body = {"tool_name": "search", "tool_input": {"q": message}}
+    r = {"endpoint": "tools", "kind": kind}
+    t0 = time.perf_counter()
+    resp = await client.post(f"{base}/tools/call", json=body)
+    r["total"] = r["ttfb"] = time.perf_counter() - t0
+    r["status"] = resp.status_code
+    if resp.status_code == 200 and resp.json().get("status") == "error":
+        r["stream_errors"] = 1
+    return r
+
+
+async def ask_sse(client, base, kind, message):
+    r = {"endpoint": "ask", "kind": kind}
+    t0 = time.perf_counter()
+    async with client.stream("GET", f"{base}/ask", params={"message": message}) as resp:
+        r["status"] = resp.status_code
+        async for line in resp.aiter_lines():
+            if line.startswith("data:"):
+                r.setdefault("ttft", time.perf_counter() - t0)
+                r.setdefault("ttfb", r["ttft"])
+    r["total"] = time.perf_counter() - t0
+    return r
+
+
+ENDPOINTS = {"ask_full": ask_full, "tools": tools_call, "ask": ask_sse}
+
+
+async def one(client, args, rng, pool, results):
+    endpoint = pick(args.mix, rng)
+    kind = pick({k: w for k, w in args.questions.items() if pool.get(k)}, rng)
+    message = rng.choice(pool[kind])
+    started = time.perf_counter()
+    try:
+        r = await ENDPOINTS[endpoint](client, args.url, kind, message)
+    except Exception as e:  # connection refused, read timeout, ...
+        r = {"endpoint": endpoint, "kind": kind, "status": 0,
+             "error": type(e).__name__, "total": time.perf_counter() - started}
+    r["started"] = started
+    results.append(r)
+
+
+# ---- server resource sampling (/proc) -----------------------------------------
+
+class ProcSampler:
+    """CPU seconds and peak RSS of the server process (Linux /proc)."""
+
+    def __init__(self, pid: int, interval: float = 0.5):
+        self.pid = pid
+        self.interval = interval
+        self.peak_rss_mb = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _cpu_sec(self) -> float:
+        fields = Path(f"/proc/{self.pid}/stat").read_text().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+    def _rss_mb(self) -> float:
+        for line in Path(f"/proc/{self.pid}/status").read_text().splitlines():
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+        return 0.0
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.peak_rss_mb = max(self.peak_rss_mb, self._rss_mb())
+            except OSError:
+                return
+            self._stop.wait(self.interval)
+
+    def start(self):
+        self._cpu0, self._t0 = self._cpu_sec(), time.perf_counter()
+        self._thread.start()
+
+    def stop(self) -> dict:
+        self._stop.set()
+        cpu = self._cpu_sec() - self._cpu0
+        wall = time.perf_counter() - self._t0
+        return {"pid": self.pid, "cpu_sec": round(cpu, 3),
+                "cpu_util": round(cpu / wall, 3) if wall else 0.0,
+                "peak_rss_mb": round(self.peak_rss_mb, 1)}
+
+
+# ---- drivers ----------------------------------------------------------------
+
+def connection_limit(args) -> int:
+    """
+    Client pool size that never makes a request wait for a connection (that
+    wait would be reported as server TTFB/latency). Closed loop: one per
+    worker. Open loop: every request can last up to --timeout, so at most
+    rate * timeout are in flight.
+    """
+    if args.rate:
+        return max(1, math.ceil(args.rate * args.timeout) + 1)
+    return max(1, args.concurrency)
+
+
+async def run(args) -> dict:
+    rng = random.Random(args.seed)
+    pool = load_questions(args.questions_file) if args.questions_file else BUILTIN
+    results = []
+    limits = httpx.Limits(max_connections=connection_limit(args))
+    sampler = ProcSampler(args.server_pid) if args.server_pid else None
+
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        if sampler:
+            sampler.start()
+        t0 = time.perf_counter()
+        stop_at = t0 + args.duration if args.duration else float("inf")
+        budget = args.requests or float("inf")
+
+        if args.rate:
+            # Open loop: arrivals don't wait for responses (exposes queueing)
+            inflight, sent = set(), 0
+            while time.perf_counter() < stop_at and sent < budget:
+                task = asyncio.create_task(one(client, args, rng, pool, results))
+                inflight.add(task)
+                task.add_done_callback(inflight.discard)
+                sent += 1
+                await asyncio.sleep(rng.expovariate(args.rate))
+            if inflight:
+                await asyncio.wait(inflight)
+        else:
+            issued = 0
+
+            async def worker():
+                nonlocal issued
+                while time.perf_counter() < stop_at and issued < budget:
+                    issued += 1
+                    await one(client, args, rng, pool, results)
+
+            await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        wall = time.perf_counter() - t0
+
+        server = {}
+        for path in ("/llm/stats",):
+            try:
+                server[path] = (await client.get(f"{args.url}{path}")).json()
+            except Exception as e:
+                server[path] = {"error": str(e)}
+
+    return report(args, results, wall, sampler.stop() if sampler else None, server)
+
+
+def report(args, results, wall, proc, server) -> dict:
+    def summarize(rows):
+        ok = [r for r in rows if r.get("status") == 200 and not r.get("stream_errors")]
+        return {
+            "requests": len(rows),
+            "ok": len(ok),
+            "throughput_rps": round(len(ok) / wall, 3) if wall else 0.0,
+            "error_rate": round(1 - len(ok) / len(rows), 4) if rows else 0.0,
+            "rejected_429": sum(1 for r in rows if r.get("status") == 429),
+            "transport_errors": sum(1 for r in rows if r.get("status") == 0),
+            "stream_errors": sum(1 for r in rows if r.get("stream_errors")),
+            "degraded": sum(1 for r in rows if r.get("degraded")),
+            "ttfb_sec": percentiles([r["ttfb"] for r in ok if "ttfb" in r]),
+            "ttft_sec": percentiles([r["ttft"] for r in ok if "ttft" in r]),
+            "total_sec": percentiles([r["total"] for r in ok]),
+        }
+
+    by_endpoint = {}
+    for r in results:
+        by_endpoint.setdefault(r["endpoint"], []).append(r)
+    by_kind = {}
+    for r in results:
+        by_kind.setdefault(r["kind"], []).append(r)
+
+    return {
+        "config": {
+            "url": args.url, "concurrency": None if args.rate else args.concurrency,
+            "rate_rps": args.rate or None, "duration_sec": args.duration,
+            "requests": args.requests, "mix": args.mix, "questions": args.questions,
+            "seed": args.seed,
+        },
+        "wall_sec": round(wall, 3),
+        "overall": summarize(results),
+        "by_endpoint": {k: summarize(v) for k, v in sorted(by_endpoint.items())},
+        "by_kind": {k: summarize(v) for k, v in sorted(by_kind.items())},
+        "server_process": proc,
+        "server_stats": server,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Load test the PCI agent API")
+    ap.add_argument("--url", default=os.getenv("MCP_API_URL", "http://localhost:8000"))
+    ap.add_argument("--concurrency", type=int, default=4, help="closed-loop workers")
+    ap.add_argument("--rate", type=float, default=0.0,
+                    help="open-loop arrivals/sec (overrides --concurrency)")
+    ap.add_argument("--duration", type=float, default=30.0, help="seconds (0 = until --requests)")
+    ap.add_argument("--requests", type=int, default=0, help="stop after this many requests")
+    ap.add_argument("--mix", default="ask_full=1",
+                    help="endpoint weights, e.g. ask_full=0.8,tools=0.2,ask=0")
+    ap.add_argument("--questions", default="id=0.4,topic=0.5,smalltalk=0.1",
+                    help="question kind weights")
+    ap.add_argument("--questions-file", default="", help="JSONL of {kind, message}")
+    ap.add_argument("--timeout", type=float, default=120.0)
+    ap.add_argument("--server-pid", type=int, default=0,
+                    help="sample this PID's CPU/RSS from /proc")
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--out", default="", help="write the JSON report here as well")
+    args = ap.parse_args()
+    args.mix = parse_weights(args.mix)
+    args.questions = parse_weights(args.questions)
+    unknown = set(args.mix) - set(ENDPOINTS)
+    if unknown:
+        ap.error(f"unknown endpoints in --mix: {sorted(unknown)}")
+    if not args.duration and not args.requests:
+        ap.error("set --duration or --requests")
+
+    result = asyncio.run(run(args))
+    text = json.dumps(result, indent=2)
+    if args.out:
+        Path(args.out).write_text(text + "\n", encoding="utf-8")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
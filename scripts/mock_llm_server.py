@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+mock_llm_server.py — Deterministic local LLM server for offline benchmarks and load tests.
+
+- Speaks Ollama (/api/generate, NDJSON), OpenAI-compatible (/v1/chat/completions, SSE)
+  and llama.cpp (/completion, SSE), so every LLM_BACKEND can be exercised.
+- Replays scripted responses: the first rule whose regex matches the prompt wins.
+  Without a rule, built-in replies mimic the planner (compact DSL), the answer
+  composer and the smalltalk prompt.
+- Streams at a fixed token rate after a fixed TTFT (+ optional prefill cost per
+  prompt token), so timings are reproducible run to run.
+
+Script file (JSON, all keys optional):
+  {
+    "ttft_ms": 300, "tokens_per_sec": 25, "prefill_ms_per_token": 0.0,
+    "rules": [{"match": "requirement 10\\b", "response": "get:\\"10\\""}]
+  }
+
+Usage:
+  python scripts/mock_llm_server.py [--port 11434] [--script mock.json] [--tps 25] [--ttft-ms 300]
+  LLM_BACKEND=ollama LLM_API_URL=http://localhost:11434/api/generate uvicorn mcp_server.main:app
+"""
+
+import argparse
+import asyncio
+import json
+import re
+import sys
+import time
+from pathlib import Path
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from agent.tool_call_parser import find_pci_ids  # noqa: E402
+
+CONFIG = {"ttft_ms": 300.0, "tokens_per_sec": 25.0, "prefill_ms_per_token": 0.0, "rules": []}
+
+GREETING_RE = re.compile(r"^\s*(hello|hi|hey|thanks|thank you|what can you do\??)[\s!.?]*$", re.I)
+STOP = {"the", "a", "an", "and", "or", "of", "to", "for", "in", "on", "with", "what", "which",
+        "is", "are", "does", "do", "how", "me", "my", "about", "pci", "dss", "requirements",
+        "requirement", "show", "find", "tell", "i", "should", "be"}
+TOKEN_RE = re.compile(r"\s*\S+")
+
+app = FastAPI(title="mock-llm")
+
+
+def _section(prompt: str, header: str, until: str = "") -> str:
+    i = prompt.rfind(header)
+    if i == -1:
+        return ""
+    body = prompt[i + len(header):]
+    if until and until in body:
+        body = body[: body.index(until)]
+    return body.strip()
+
+
+def reply_for(prompt: str) -> str:
+    for rule in CONFIG["rules"]:
+        if re.search(rule.get("match", "$^"), prompt):
+            return rule.get("response", "")
+
+    if "tool router" in prompt:
+        msg = _section(prompt, "User message:")
+        if GREETING_RE.match(msg):
+            return "skip"
+        ids = find_pci_ids(msg)
+        if len(ids) == 1 and re.search(r"\b(relat|similar)", msg, re.IGNORECASE):
+            return f'related:"{ids[0]}"'
+        if len(ids) == 1:
+            return f'get:"{ids[0]}"'
+        if ids:
+            return "get:" + json.dumps(ids)
+        words = [w for w in re.findall(r"[a-z0-9]+", msg.lower()) if w not in STOP]
+        return 'search:"pci dss ' + " ".join(words[:6]) + '"'
+
+    if "Answer Composer" in prompt:
+        obs = _section(prompt, "Observations:", "User question:")
+        reqs = [ln for ln in obs.splitlines() if ln and not ln.startswith(("[", "("))]
+        if not reqs:
+            return "No matching PCI DSS requirements were found in the retrieved materials."
+        lines = []
+        for ln in reqs[:4]:
+            rid, _, rest = ln.partition(" ")
+            text = rest.split(") ", 1)[-1]
+            lines.append(f"- {rid} — {text[:160]}")
+        return f"{reqs[0].split(' ')[0]} is the most relevant requirement.\n" + "\n".join(lines)
+
+    if "small talk" in prompt:
+        return ("Hi! I can look up PCI DSS requirements by ID or topic — "
+                "what would you like to know?")
+
+    return "OK."
+
+
+async def _generate(prompt: str, num_predict: int):
+    """Yields (token, final_stats_or_None) with scripted timing."""
+    t0 = time.perf_counter()
+    prompt_tokens = max(1, len(prompt) // 4)
+    prefill = prompt_tokens * CONFIG["prefill_ms_per_token"] / 1000.0
+    await asyncio.sleep(CONFIG["ttft_ms"] / 1000.0 + prefill)
+    t_first = time.perf_counter()
+
+    tokens = TOKEN_RE.findall(reply_for(prompt))[: max(0, num_predict)]
+    delay = 1.0 / CONFIG["tokens_per_sec"] if CONFIG["tokens_per_sec"] > 0 else 0.0
+    for i, tok in enumerate(tokens):
+        if i:
+            await asyncio.sleep(delay)
+        yield tok, None
+
+    t_end = time.perf_counter()
+    yield "", {
+        "prompt_eval_count": prompt_tokens,
+        "prompt_eval_duration": int((t_first - t0) * 1e9),
+        "eval_count": len(tokens),
+        "eval_duration": int((t_end - t_first) * 1e9),
+        "total_duration": int((t_end - t0) * 1e9),
+    }
+
+
+# ---- Ollama ----------------------------------------------------------------
+
+@app.get("/api/tags")
+def ollama_tags():
+    return {"models": [{"name": "mock"}]}
+
+
+@app.post("/api/generate")
+async def ollama_generate(request: Request):
+    body = await request.json()
+    prompt = body.get("prompt", "")
+    num_predict = int((body.get("options") or {}).get("num_predict", 2048))
+    model = body.get("model", "mock")
+
+    if not body.get("stream", True):
+        text, final = "", {}
+        async for tok, stats in _generate(prompt, num_predict):
+            text += tok
+            final = stats or final
+        return {"model": model, "response": text, "done": True, **final}
+
+    async def stream():
+        async for tok, stats in _generate(prompt, num_predict):
+            if stats is None:
+                yield json.dumps({"model": model, "response": tok, "done": False}) + "\n"
+            else:
+                yield json.dumps({"model": model, "response": "", "done": True, **stats}) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+# ---- OpenAI-compatible ----------------------------------------------------
+
+@app.post("/v1/chat/completions")
+async def openai_chat(request: Request):
+    body = await request.json()
+    prompt = "\n".join(m.get("content", "") for m in body.get("messages", []))
+    num_predict = int(body.get("max_tokens") or 2048)
+
+    if not body.get("stream"):
+        text, final = "", {}
+        async for tok, stats in _generate(prompt, num_predict):
+            text += tok
+            final = stats or final
+        return {
+            "choices": [{"message": {"role": "assistant", "content": text}}],
+            "usage": {"prompt_tokens": final["prompt_eval_count"],
+                      "completion_tokens": final["eval_count"]},
+        }
+
+    async def stream():
+        async for tok, stats in _generate(prompt, num_predict):
+            if stats is None:
+                chunk = {"choices": [{"delta": {"content": tok}}]}
+            else:
+                chunk = {"choices": [], "usage": {"prompt_tokens": stats["prompt_eval_count"],
+                                                   "completion_tokens": stats["eval_count"]}}
+            yield f"data: {json.dumps(chunk)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+
+# ---- llama.cpp --------------------------------------------------------------
+
+def _llamacpp_timings(stats):
+    return {"prompt_n": stats["prompt_eval_count"],
+            "prompt_ms": stats["prompt_eval_duration"] / 1e6,
+            "predicted_n": stats["eval_count"],
+            "predicted_ms": stats["eval_duration"] / 1e6}
+
+
+@app.post("/completion")
+async def llamacpp_completion(request: Request):
+    body = await request.json()
+    prompt = body.get("prompt", "")
+    num_predict = int(body.get("n_predict") or 2048)
+
+    if not body.get("stream"):
+        text, final = "", {}
+        async for tok, stats in _generate(prompt, num_predict):
+            text += tok
+            final = stats or final
+        return {"content": text, "stop": True, "timings": _llamacpp_timings(final)}
+
+    async def stream():
+        async for tok, stats in _generate(prompt, num_predict):
+            if stats is None:
+                chunk = {"content": tok, "stop": False}
+            else:
+                chunk = {"content": "", "stop": True, "timings": _llamacpp_timings(stats)}
+            yield f"data: {json.dumps(chunk)}\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=11434)
+    ap.add_argument("--script", default="", help="JSON file with timing + scripted rules")
+    ap.add_argument("--tps", type=float, default=None, help="tokens per second")
+    ap.add_argument("--ttft-ms", type=float, default=None, help="time to first token")
+    args = ap.parse_args()
+
+    if args.script:
+        CONFIG.update(json.loads(Path(args.script).read_text(encoding="utf-8")))
+    if args.tps is not None:
+        CONFIG["tokens_per_sec"] = args.tps
+    if args.ttft_ms is not None:
+        CONFIG["ttft_ms"] = args.ttft_ms
+
+    print(f"🧪 mock LLM on http://{args.host}:{args.port} "
+          f"(ttft={CONFIG['ttft_ms']}ms, {CONFIG['tokens_per_sec']} tok/s, "
+          f"{len(CONFIG['rules'])} scripted rules)")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,35 +3,15 @@ set -e
 
 mkdir -p /app/data
 
-# ---- Kick off S3 downloads in the background (non-blocking) ----
-if [ -n "${DATA_BUCKET:-}" ] && { [ -n "${FAISS_KEY:-}" ] || [ -n "${DB_KEY:-}" ]; }; then
-  echo "[start] Starting background artifact download from s3://$DATA_BUCKET ..."
-  (
-    python - <<'PY'
-import os, boto3
+# ---- Artifacts ----
+# The app downloads DATA_BUCKET/FAISS_KEY/DB_KEY itself from its warmup thread
+# (mcp_server/artifacts.py: parallel ranged GETs, checksum manifest, ETag cache),
+# so the server starts listening immediately and readiness follows the download.
 
-bucket    = os.environ["DATA_BUCKET"]
-faiss_key = os.environ.get("FAISS_KEY")
-db_key    = os.environ.get("DB_KEY")
-s3 = boto3.client("s3")
-
-def dl(key, dst):
-    if not key:
-        return
-    try:
-        os.makedirs(os.path.dirname(dst), exist_ok=True)
-        print(f"[bg-dl] Downloading s3://{bucket}/{key} -> {dst}", flush=True)
-        s3.download_file(bucket, key, dst)
-        print(f"[bg-dl] Completed: {dst}", flush=True)
-    except Exception as e:
-        print(f"[bg-dl] WARN: failed to download {key}: {e}", flush=True)
-
-dl(faiss_key, "/app/data/pci_index.faiss")
-dl(db_key,   "/app/data/pci_requirements.db")
-PY
-  ) &
-else
-  echo "[start] Skipping S3 download (DATA_BUCKET/FAISS_KEY/DB_KEY not set)."
+# ---- Optional shared retrieval sidecar (one model + index for all workers) ----
+if [ -n "${RETRIEVAL_SIDECAR_SOCKET:-}" ]; then
+  echo "[start] Starting retrieval sidecar on ${RETRIEVAL_SIDECAR_SOCKET}"
+  python -m retrieval.sidecar --socket "${RETRIEVAL_SIDECAR_SOCKET}" &
 fi
 
 # ---- Start API server immediately so health check passes ----
@@ -0,0 +1,271 @@
+# telemetry/metrics.py
+"""
+Minimal in-process metrics rendered in the Prometheus text exposition format.
+
+Counters, gauges and histograms with labels, registered once at import time
+below. No client library needed: /metrics calls `render()`.
+
+    with timed(TOOL_SECONDS, tool="search"):
+        ...
+
+    @timed(SQLITE_SECONDS, helper="get.fetch_many")
+    def fetch_many(...): ...
+"""
+
+from __future__ import annotations
+
+import bisect
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import ContextDecorator
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; covers sub-ms SQLite lookups up to minute-long CPU generations
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelKey = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric(ABC):
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelKey:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {sorted(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def _labelstr(self, key: LabelKey, extra: str = "") -> str:
+        parts = [f'{n}="{_escape(v)}"' for n, v in zip(self.labelnames, key)]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    @abstractmethod
+    def samples(self) -> List[str]:
+        """Exposition lines for every label combination (no HELP/TYPE header)."""
+
+    def render(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", *self.samples()
+        ]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def get(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self):
+        with self._lock:
+            return [
+                f"{self.name}{self._labelstr(k)} {_fmt(v)}" for k, v in sorted(self._values.items())
+            ]
+
+
+class Gauge(_Metric):
+    """Set explicitly, or computed at scrape time from `fn` (unlabelled)."""
+
+    kind = "gauge"
+
+    def __init__(self, name, help, labelnames=(), fn: Optional[Callable[[], float]] = None):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[LabelKey, float] = {}
+        self._fn = fn
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def samples(self):
+        if self._fn is not None:
+            return [f"{self.name} {_fmt(self._fn())}"]
+        with self._lock:
+            return [
+                f"{self.name}{self._labelstr(k)} {_fmt(v)}" for k, v in sorted(self._values.items())
+            ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # per label set: [bucket counts..., +Inf count], sum
+        self._values: Dict[LabelKey, Tuple[List[int], float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * (len(self.buckets) + 1), 0.0)
+            counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    def count(self, **labels: str) -> int:
+        entry = self._values.get(self._key(labels))
+        return sum(entry[0]) if entry else 0
+
+    def samples(self):
+        out: List[str] = []
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                running = 0
+                for bound, n in zip((*self.buckets, math.inf), counts):
+                    running += n
+                    le = 'le="' + _fmt(bound) + '"'
+                    out.append(f"{self.name}_bucket{self._labelstr(key, le)} {running}")
+                out.append(f"{self.name}_sum{self._labelstr(key)} {_fmt(total)}")
+                out.append(f"{self.name}_count{self._labelstr(key)} {running}")
+        return out
+
+
+class timed(ContextDecorator):
+    """Observe elapsed seconds into `histogram` (context manager or decorator)."""
+
+    def __init__(self, histogram: Histogram, **labels: str):
+        self.histogram = histogram
+        self.labels = labels
+
+    def _recreate_cm(self):
+        # fresh timer per decorated call (calls may overlap across threads)
+        return timed(self.histogram, **self.labels)
+
+    def __enter__(self):
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self._t0, **self.labels)
+        return False
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def _counter(name, help, labelnames=()) -> Counter:
+    return REGISTRY.register(Counter(name, help, labelnames))
+
+
+def _histogram(name, help, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, help, labelnames, buckets))
+
+
+def render() -> str:
+    return REGISTRY.render()
+
+
+# ---- Pipeline -----------------------------------------------------------------
+
+PIPELINE_STAGE_SECONDS = _histogram(
+    "pci_pipeline_stage_seconds",
+    "Time spent per /ask_full stage (plan, tools, compose_ttft, compose, total).",
+    ["stage"],
+)
+PIPELINE_REQUESTS = _counter(
+    "pci_pipeline_requests_total",
+    "Pipeline runs by outcome (ok, error, degraded, cancelled, cache_hit).",
+    ["outcome"],
+)
+
+# ---- Tools ----------------------------------------------------------------------
+
+TOOL_SECONDS = _histogram(
+    "pci_tool_call_seconds", "handle_tool_call_async latency per tool.", ["tool", "status"],
+)
+
+# ---- Retrieval / SQLite ---------------------------------------------------------
+
+RETRIEVAL_SECONDS = _histogram(
+    "pci_retrieval_seconds", "PCIDocumentRetriever steps (embed, faiss, id_map).", ["step"],
+)
+SQLITE_SECONDS = _histogram(
+    "pci_sqlite_query_seconds", "SQLite helper latency.", ["helper"],
+)
+
+# ---- LLM (from the backend's final stream chunk) ----------------------------------
+
+LLM_QUEUE_WAIT_SECONDS = _histogram(
+    "pci_llm_queue_wait_seconds", "Time generations waited for an LLM scheduler slot.",
+    ["priority"],
+)
+LLM_REJECTED = _counter(
+    "pci_llm_rejected_total", "Generations rejected by LLM admission control.", ["reason"],
+)
+LLM_GENERATIONS = _counter(
+    "pci_llm_generations_total", "Completed LLM generations.", ["stage"],
+)
+LLM_PROMPT_EVAL_TOKENS = _counter(
+    "pci_llm_prompt_eval_tokens_total", "Prompt tokens evaluated (prompt_eval_count).", ["stage"],
+)
+LLM_PROMPT_EVAL_SECONDS = _counter(
+    "pci_llm_prompt_eval_seconds_total", "Prompt evaluation time (prompt_eval_duration).",
+    ["stage"],
+)
+LLM_EVAL_TOKENS = _counter(
+    "pci_llm_eval_tokens_total", "Generated tokens (eval_count).", ["stage"],
+)
+LLM_EVAL_SECONDS = _counter(
+    "pci_llm_eval_seconds_total", "Generation time (eval_duration).", ["stage"],
+)
+
+
+def record_llm_final(stage: str, final: Dict[str, object]) -> None:
+    """Fold Ollama-style final-chunk stats (durations in ns) into the LLM counters."""
+    LLM_GENERATIONS.inc(stage=stage)
+    LLM_PROMPT_EVAL_TOKENS.inc(float(final.get("prompt_eval_count") or 0), stage=stage)
+    LLM_PROMPT_EVAL_SECONDS.inc(float(final.get("prompt_eval_duration") or 0) / 1e9, stage=stage)
+    LLM_EVAL_TOKENS.inc(float(final.get("eval_count") or 0), stage=stage)
+    LLM_EVAL_SECONDS.inc(float(final.get("eval_duration") or 0) / 1e9, stage=stage)
+
+
+def register_gauge(name: str, help: str, fn: Callable[[], float]) -> Gauge:
+    """Scrape-time gauge, e.g. the LLM scheduler's queue depth."""
+    return REGISTRY.register(Gauge(name, help, fn=fn))
@@ -0,0 +1,306 @@
+# telemetry/tracing.py
+"""
+Lightweight request tracing (no SDK): nested spans tracked with contextvars,
+buffered per trace and exported when the root span ends.
+
+    with trace("ask_full", request_id=rid):        # root; sampling decided here
+        with span("tool.call", tool="search") as s:
+            s.set(k=8)
+
+Context follows asyncio tasks and `asyncio.to_thread`, so spans opened in
+tools, the retriever and SQLite helpers nest under the request automatically.
+Spans that stay open across `yield`s (LLM streams, pipeline stages) use
+`start_span()` / `.end()` instead, which never touches the context.
+
+Export: TRACE_EXPORT=jsonl (one span per line in TRACE_JSONL_PATH) or otlp
+(OTLP/HTTP JSON to TRACE_OTLP_URL), from a background thread.
+"""
+
+from __future__ import annotations
+
+import contextvars
+import functools
+import json
+import logging
+import os
+import queue
+import random
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Fraction of requests traced; 0 disables tracing entirely
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+TRACE_EXPORT = os.getenv("TRACE_EXPORT", "jsonl").strip().lower()
+TRACE_JSONL_PATH = os.getenv("TRACE_JSONL_PATH", "traces.jsonl")
+TRACE_OTLP_URL = os.getenv("TRACE_OTLP_URL", "http://localhost:4318/v1/traces")
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "pci-compliance-agent")
+# Add "trace_id" to the first NDJSON event of sampled /ask_full responses
+TRACE_ID_IN_STREAM = os.getenv("TRACE_ID_IN_STREAM", "false").lower() in ("1", "true", "yes")
+
+_request_id: contextvars.ContextVar[str] = contextvars.ContextVar("request_id", default="")
+_current: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar(
+    "current_span", default=None
+)
+
+
+class Span:
+    def __init__(self, trace: "Trace", name: str, parent_id: str = "", **attrs: Any):
+        self.trace = trace
+        self.name = name
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attrs: Dict[str, Any] = dict(attrs)
+        self.status = "ok"
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+
+    @property
+    def trace_id(self) -> str:
+        return self.trace.trace_id
+
+    def set(self, **attrs: Any) -> "Span":
+        self.attrs.update(attrs)
+        return self
+
+    def error(self, exc: BaseException) -> None:
+        self.status = "error"
+        self.attrs["error"] = f"{type(exc).__name__}: {exc}"
+
+    def end(self) -> None:
+        if not self.end_ns:
+            self.end_ns = time.time_ns()
+            self.trace.add(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id or None,
+            "request_id": self.trace.request_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "status": self.status,
+            "attrs": self.attrs,
+        }
+
+
+class _NoopSpan:
+    """Returned when the request is not sampled; every call is free."""
+
+    trace_id = ""
+    span_id = ""
+
+    def set(self, **_attrs: Any) -> "_NoopSpan":
+        return self
+
+    def error(self, exc: BaseException) -> None:
+        pass
+
+    def end(self) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Trace:
+    def __init__(self, request_id: str = ""):
+        self.trace_id = secrets.token_hex(16)
+        self.request_id = request_id
+        self._spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    def add(self, span: Span) -> None:
+        with self._lock:
+            self._spans.append(span)
+
+    def spans(self) -> List[Span]:
+        with self._lock:
+            return list(self._spans)
+
+
+# ---- API ----------------------------------------------------------------------
+
+def set_request_id(request_id: str) -> None:
+    _request_id.set(request_id)
+
+
+def get_request_id() -> str:
+    return _request_id.get()
+
+
+def current_span() -> Span | _NoopSpan:
+    return _current.get() or NOOP_SPAN
+
+
+def annotate(**attrs: Any) -> None:
+    """Add attributes to the innermost open span (no-op when not tracing)."""
+    current_span().set(**attrs)
+
+
+def start_span(name: str, **attrs: Any) -> Span | _NoopSpan:
+    """Child of the current span that is NOT made current; call `.end()` yourself."""
+    parent = _current.get()
+    if parent is None:
+        return NOOP_SPAN
+    return Span(parent.trace, name, parent.span_id, **attrs)
+
+
+@contextmanager
+def use_span(s: Span | _NoopSpan) -> Iterator[None]:
+    """Make `s` current for a synchronous block (e.g. while creating child tasks)."""
+    if not isinstance(s, Span):
+        yield
+        return
+    token = _current.set(s)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Iterator[Span | _NoopSpan]:
+    s = start_span(name, **attrs)
+    if not isinstance(s, Span):
+        yield s
+        return
+    token = _current.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.error(e)
+        raise
+    finally:
+        _current.reset(token)
+        s.end()
+
+
+def traced(name: str, **attrs: Any):
+    """Decorator form of `span` for synchronous helpers."""
+
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name, **attrs):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return deco
+
+
+@contextmanager
+def trace(name: str, sample_rate: Optional[float] = None,
+          **attrs: Any) -> Iterator[Span | _NoopSpan]:
+    """Root span for one request; the sampling decision covers every child span."""
+    rate = TRACE_SAMPLE_RATE if sample_rate is None else sample_rate
+    if rate <= 0 or random.random() >= rate:
+        yield NOOP_SPAN
+        return
+    t = Trace(request_id=get_request_id())
+    root = Span(t, name, **attrs)
+    token = _current.set(root)
+    try:
+        yield root
+    except BaseException as e:
+        root.error(e)
+        raise
+    finally:
+        _current.reset(token)
+        root.end()
+        _exporter.submit(t)
+
+
+# ---- Export -------------------------------------------------------------------
+
+def _otlp_value(v: Any) -> Dict[str, Any]:
+    if isinstance(v, bool):
+        return {"boolValue": v}
+    if isinstance(v, int):
+        return {"intValue": str(v)}
+    if isinstance(v, float):
+        return {"doubleValue": v}
+    return {"stringValue": str(v)}
+
+
+def to_otlp(t: Trace) -> Dict[str, Any]:
+    spans = []
+    for s in t.spans():
+        attrs = {**s.attrs, "request_id": t.request_id}
+        spans.append({
+            "traceId": s.trace_id,
+            "spanId": s.span_id,
+            **({"parentSpanId": s.parent_id} if s.parent_id else {}),
+            "name": s.name,
+            "startTimeUnixNano": str(s.start_ns),
+            "endTimeUnixNano": str(s.end_ns),
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in attrs.items()],
+            "status": {"code": 2 if s.status == "error" else 1},
+        })
+    return {"resourceSpans": [{
+        "resource": {"attributes": [
+            {"key": "service.name", "value": {"stringValue": TRACE_SERVICE_NAME}},
+        ]},
+        "scopeSpans": [{"scope": {"name": "telemetry.tracing"}, "spans": spans}],
+    }]}
+
+
+class _Exporter:
+    """Single background thread so exporting never blocks a request."""
+
+    def __init__(self) -> None:
+        self._queue: "queue.Queue[Trace]" = queue.Queue(maxsize=1000)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def submit(self, t: Trace) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="trace-export", daemon=True)
+                self._thread.start()
+        try:
+            self._queue.put_nowait(t)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self, timeout: float = 5.0) -> None:
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def _run(self) -> None:
+        while True:
+            t = self._queue.get()
+            try:
+                export(t)
+            except Exception as e:
+                logger.warning("Trace export failed: %s", e)
+            finally:
+                self._queue.task_done()
+
+
+def export(t: Trace) -> None:
+    if TRACE_EXPORT == "otlp":
+        import httpx
+
+        httpx.post(TRACE_OTLP_URL, json=to_otlp(t), timeout=5).raise_for_status()
+        return
+    lines = "".join(json.dumps(s.to_dict(), default=str) + "\n" for s in t.spans())
+    with open(TRACE_JSONL_PATH, "a", encoding="utf-8") as fh:
+        fh.write(lines)
+
+
+_exporter = _Exporter()
+
+
+def flush(timeout: float = 5.0) -> None:
+    """Wait for queued traces to be written (tests, shutdown)."""
+    _exporter.flush(timeout)
@@ -0,0 +1,78 @@
+import numpy as np
+
+from mcp_server.answer_cache import AnswerCache, make_fingerprint
+
+
+def _unit(*xs):
+    v = np.array(xs, dtype=np.float32)
+    return v / np.linalg.norm(v)
+
+
+def test_hit_requires_matching_fingerprint_and_similarity():
+    cache = AnswerCache(maxsize=8, threshold=0.9)
+    fp = make_fingerprint("v1", ["10", "10.2"])
+    events = [{"type": "stage", "label": "Answer"}, {"type": "token", "text": "x"}]
+    cache.store(_unit(1, 0, 0), fp, events)
+
+    hit = cache.lookup(_unit(1, 0.1, 0), make_fingerprint("v1", ["10.2", "10"]))
+    assert hit is not None and hit.events == events and hit.similarity > 0.9
+
+    assert cache.lookup(_unit(0, 1, 0), fp) is None  # too far
+    assert cache.lookup(_unit(1, 0, 0), make_fingerprint("v2", ["10", "10.2"])) is None
+    assert cache.lookup(_unit(1, 0, 0), make_fingerprint("v1", ["11"])) is None
+    assert (cache.hits, cache.misses) == (1, 3)
+
+
+def test_lru_eviction_keeps_recently_used():
+    cache = AnswerCache(maxsize=2, threshold=0.99)
+    fp = make_fingerprint("v1", ["1"])
+    cache.store(_unit(1, 0), fp, [{"type": "token", "text": "a"}])
+    cache.store(_unit(0, 1), fp, [{"type": "token", "text": "b"}])
+    assert cache.lookup(_unit(1, 0), fp) is not None
+    cache.store(_unit(1, 1), fp, [{"type": "token", "text": "c"}])
+
+    assert cache.lookup(_unit(0, 1), fp) is None
+    assert cache.lookup(_unit(1, 0), fp).events[0]["text"] == "a"
+    assert cache.stats()["size"] == 2
+
+
+def test_probe_hits_feed_the_speculative_search(monkeypatch):
+    import asyncio
+
+    from mcp_server import speculation
+    from tools import search
+
+    class FakeRetriever:
+        def __init__(self):
+            self.embeds = 0
+            self.searches = []
+
+        def embed(self, query):
+            self.embeds += 1
+            return np.ones((1, 2), dtype=np.float32)
+
+        def search_by_vector(self, qv, k=8):
+            self.searches.append(k)
+            return [{"id": f"1.{i}", "score": 1.0 - i / 10} for i in range(k)]
+
+    def searched_again(*_args):
+        raise AssertionError("speculative search re-embedded the message")
+
+    fake = FakeRetriever()
+    monkeypatch.setattr(speculation, "get_retriever", lambda: fake)
+    monkeypatch.setattr(search, "_ann_search_many", searched_again)
+    monkeypatch.setattr(search, "_enrich_with_sqlite", lambda ids: {})
+
+    probe = speculation.probe_message("how are logs reviewed?")
+    assert fake.embeds == 1 and fake.searches == [max(speculation.ANSWER_CACHE_ID_K, search.DEFAULT_K)]
+
+    async def speculate():
+        spec = speculation.Speculation()
+        spec.start("how are logs reviewed?", probe.hits)
+        task = spec.take("search", {"q": "How are logs reviewed?"})
+        return await task
+
+    result = asyncio.run(speculate())
+    assert result["status"] == "success" and result["meta"]["source"] == "faiss"
+    assert [r["id"] for r in result["result"]] == [f"1.{i}" for i in range(search.DEFAULT_K)]
+    assert fake.embeds == 1 and len(fake.searches) == 1
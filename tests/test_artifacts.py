@@ -0,0 +1,77 @@
+import hashlib
+import io
+import json
+
+import pytest
+
+from mcp_server import artifacts
+
+
+class FakeS3:
+    """In-memory stand-in for the boto3 S3 client calls used by artifacts.py."""
+
+    def __init__(self, objects):
+        self.objects = objects
+        self.ranged_gets = 0
+        self.fail_parts = set()
+
+    def _etag(self, key):
+        return '"' + hashlib.md5(self.objects[key]).hexdigest() + '"'
+
+    def head_object(self, Bucket, Key):
+        return {"ETag": self._etag(Key), "ContentLength": len(self.objects[Key])}
+
+    def get_object(self, Bucket, Key, Range=None, IfMatch=None):
+        data = self.objects[Key]
+        if IfMatch is not None:
+            assert IfMatch == self._etag(Key)
+        if Range:
+            start, end = (int(x) for x in Range[len("bytes="):].split("-"))
+            if (Key, start) in self.fail_parts:
+                raise ConnectionError("reset")
+            self.ranged_gets += 1
+            data = data[start:end + 1]
+        return {"Body": io.BytesIO(data)}
+
+
+def test_parallel_download_cache_and_resume(tmp_path):
+    index, db = bytes(range(256)) * 40, b"sqlite" * 1000
+    s3 = FakeS3({"pci_index.faiss": index, "pci_requirements.db": db})
+    s3.objects["manifest.json"] = json.dumps({
+        "pci_index.faiss": {"sha256": hashlib.sha256(index).hexdigest(), "size": len(index)},
+    }).encode()
+    files = {"pci_index.faiss": str(tmp_path / "idx"), "pci_requirements.db": str(tmp_path / "db")}
+
+    # First part of the index fails: the DB still lands, the index stays partial
+    s3.fail_parts = {("pci_index.faiss", 0)}
+    res = artifacts.download_artifacts(files, client=s3, bucket="b", manifest_key="manifest.json",
+                                       part_size=1024)
+    assert res["pci_index.faiss"]["status"] == "error"
+    assert res["pci_requirements.db"]["status"] == "downloaded"
+    assert not (tmp_path / "idx").exists()
+
+    # Restart resumes: only the missing part is fetched again
+    s3.fail_parts, s3.ranged_gets = set(), 0
+    res = artifacts.download_artifacts(files, client=s3, bucket="b", manifest_key="manifest.json",
+                                       part_size=1024)
+    assert res["pci_index.faiss"]["status"] == "downloaded"
+    assert s3.ranged_gets == 1
+    assert (tmp_path / "idx").read_bytes() == index
+    assert res["pci_requirements.db"]["status"] == "cached"
+
+    # Changed object -> new ETag -> downloaded again
+    s3.objects["pci_requirements.db"] = b"v2"
+    res = artifacts.download_artifacts(files, client=s3, bucket="b", part_size=1024)
+    assert res["pci_requirements.db"]["status"] == "downloaded"
+    assert (tmp_path / "db").read_bytes() == b"v2"
+
+
+def test_checksum_mismatch_is_rejected(tmp_path):
+    s3 = FakeS3({"k": b"payload", "m": json.dumps({"k": {"sha256": "0" * 64}}).encode()})
+    dst = tmp_path / "out"
+    with pytest.raises(artifacts.ArtifactError):
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(2) as pool:
+            artifacts.download_file(s3, "b", "k", str(dst), pool, expected={"sha256": "0" * 64})
+    assert not dst.exists()
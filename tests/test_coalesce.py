@@ -0,0 +1,24 @@
+from mcp_server.coalesce import TokenCoalescer
+
+
+def tok(text, segment="answer"):
+    return {"type": "token", "segment": segment, "text": text}
+
+
+def test_merges_tokens_and_flushes_before_other_events():
+    c = TokenCoalescer(window_ms=50, max_bytes=1000)
+    assert c.add(tok("Hello")) == []
+    assert c.add(tok(" world")) == []
+    assert c.time_to_flush() is not None
+
+    out = c.add({"type": "stage", "label": "Answer"})
+    assert out == [tok("Hello world"), {"type": "stage", "label": "Answer"}]
+    assert c.time_to_flush() is None
+
+
+def test_segment_change_and_byte_threshold_flush():
+    c = TokenCoalescer(window_ms=50, max_bytes=8)
+    assert c.add(tok("plan\n", "materials")) == []
+    assert c.add(tok("Hi")) == [tok("plan\n", "materials")]
+    assert c.add(tok(" there!")) == [tok("Hi there!")]
+    assert c.flush() == []
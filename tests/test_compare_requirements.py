@@ -0,0 +1,63 @@
+import sqlite3
+
+import numpy as np
+import pytest
+
+from agent.models.requirement import RequirementEntry
+from tools import compare_requirements
+
+faiss = pytest.importorskip("faiss")
+
+from retrieval.retriever import PCIDocumentRetriever  # noqa: E402
+
+
+@pytest.fixture
+def retriever(tmp_path):
+    """IndexIDMap with non-contiguous ids, un-normalized vectors and a faiss_map table."""
+    rids = ["10.2", "10.2.1", "3.4"]
+    fids = np.array([7, 3, 11], dtype=np.int64)
+    X = np.array([[2.0, 0.0, 0.0], [1.0, 1.0, 0.0], [0.0, 0.0, 5.0]], dtype=np.float32)
+    index = faiss.IndexIDMap(faiss.IndexFlatIP(3))
+    index.add_with_ids(X, fids)
+    faiss.write_index(index, str(tmp_path / "i.faiss"))
+    db = tmp_path / "r.db"
+    with sqlite3.connect(db) as conn:
+        conn.execute("CREATE TABLE faiss_map(faiss_id INTEGER PRIMARY KEY, rid TEXT NOT NULL)")
+        conn.executemany("INSERT INTO faiss_map VALUES(?,?)", zip(fids.tolist(), rids))
+    from retrieval import retriever as retriever_module
+
+    retriever_module.get_index.cache_clear()
+    yield PCIDocumentRetriever(str(tmp_path / "i.faiss"), str(db))
+    retriever_module.get_index.cache_clear()
+
+
+def test_get_vectors_reconstructs_stored_vectors(retriever):
+    ids, vecs = retriever.get_vectors(["3.4", "missing", "10.2.1"])
+    assert ids == ["3.4", "10.2.1"]
+    assert np.allclose(vecs, [[0, 0, 1], [2 ** -0.5, 2 ** -0.5, 0]], atol=1e-6)
+
+
+def test_compare_returns_matrix_pairs_and_tags(retriever, monkeypatch):
+    texts = {
+        "10.2": RequirementEntry(id="10.2", text="Audit logs", tags=["logging", "monitoring"]),
+        "10.2.1": RequirementEntry(id="10.2.1", text="Log user access", tags=["logging"]),
+        "3.4": RequirementEntry(id="3.4", text="Render PAN unreadable",
+                                tags=["logging", "encryption"]),
+    }
+    monkeypatch.setattr(compare_requirements, "get_retriever", lambda: retriever)
+    monkeypatch.setattr(compare_requirements, "fetch_many",
+                        lambda ids: {i: texts[i] for i in ids if i in texts})
+
+    out = compare_requirements.run({"ids": ["10.2", "10.2.1", "3.4", "9.9"]})
+
+    assert out.status == "success"
+    assert [e.id for e in out.result] == ["10.2", "10.2.1", "3.4"]
+    sim = np.array(out.meta["similarity"])
+    assert np.allclose(np.diag(sim), 1.0) and np.allclose(sim, sim.T)
+    assert sim[0, 1] == pytest.approx(2 ** -0.5, abs=1e-4) and sim[0, 2] == 0.0
+    assert out.meta["most_similar"][0] == {
+        "a": "10.2", "b": "10.2.1", "score": pytest.approx(0.7071, abs=1e-4)
+    }
+    assert out.meta["shared_tags"] == ["logging"]
+    assert out.meta["differing_tags"] == {"10.2": ["monitoring"], "3.4": ["encryption"]}
+    assert out.meta["missing"] == ["9.9"]
@@ -0,0 +1,30 @@
+import asyncio
+
+import pytest
+
+from mcp_server.deadline import Deadline, iter_until
+
+
+def test_stage_budgets_split_what_is_left():
+    d = Deadline(10)
+    assert d.stage_budget("plan") == pytest.approx(3.0, abs=0.05)
+    # tools get 0.2 / (0.2 + 0.5) of the remainder, compose gets all of it
+    assert d.stage_budget("tools") == pytest.approx(10 * 0.2 / 0.7, abs=0.05)
+    assert d.stage_budget("compose") == pytest.approx(10, abs=0.05)
+
+
+def test_iter_until_stops_a_slow_stream():
+    async def slow():
+        for i in range(100):
+            await asyncio.sleep(0.02)
+            yield i
+
+    async def scenario():
+        got = []
+        with pytest.raises(TimeoutError):
+            async for item in iter_until(slow(), 0.1):
+                got.append(item)
+        return got
+
+    got = asyncio.run(scenario())
+    assert 0 < len(got) < 10
@@ -0,0 +1,81 @@
+import asyncio
+import json
+
+from mcp_server import pipeline, streaming
+from mcp_server.plan_cache import PlanCache
+
+
+class FakeRequest:
+    def __init__(self, gone: asyncio.Event):
+        self.gone = gone
+
+    async def is_disconnected(self):
+        return self.gone.is_set()
+
+
+def _encode(event):
+    return json.dumps(event) + "\n"
+
+
+def test_disconnect_cancels_pipeline_and_closes_llm_stream(monkeypatch):
+    monkeypatch.setattr(streaming, "DISCONNECT_POLL_SEC", 0.01)
+    monkeypatch.setattr(pipeline, "probe_message", lambda message: None)
+    plans = PlanCache()
+    plans.put("hello there", {"skip": True})  # smalltalk path: straight to one LLM stream
+    monkeypatch.setattr(pipeline, "plan_cache", plans)
+    state = {"closed": False}
+
+    async def scenario():
+        gone = asyncio.Event()
+
+        async def fake_query_llm(prompt, stream=True, **kwargs):
+            state["producer"] = asyncio.current_task()
+
+            async def tokens():
+                try:
+                    yield "Hi"
+                    gone.set()  # the client drops after the first token
+                    while True:
+                        await asyncio.sleep(1)
+                        yield "."
+                finally:
+                    state["closed"] = True
+
+            return tokens()
+
+        monkeypatch.setattr(pipeline, "query_llm", fake_query_llm)
+        stream = streaming.stream_until_disconnect(
+            FakeRequest(gone), pipeline.run_full_pipeline("hello there"), _encode
+        )
+        return [chunk async for chunk in stream]
+
+    cancelled_before = pipeline.cancellation_stats.cancelled
+    chunks = asyncio.run(asyncio.wait_for(scenario(), 5))
+
+    assert any('"Hi"' in c for c in chunks) and not any('"."' in c for c in chunks)
+    assert state["producer"].cancelled()
+    assert state["closed"]
+    assert pipeline.cancellation_stats.cancelled == cancelled_before + 1
+
+
+def test_slow_client_applies_backpressure(monkeypatch):
+    monkeypatch.setattr(streaming, "STREAM_QUEUE_SIZE", 2)
+    produced = []
+
+    async def items():
+        for i in range(50):
+            produced.append(i)
+            yield {"type": "token", "text": str(i)}
+
+    async def scenario():
+        stream = streaming.stream_until_disconnect(FakeRequest(asyncio.Event()), items(), _encode)
+        first = await stream.__anext__()
+        await asyncio.sleep(0.05)  # client stalls; the producer may only fill the queue
+        ahead = len(produced)
+        rest = [chunk async for chunk in stream]
+        return first, ahead, rest
+
+    first, ahead, rest = asyncio.run(scenario())
+    assert '"0"' in first
+    assert ahead <= 1 + 2 + 1  # consumed + queued + the one blocked in put()
+    assert len(rest) == 49 and len(produced) == 50
@@ -0,0 +1,106 @@
+import asyncio
+import json
+
+import pytest
+
+from mcp_server.jobs import (
+    JobManager,
+    _job_lock,
+    parse_questions,
+    read_new_results,
+    read_results,
+    run_questions,
+)
+
+
+async def fake_pipeline(message, deadline):
+    yield {"type": "info", "message": "Plan cache miss", "plan_cache": {"hit": False}}
+    yield {"type": "stage", "label": "Routing"}
+    yield {"type": "stage", "label": "Tools"}
+    yield {"type": "token", "segment": "materials", "text": "3.4.1 ...\n"}
+    yield {"type": "stage", "label": "Answer"}
+    if "fail" in message:
+        yield {"type": "error", "stage": "llm_followup", "message": "boom"}
+        return
+    yield {"type": "token", "segment": "answer", "text": "Answer to "}
+    yield {"type": "token", "segment": "answer", "text": message}
+
+
+def test_parse_questions_accepts_strings_and_extra_fields():
+    qs = parse_questions(
+        ['{"id": "a", "question": "q1", "expected": "x"}', "", '"q2"', '{"message": "q3"}']
+    )
+    assert qs == [
+        {"id": "a", "question": "q1", "expected": "x"},
+        {"id": "3", "question": "q2"},
+        {"id": "4", "question": "q3"},
+    ]
+    with pytest.raises(ValueError, match="line 2"):
+        parse_questions(['"ok"', '{"id": 1}'])
+
+
+def test_run_questions_records_stage_timings_and_resumes(tmp_path):
+    out = str(tmp_path / "results.jsonl")
+    questions = parse_questions(['"q1"', '"q2"', '"please fail"'])
+    # A previous run answered q1 and was killed mid-write of the next line
+    with open(out, "w") as fh:
+        fh.write(json.dumps({"id": "1", "status": "ok"}) + "\n" + '{"id": "2", "sta')
+
+    summary = asyncio.run(run_questions(questions, out, concurrency=2, pipeline=fake_pipeline))
+    assert summary["skipped"] == 1 and summary["answered"] == 2 and summary["error"] == 1
+
+    records = {r["id"]: r for r in read_results(out)}
+    assert set(records) == {"1", "2", "3"}
+    assert records["2"]["answer"] == "Answer to q2"
+    assert records["2"]["materials"] == "3.4.1 ...\n"
+    assert set(records["2"]["timings"]) >= {
+        "plan_sec", "tools_sec", "compose_sec", "compose_ttft_sec", "total_sec"
+    }
+    assert records["3"]["status"] == "error"
+    assert records["3"]["errors"] == [{"stage": "llm_followup", "message": "boom"}]
+
+
+def test_job_manager_runs_and_reloads_jobs(tmp_path):
+    async def go():
+        manager = JobManager(str(tmp_path), pipeline=fake_pipeline)
+        job = manager.submit('{"id": "x", "question": "hello"}\n"second"\n', concurrency=2)
+        await job.task
+        return job
+
+    job = asyncio.run(go())
+    snap = job.snapshot()
+    assert snap["status"] == "done" and snap["answered"] == 2 and snap["ok"] == 2
+    assert "total_sec" in snap["mean_timings"]
+
+    reloaded = JobManager(str(tmp_path))
+    reloaded.load()
+    assert reloaded.jobs[job.id].snapshot()["answered"] == 2
+    assert reloaded.resume_all() == []
+
+
+def test_readers_never_cut_a_line_being_written(tmp_path):
+    out = tmp_path / "results.jsonl"
+    out.write_text(json.dumps({"id": "1"}) + "\n" + '{"id": "2", "sta')
+    assert [r["id"] for r in read_results(str(out))] == ["1"]
+    assert out.read_text().endswith('{"id": "2", "sta')
+
+    _, pos = read_new_results(str(out))
+    with open(out, "a") as fh:
+        fh.write('tus": "ok"}\n')
+    assert read_new_results(str(out), pos) == ([{"id": "2", "status": "ok"}], out.stat().st_size)
+
+
+def test_job_held_by_another_process_is_not_run_here(tmp_path):
+    async def go():
+        manager = JobManager(str(tmp_path), pipeline=fake_pipeline)
+        job = manager.submit('"hello"\n')
+        await job.task
+        job.meta["status"] = "running"
+        with _job_lock(job.dir) as owned:
+            assert owned
+            manager.start(job)
+            await job.task
+        return job
+
+    job = asyncio.run(go())
+    assert job.meta["status"] == "running"
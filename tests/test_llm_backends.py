@@ -0,0 +1,121 @@
+import pytest
+
+from agent.llm_backends import LLMBackend, make_backend
+
+# Streams in each server's wire format, as the servers send them (ids/timestamps shortened)
+_OLLAMA = '{"model":"qwen2.5:7b-instruct","created_at":"2025-01-01T00:00:00Z",'
+OLLAMA_NDJSON = [
+    _OLLAMA + '"response":"get","done":false}',
+    _OLLAMA + '"response":":\\"10.2\\"","done":false}',
+    _OLLAMA + '"response":"","done":true,'
+    '"done_reason":"stop","total_duration":912000000,"load_duration":1200000,'
+    '"prompt_eval_count":37,"prompt_eval_duration":85000000,'
+    '"eval_count":6,"eval_duration":640000000}',
+]
+
+_CHUNK = '{"id":"c1","object":"chat.completion.chunk","created":1,"model":"m","choices":'
+OPENAI_SSE = [
+    "data: " + _CHUNK + '[{"index":0,"delta":{"role":"assistant"},"finish_reason":null}]}',
+    "",
+    "data: " + _CHUNK + '[{"index":0,"delta":{"content":"Audit"},"finish_reason":null}]}',
+    ": keep-alive",
+    "data: " + _CHUNK + '[{"index":0,"delta":{"content":" logs"},"finish_reason":null}]}',
+    "data: " + _CHUNK + '[{"index":0,"delta":{},"finish_reason":"stop"}]}',
+    "data: " + _CHUNK + '[],"usage":{"prompt_tokens":412,"completion_tokens":2,"total_tokens":414,'
+    '"prompt_tokens_details":{"cached_tokens":384}}}',
+    "data: [DONE]",
+]
+
+LLAMACPP_SSE = [
+    'data: {"content":"Audit","stop":false,"id_slot":0,"multimodal":false,"index":0}',
+    'data: {"content":" logs","stop":false,"id_slot":0,"multimodal":false,"index":0}',
+    'data: {"content":"","id_slot":0,"stop":true,"model":"qwen2.5-7b","tokens_predicted":2,'
+    '"tokens_evaluated":412,"stop_type":"eos","stopping_word":"","tokens_cached":413,'
+    '"timings":{"cache_n":384,"prompt_n":28,"prompt_ms":61.5,"prompt_per_token_ms":2.2,'
+    '"predicted_n":2,"predicted_ms":48.0,"predicted_per_token_ms":24.0}}',
+]
+
+
+def _consume(backend, lines):
+    """What llm_wrapper's stream loop does: tokens plus every final stats dict."""
+    tokens, finals = [], []
+    for line in lines:
+        if not line:
+            continue
+        token, final = backend.parse_line(line)
+        if token:
+            tokens.append(token)
+        if final is not None:
+            finals.append(final)
+    final = backend.end_of_stream()
+    if final is not None:
+        finals.append(final)
+    return "".join(tokens), finals
+
+
+@pytest.mark.parametrize("name, lines, text, expected", [
+    ("ollama", OLLAMA_NDJSON, 'get:"10.2"',
+     {"prompt_eval_count": 37, "prompt_eval_duration": 85_000_000, "eval_count": 6}),
+    ("openai", OPENAI_SSE, "Audit logs",
+     {"prompt_eval_count": 28, "prompt_cached_count": 384, "eval_count": 2}),
+    ("llamacpp", LLAMACPP_SSE, "Audit logs",
+     {"prompt_eval_count": 28, "prompt_cached_count": 384, "prompt_eval_duration": 61_500_000,
+      "eval_count": 2, "eval_duration": 48_000_000}),
+])
+def test_stream_parsing(name, lines, text, expected):
+    got_text, finals = _consume(make_backend(name, model="m"), lines)
+    assert got_text == text
+    assert len(finals) == 1
+    assert {k: finals[0].get(k) for k in expected} == expected
+
+
+@pytest.mark.parametrize("tail", [
+    ["data: [DONE]"],  # include_usage ignored
+    [],                # ... and no [DONE] either: finish_reason is enough
+])
+def test_openai_final_without_usage_chunk(tail):
+    lines = [line for line in OPENAI_SSE if "usage" not in line and "[DONE]" not in line] + tail
+    text, finals = _consume(make_backend("openai", model="m"), lines)
+    assert text == "Audit logs"
+    assert len(finals) == 1 and finals[0]["done"] is True
+    assert finals[0]["prompt_eval_count"] is None
+
+
+@pytest.mark.parametrize("name, body, text, expected", [
+    ("ollama", {"response": "OK.", "done": True, "prompt_eval_count": 5, "eval_count": 1},
+     "OK.", {"prompt_eval_count": 5, "eval_count": 1}),
+    ("openai", {"choices": [{"message": {"role": "assistant", "content": "OK."}}],
+                "usage": {"prompt_tokens": 5, "completion_tokens": 1}},
+     "OK.", {"prompt_eval_count": 5, "prompt_cached_count": None, "eval_count": 1}),
+    ("llamacpp", {"content": "OK.", "stop": True, "timings": {"prompt_n": 5, "predicted_n": 1}},
+     "OK.", {"prompt_eval_count": 5, "eval_count": 1}),
+])
+def test_parse_response(name, body, text, expected):
+    got_text, stats = make_backend(name, model="m").parse_response(body)
+    assert got_text == text
+    assert {k: stats.get(k) for k in expected} == expected
+
+
+def test_build_payload_maps_ollama_options():
+    opts = {"temperature": 0.0, "num_predict": 16, "stop": ["\n"]}
+
+    ollama = make_backend("ollama", model="m", keep_alive="30m").build_payload("p", True, opts)
+    assert ollama == {
+        "model": "m", "prompt": "p", "stream": True, "options": opts, "keep_alive": "30m",
+    }
+
+    openai = make_backend("openai", model="m").build_payload("p", True, opts)
+    assert openai["messages"] == [{"role": "user", "content": "p"}]
+    assert (openai["max_tokens"], openai["temperature"], openai["stop"]) == (16, 0.0, ["\n"])
+    assert openai["stream_options"] == {"include_usage": True}
+    assert "stream_options" not in make_backend("openai").build_payload("p", False, opts)
+
+    llamacpp = make_backend("llamacpp").build_payload("p", False, opts)
+    assert (llamacpp["n_predict"], llamacpp["cache_prompt"], llamacpp["stop"]) == (16, True, ["\n"])
+
+
+def test_backend_interface_is_abstract():
+    with pytest.raises(TypeError):
+        LLMBackend("http://x", "m")  # pylint: disable=abstract-class-instantiated
+    with pytest.raises(ValueError):
+        make_backend("nope")
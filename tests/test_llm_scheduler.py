@@ -0,0 +1,52 @@
+import asyncio
+
+import pytest
+
+from agent.llm_scheduler import (
+    PRIORITY_COMPOSE,
+    PRIORITY_PLAN,
+    LLMOverloaded,
+    LLMScheduler,
+)
+
+
+def test_planner_calls_are_served_before_composer_calls():
+    async def scenario():
+        sched = LLMScheduler(max_concurrency=1, max_queue=8, max_wait_sec=5, service_time_sec=0.1)
+        order = []
+
+        async def job(name, priority):
+            async with sched.slot(priority):
+                order.append(name)
+                await asyncio.sleep(0.01)
+
+        async with sched.slot(PRIORITY_PLAN):
+            tasks = [
+                asyncio.create_task(job("compose-1", PRIORITY_COMPOSE)),
+                asyncio.create_task(job("compose-2", PRIORITY_COMPOSE)),
+                asyncio.create_task(job("plan", PRIORITY_PLAN)),
+            ]
+            await asyncio.sleep(0.01)
+            assert sched.stats()["queue_depth"] == 3
+        await asyncio.gather(*tasks)
+        return order, sched.stats()
+
+    order, stats = asyncio.run(scenario())
+    assert order == ["plan", "compose-1", "compose-2"]
+    assert stats["active"] == 0 and stats["admitted"] == 4
+
+
+def test_rejects_fast_when_expected_wait_exceeds_deadline():
+    async def scenario():
+        sched = LLMScheduler(max_concurrency=1, max_queue=8, max_wait_sec=5, service_time_sec=3)
+        async with sched.slot(PRIORITY_PLAN):
+            sched.check_admission(PRIORITY_PLAN)  # one round ahead: 3s < 5s
+            with pytest.raises(LLMOverloaded) as exc:
+                sched.check_admission(PRIORITY_PLAN, deadline_sec=1)
+            assert exc.value.retry_after >= 3
+            with pytest.raises(LLMOverloaded):
+                await sched.acquire(PRIORITY_COMPOSE, deadline_sec=1)
+        return sched.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["rejected"] == 2 and stats["active"] == 0
@@ -0,0 +1,36 @@
+import importlib.util
+import random
+from pathlib import Path
+
+_spec = importlib.util.spec_from_file_location(
+    "load_test", Path(__file__).resolve().parent.parent / "scripts" / "load_test.py"
+)
+load_test = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(load_test)
+
+
+def test_parse_weights_drops_zero_entries():
+    weights = load_test.parse_weights("ask_full=0.8, tools=0.2,ask=0")
+    assert weights == {"ask_full": 0.8, "tools": 0.2}
+    assert load_test.parse_weights("ask_full") == {"ask_full": 1.0}
+
+
+def test_pick_respects_weights():
+    rng = random.Random(1)
+    picks = [load_test.pick({"a": 1.0, "b": 0.0001}, rng) for _ in range(200)]
+    assert picks.count("a") > 190
+
+
+def test_percentiles():
+    p = load_test.percentiles([i / 100 for i in range(1, 101)])
+    assert p["p50"] == 0.51 and p["p99"] == 1.0 and p["n"] == 100
+    assert load_test.percentiles([]) is None
+
+
+def test_connection_pool_never_queues_requests():
+    from types import SimpleNamespace
+
+    closed = SimpleNamespace(rate=0.0, concurrency=8, timeout=120.0)
+    assert load_test.connection_limit(closed) == 8
+    open_loop = SimpleNamespace(rate=5.0, concurrency=4, timeout=30.0)
+    assert load_test.connection_limit(open_loop) == 151
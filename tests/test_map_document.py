@@ -0,0 +1,76 @@
+import numpy as np
+
+from tools import map_document
+
+
+class FakeRetriever:
+    """Chunks mentioning 'log' match 10.2, 'password' matches 8.3, anything else nothing."""
+
+    def __init__(self):
+        self.embed_calls = []
+        self.search_calls = 0
+
+    def embed_many(self, texts):
+        self.embed_calls.append(len(texts))
+        rows = [[float("log" in t), float("password" in t)] for t in texts]
+        return np.array(rows, dtype=np.float32)
+
+    def search_many_by_vectors(self, qv, k=8):
+        self.search_calls += 1
+        out = []
+        for log, pwd in qv:
+            hits = [{"id": "10.2", "score": 0.5 + 0.4 * log},
+                    {"id": "8.3", "score": 0.1 + 0.8 * pwd}]
+            out.append(sorted(hits, key=lambda h: -h["score"])[:k])
+        return out
+
+
+DOC = """# Policy
+Intro text about nothing in particular.
+
+## Logging
+Audit log events are kept.
+
+All log entries are reviewed daily.
+
+3.2 Authentication
+Each password must be long.
+"""
+
+
+def test_iter_chunks_splits_sections_and_bounds_chunk_size():
+    chunks = list(map_document.iter_chunks(DOC + "x " * 2000, max_chars=200))
+    assert [c[1] for c in chunks[:3]] == ["Policy", "Logging", "3.2 Authentication"]
+    assert [c[0] for c in chunks[:3]] == [0, 1, 2]
+    assert all(len(text) <= 200 for _, _, text in chunks)
+
+
+def test_numbered_list_items_are_not_headings():
+    doc = "1. Introduction\nScope text.\n1. Ensure audit logs are retained\n2. Review them daily.\n"
+    chunks = list(map_document.iter_chunks(doc, max_chars=500))
+    assert [c[1] for c in chunks] == ["1. Introduction"]
+    assert "Ensure audit logs" in chunks[0][2]
+    assert map_document._is_heading("3.2 Access Control")
+    assert map_document._is_heading("Section 4 Scope and Applicability")
+    assert not map_document._is_heading("3.2 Passwords must be rotated, at least yearly")
+
+
+def test_map_document_builds_coverage_matrix_with_one_search(monkeypatch):
+    fake = FakeRetriever()
+    monkeypatch.setattr(map_document, "get_retriever", lambda: fake)
+    monkeypatch.setattr(map_document, "MAP_EMBED_BATCH", 2)
+
+    out = map_document.run({"text": DOC, "min_score": 0.6})
+    res = out.result
+
+    assert out.status == "success"
+    assert fake.search_calls == 1 and fake.embed_calls == [2, 1]
+    assert [r["id"] for r in res["requirements"]] == ["8.3", "10.2"]
+    assert [s["requirements"] for s in res["sections"]] == [[], ["10.2"], ["8.3"]]
+    assert np.allclose(res["matrix"], [[0.0, 0.0], [0.0, 0.9], [0.9, 0.0]])
+    assert out.meta["chunks"] == 3 and out.meta["sections"] == 3
+
+
+def test_map_document_empty_text(monkeypatch):
+    monkeypatch.setattr(map_document, "get_retriever", lambda: FakeRetriever())
+    assert map_document.run({"text": "   \n\n"}).status == "not_found"
@@ -0,0 +1,41 @@
+import pytest
+
+from telemetry.metrics import Counter, Histogram, Registry, _Metric, timed
+
+
+def test_histogram_renders_cumulative_buckets():
+    reg = Registry()
+    h = reg.register(Histogram("demo_seconds", "Demo.", ["stage"], buckets=(0.1, 1.0)))
+    h.observe(0.05, stage="plan")
+    h.observe(0.5, stage="plan")
+    h.observe(5.0, stage="plan")
+
+    text = reg.render()
+    assert '# TYPE demo_seconds histogram' in text
+    assert 'demo_seconds_bucket{stage="plan",le="0.1"} 1' in text
+    assert 'demo_seconds_bucket{stage="plan",le="1"} 2' in text
+    assert 'demo_seconds_bucket{stage="plan",le="+Inf"} 3' in text
+    assert 'demo_seconds_count{stage="plan"} 3' in text
+
+
+def test_timed_decorator_and_counter():
+    reg = Registry()
+    h = reg.register(Histogram("call_seconds", "Calls.", ["helper"]))
+    c = reg.register(Counter("calls_total", "Calls.", ["helper"]))
+
+    @timed(h, helper="fetch")
+    def fetch():
+        c.inc(helper="fetch")
+
+    fetch()
+    fetch()
+    assert h.count(helper="fetch") == 2
+    assert 'calls_total{helper="fetch"} 2' in reg.render()
+
+
+def test_metric_base_requires_samples():
+    class Incomplete(_Metric):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete("x", "help")  # pylint: disable=abstract-class-instantiated
@@ -0,0 +1,72 @@
+from agent.observation_encoder import count_tokens, encode_observations
+
+
+def _search(items):
+    return {
+        "tool": "search",
+        "input": {"q": "pci dss audit logs"},
+        "status": "success",
+        "raw_result": {"status": "success", "tool_name": "search", "result": items},
+    }
+
+
+def _get(item):
+    return {
+        "tool": "get",
+        "input": {"id": item["id"]},
+        "status": "success",
+        "raw_result": {"status": "success", "tool_name": "get", "result": item},
+    }
+
+
+def test_one_line_per_requirement_deduplicated_without_json():
+    text, stats = encode_observations(
+        [
+            _get({"id": "10.2", "text": "Audit logs are implemented.", "tags": ["logging"]}),
+            _search([
+                {"id": "10.2", "text": "Audit logs are implemented.", "score": 0.71},
+                {"id": "10.3", "text": "Audit logs are protected.", "score": 0.64},
+            ]),
+        ],
+        token_budget=500,
+    )
+    lines = text.splitlines()
+    assert lines[0] == "[1] get 10.2 -> success"
+    assert lines[1] == '[2] search "pci dss audit logs" -> success, 2 hits'
+    assert lines[2] == "10.2 (score 1.00; tags: logging) Audit logs are implemented."
+    assert lines[3] == "10.3 (score 0.64) Audit logs are protected."
+    assert len(lines) == 4
+    assert "{" not in text
+    assert stats == {"tokens": stats["tokens"], "kept": 2, "omitted": [], "estimated": True}
+
+
+def test_budget_keeps_highest_scores_in_original_order():
+    items = [
+        {"id": "10.4", "text": "Audit logs are reviewed to identify anomalies.", "score": 0.40},
+        {"id": "10.2", "text": "Audit logs are implemented to support detection.", "score": 0.90},
+        {"id": "10.3", "text": "Audit logs are protected from destruction.", "score": 0.80},
+    ]
+    header = '[1] search "pci dss audit logs" -> success, 3 hits'
+    line = "10.2 (score 0.90) Audit logs are implemented to support detection."
+    note = "(omitted for length: 10.4)"
+    budget = count_tokens(header) + 2 * (count_tokens(line) + 1) + count_tokens(note) + 1
+
+    text, stats = encode_observations([_search(items)], token_budget=budget)
+    kept = [ln.split(" ", 1)[0] for ln in text.splitlines()[1:-1]]
+    assert kept == ["10.2", "10.3"]
+    assert stats["omitted"] == ["10.4"]
+    assert text.splitlines()[-1] == "(omitted for length: 10.4)"
+
+
+def test_omitted_note_fits_inside_the_budget():
+    text = "Audit logs are reviewed to identify anomalies."
+    items = [{"id": f"10.{i}", "text": text, "score": 1 - i / 10} for i in range(1, 6)]
+    header = '[1] search "pci dss audit logs" -> success, 5 hits'
+    line = "10.1 (score 0.90) Audit logs are reviewed to identify anomalies."
+    budget = count_tokens(header) + 2 * (count_tokens(line) + 1)
+
+    text, stats = encode_observations([_search(items)], token_budget=budget)
+    assert stats["tokens"] <= budget and count_tokens(text) <= budget
+    assert [ln.split(" ", 1)[0] for ln in text.splitlines()[1:-1]] == ["10.1"]
+    assert stats["omitted"] == ["10.2", "10.3", "10.4", "10.5"]
+    assert text.splitlines()[-1] == "(omitted for length: 10.2, 10.3, 10.4, 10.5)"
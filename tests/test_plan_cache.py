@@ -0,0 +1,54 @@
+from mcp_server import plan_cache
+from mcp_server.plan_cache import PlanCache, normalize_message, render_plan_line
+
+
+def testnormalize_message_ignores_case_spacing_and_trailing_punct():
+    assert normalize_message("What is  requirement 10?") == "what is requirement 10"
+    assert normalize_message("what is requirement 10") == "what is requirement 10"
+    assert normalize_message("Explain 10.2.1.") == "explain 10.2.1"
+
+
+def test_plan_cache_hit_returns_copy():
+    cache = PlanCache(maxsize=4, ttl_sec=60)
+    actions = [{"tool_name": "get", "tool_input": {"id": "10"}}]
+    assert cache.get("what is requirement 10") is None
+    cache.put("what is requirement 10", actions)
+
+    hit = cache.get("What is requirement 10?")
+    assert hit == actions
+    hit[0]["tool_input"]["id"] = "11"
+    assert cache.get("what is requirement 10") == actions
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_plan_cache_lru_and_ttl(monkeypatch):
+    cache = PlanCache(maxsize=2, ttl_sec=10)
+    now = [1000.0]
+    monkeypatch.setattr(plan_cache.time, "monotonic", lambda: now[0])
+
+    cache.put("a", {"skip": True})
+    cache.put("b", {"skip": True})
+    cache.get("a")
+    cache.put("c", {"skip": True})  # evicts "b" (least recently used)
+    assert cache.get("b") is None
+    assert cache.get("a") == {"skip": True}
+
+    now[0] += 11
+    assert cache.get("a") is None
+
+
+def test_plan_cache_invalidated_on_model_change(monkeypatch):
+    cache = PlanCache(maxsize=4, ttl_sec=60)
+    cache.put("hi", {"skip": True})
+    monkeypatch.setattr(plan_cache.llm_wrapper, "LLM_MODEL", "other-model")
+    assert cache.get("hi") is None
+
+
+def testrender_plan_line():
+    assert render_plan_line({"skip": True}) == "skip"
+    assert render_plan_line([{"tool_name": "get", "tool_input": {"ids": ["1", "2"]}}]) == (
+        'get:["1", "2"]'
+    )
+    assert render_plan_line([{"tool_name": "search", "tool_input": {"q": "pci dss mfa"}}]) == (
+        'search:"pci dss mfa"'
+    )
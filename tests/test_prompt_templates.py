@@ -0,0 +1,88 @@
+from pathlib import Path
+
+import pytest
+
+from agent import prompt_formatter
+from agent.llm_wrapper import PromptEvalStats
+from agent.prompt_formatter import PromptTemplate, format_prompt
+
+
+def _legacy_format_prompt(user_input, context, tool_help="", template_type="main", tool_result=""):
+    """format_prompt before templates were precompiled: read + str.replace per request."""
+    if template_type == "followup":
+        template = Path("agent/followup_template.txt").read_text(encoding="utf-8")
+        return template.replace("{{ tool_result }}", tool_result).replace(
+            "{{ user_input }}", user_input
+        )
+    if template_type == "smalltalk":
+        template = Path("agent/smalltalk_template.txt").read_text(encoding="utf-8")
+        return template.replace("{{ user_input }}", user_input)
+    template = Path("agent/prompt_template.txt").read_text(encoding="utf-8")
+    return (
+        template.replace("{{ user_input }}", user_input)
+        .replace("{{ context }}", context)
+        .replace("{{ tool_help }}", tool_help)
+    )
+
+
+def test_prefix_ends_at_first_dynamic_placeholder():
+    t = PromptTemplate(
+        "t", "Tools: {{ tool_help }}\nRules.\nUser: {{ user_input }}\nObs: {{ tool_result }}"
+    )
+    assert t.prefix == "Tools: {{ tool_help }}\nRules.\nUser: "
+    assert t.suffix == "{{ user_input }}\nObs: {{ tool_result }}"
+    assert PromptTemplate("s", "static only").prefix == "static only"
+
+
+@pytest.mark.parametrize("template_type", ["main", "followup", "smalltalk"])
+def test_render_matches_legacy_format_prompt(template_type):
+    kwargs = {
+        "user_input": "What does 10.2 require?",
+        "context": "",
+        "tool_help": "🔧 **get**: Get a requirement by ID",
+        "template_type": template_type,
+        "tool_result": "[1] get 10.2 -> success\n10.2 (score 1.00) Audit logs are implemented.",
+    }
+    assert format_prompt(**kwargs) == _legacy_format_prompt(**kwargs)
+
+
+def test_static_prefix_is_identical_across_requests():
+    a = format_prompt("hello", "", template_type="followup", tool_result="x")
+    b = format_prompt("what is 3.4?", "", template_type="followup", tool_result="y")
+    prefix = prompt_formatter.get_template("followup").prefix
+    assert prefix and a.startswith(prefix) and b.startswith(prefix)
+
+
+def test_template_reloaded_when_file_signature_changes(tmp_path, monkeypatch):
+    (tmp_path / "smalltalk_template.txt").write_text("Hi {{ user_input }}", encoding="utf-8")
+    monkeypatch.setattr(prompt_formatter, "TEMPLATE_DIR", tmp_path)
+    monkeypatch.setattr(prompt_formatter, "_templates", {})
+
+    first = prompt_formatter.get_template("smalltalk")
+    assert prompt_formatter.get_template("smalltalk") is first  # unchanged: cached object
+
+    (tmp_path / "smalltalk_template.txt").write_text("Hello, {{ user_input }}", encoding="utf-8")
+    second = prompt_formatter.get_template("smalltalk")
+    assert second is not first and second.render(user_input="x") == "Hello, x"
+
+
+def test_prompt_eval_reuse_comes_from_server_counts_only():
+    stats = PromptEvalStats()
+    assert stats.record("followup", {"prompt_eval_count": 900})["reused"] is None
+
+    cold, warm = {"prompt_eval_count": 800}, {"prompt_eval_count": 1}
+    assert stats.record_prime("followup", cold, warm) == 799
+    hit = stats.record("followup", {"prompt_eval_count": 120, "prompt_eval_duration": 120_000_000})
+    assert hit["reused"] == 799 and hit["saved_sec"] == pytest.approx(0.799)
+    miss = stats.record("followup", {"prompt_eval_count": 950, "prompt_eval_duration": 950_000_000})
+    assert miss["reused"] == 0
+
+    # Backends that report cached tokens directly win over the priming estimate
+    direct = stats.record("followup", {"prompt_eval_count": 50, "prompt_cached_count": 700})
+    assert direct["reused"] == 700
+    # Already warm before priming: the prefix size can't be known
+    assert stats.record_prime("main", {"prompt_eval_count": 3}, {"prompt_eval_count": 3}) is None
+
+    snap = stats.snapshot()
+    assert snap["followup"]["reuse_unknown"] == 1 and snap["followup"]["reused_tokens"] == 799 + 700
+    assert snap["prefixes"] == {"followup": {"uncached": 800, "primed": 1}}
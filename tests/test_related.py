@@ -0,0 +1,67 @@
+import sqlite3
+
+import numpy as np
+
+from retrieval.related import knn_graph, write_related
+from tools import related
+
+
+def test_knn_graph_matches_brute_force_across_chunks():
+    rng = np.random.default_rng(0)
+    X = rng.standard_normal((37, 8)).astype(np.float32)
+    idx, scores = knn_graph(X, m=5, chunk=10)
+
+    U = X / np.linalg.norm(X, axis=1, keepdims=True)
+    full = U @ U.T
+    np.fill_diagonal(full, -np.inf)
+    expected = np.argsort(-full, axis=1)[:, :5]
+    assert idx.shape == (37, 5)
+    assert (idx == expected).all()
+    assert np.allclose(scores, np.take_along_axis(full, expected, axis=1), atol=1e-5)
+    assert (scores[:, :-1] >= scores[:, 1:]).all()
+
+
+def _db(path, with_graph=True):
+    rows = [("10", None), ("10.2", "10"), ("10.3", "10"), ("10.4", "10"), ("3.4", "3")]
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE requirements(id TEXT PRIMARY KEY, text TEXT NOT NULL, "
+                     "tags TEXT DEFAULT '', level TEXT, parent_id TEXT)")
+        conn.executemany("INSERT INTO requirements(id, text, parent_id) VALUES(?,?,?)",
+                         [(rid, f"text {rid}", parent) for rid, parent in rows])
+        if with_graph:
+            rids = ["10.2", "3.4", "10.3"]
+            write_related(conn, rids, np.array([[1, 2], [0, 2], [0, 1]]),
+                          np.array([[0.8, 0.5], [0.8, 0.2], [0.5, 0.2]], dtype=np.float32))
+
+
+def test_related_reads_graph_and_mixes_siblings(tmp_path, monkeypatch):
+    db = tmp_path / "r.db"
+    _db(db)
+    monkeypatch.setattr(related, "DB_FILE", db)
+    monkeypatch.setattr("tools.get.DB_FILE", db)
+
+    out = related.run({"id": "10.2"})
+    assert [(e.id, e.score) for e in out.result] == [("3.4", 0.8), ("10.3", 0.5), ("10.4", None)]
+    assert out.meta["source"] == "graph"
+    assert out.meta["sources"] == {"3.4": "similar", "10.3": "similar+sibling", "10.4": "sibling"}
+
+    assert [e.id for e in related.run({"id": "10.2", "k": 1, "siblings": False}).result] == ["3.4"]
+
+
+def test_related_falls_back_to_stored_vector_search(tmp_path, monkeypatch):
+    db = tmp_path / "r.db"
+    _db(db, with_graph=False)
+    monkeypatch.setattr(related, "DB_FILE", db)
+    monkeypatch.setattr("tools.get.DB_FILE", db)
+
+    class FakeRetriever:
+        def get_vectors(self, rids):
+            return rids, np.ones((len(rids), 2), dtype=np.float32)
+
+        def search_many_by_vectors(self, qv, k=8):
+            return [[{"id": "10.2", "score": 1.0}, {"id": "10.4", "score": 0.7}][:k]]
+
+    monkeypatch.setattr(related, "get_retriever", lambda: FakeRetriever())
+    out = related.run({"id": "10.2", "siblings": False})
+    assert out.meta["source"] == "ann_fallback"
+    assert [(e.id, e.score) for e in out.result] == [("10.4", 0.7)]
@@ -0,0 +1,94 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from retrieval.sidecar import RetrievalSidecar, SidecarRetriever
+
+
+class FakeRetriever:
+    """Two-document 'index'; texts containing 'log' embed to doc 1, else doc 0."""
+
+    dim = 2
+    ntotal = 2
+
+    def __init__(self):
+        self.encode_calls = 0
+        self.search_calls = 0
+
+    def embed_many(self, texts):
+        self.encode_calls += 1
+        return np.array([[0.0, 1.0] if "log" in t else [1.0, 0.0] for t in texts], dtype=np.float32)
+
+    def search_many_by_vectors(self, qv, k=8):
+        self.search_calls += 1
+        out = []
+        for v in qv:
+            ranked = sorted([("1.1", float(v[0])), ("10.2", float(v[1]))], key=lambda h: -h[1])
+            out.append([{"id": rid, "score": s} for rid, s in ranked[:k]])
+        return out
+
+    def get_vectors(self, rids):
+        known = [r for r in rids if r in ("1.1", "10.2")]
+        vecs = [[1.0, 0.0] if r == "1.1" else [0.0, 1.0] for r in known]
+        return known, np.array(vecs, dtype=np.float32).reshape(len(known), 2)
+
+
+def test_sidecar_batches_concurrent_clients(tmp_path):
+    fake = FakeRetriever()
+    sidecar = RetrievalSidecar(lambda: fake, batch_ms=50, max_batch=64)
+    path = str(tmp_path / "r.sock")
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    server = asyncio.run_coroutine_threadsafe(sidecar.serve(path, warm=False), loop)
+
+    client = SidecarRetriever(path, timeout=5)
+    for _ in range(100):
+        try:
+            assert client.info()["dim"] == 2
+            break
+        except OSError:
+            threading.Event().wait(0.02)
+
+    queries = ["audit logs", "firewall rules"] * 8
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(lambda q: client.search(q, k=1), queries))
+
+    assert [r[0]["id"] for r in results] == ["10.2", "1.1"] * 8
+    assert fake.search_calls < len(queries)
+    assert client.embed("audit logs").shape == (1, 2)
+    assert client.search_many(["log", "", "x"], k=2)[1] == []
+    ids, vecs = client.get_vectors(["10.2", "nope"])
+    assert ids == ["10.2"] and vecs.tolist() == [[0.0, 1.0]]
+    assert client.get_vectors(["nope"])[1].shape == (0, 2)
+    client.close()
+    server.cancel()
+
+
+def test_bad_request_fails_alone_in_its_batch():
+    sidecar = RetrievalSidecar(FakeRetriever, batch_ms=50, max_batch=64)
+
+    async def scenario():
+        sidecar._queue = asyncio.Queue()
+        batcher = asyncio.create_task(sidecar._batch_loop())
+        # The second one would make np.vstack raise for the whole batch
+        results = await asyncio.gather(
+            sidecar.submit("search", ["audit logs"], None, 1),
+            sidecar.submit("search", [], None, 1),
+            return_exceptions=True,
+        )
+        batcher.cancel()
+        return results
+
+    good, bad = asyncio.run(scenario())
+    assert good[0][0]["id"] == "10.2"
+    assert isinstance(bad, Exception)
+    assert sidecar.batches == 1
+
+
+def test_malformed_search_is_rejected_before_queueing():
+    sidecar = RetrievalSidecar(FakeRetriever)
+    with pytest.raises(ValueError, match="texts or"):
+        asyncio.run(sidecar._dispatch({"op": "search", "k": 3}, None))
@@ -0,0 +1,117 @@
+import asyncio
+import types
+
+import tools
+from mcp_server import tool_dispatcher
+from mcp_server.tool_dispatcher import ToolCall, run_tool_batch
+
+
+def _fake_tools(monkeypatch):
+    calls = {"run": [], "run_many": []}
+
+    def run(params):
+        calls["run"].append(params)
+        return {"status": "success", "echo": params.get("x"), "q": params.get("q")}
+
+    def run_many(params_list):
+        calls["run_many"].append([p.get("q") for p in params_list])
+        return [{"status": "success", "q": p.get("q")} for p in params_list]
+
+    modules = {
+        "echo": types.SimpleNamespace(run=run),
+        "multi": types.SimpleNamespace(run=run, run_many=run_many),
+    }
+
+    def import_tool(name):
+        if name not in modules:
+            raise ModuleNotFoundError(f"Tool '{name}' not found")
+        return modules[name]
+
+    monkeypatch.setattr(tool_dispatcher, "_import_tool_module", import_tool)
+    monkeypatch.setitem(tool_dispatcher.TOOL_REGISTRY, "echo", {"needs": []})
+    monkeypatch.setitem(tool_dispatcher.TOOL_REGISTRY, "multi", {"needs": [], "max_concurrency": 1})
+    return calls
+
+
+def _collect(calls):
+    async def go():
+        return [event async for event in run_tool_batch(calls)]
+    return asyncio.run(go())
+
+
+def test_batch_dedupes_and_tags_every_index(monkeypatch):
+    calls = _fake_tools(monkeypatch)
+    batch = [
+        ToolCall(tool_name="echo", tool_input={"x": 1}),
+        ToolCall(tool_name="echo", tool_input={"x": 2}),
+        ToolCall(tool_name="echo", tool_input={"x": 1}),
+    ]
+    events = _collect(batch)
+
+    assert events[-1]["type"] == "done"
+    assert events[-1]["calls"] == 3 and events[-1]["unique"] == 2
+    results = {e["index"]: e["result"]["echo"] for e in events if e["type"] == "result"}
+    assert results == {0: 1, 1: 2, 2: 1}
+    assert len(calls["run"]) == 2
+
+
+def test_batch_groups_calls_into_run_many(monkeypatch):
+    calls = _fake_tools(monkeypatch)
+    monkeypatch.setattr(tool_dispatcher, "TOOL_BATCH_GROUP_SIZE", 2)
+    batch = [ToolCall(tool_name="multi", tool_input={"q": q}) for q in ("a", "b", "c")]
+    events = _collect(batch)
+
+    results = {e["index"]: e["result"]["q"] for e in events if e["type"] == "result"}
+    assert results == {0: "a", 1: "b", 2: "c"}
+    # A full group goes through run_many; the single leftover call takes the plain path
+    assert calls["run_many"] == [["a", "b"]]
+    assert calls["run"] == [{"q": "c"}]
+
+
+def test_unknown_tool_reports_error_in_its_line(monkeypatch):
+    _fake_tools(monkeypatch)
+    events = _collect([ToolCall(tool_name="nope", tool_input={})])
+    assert events[0]["index"] == 0
+    assert events[0]["result"]["status"] == "error"
+
+
+def test_unknown_tool_is_rejected_before_import(monkeypatch):
+    imported = []
+    monkeypatch.setattr(tools.importlib, "import_module", imported.append)
+    result = asyncio.run(tool_dispatcher.handle_tool_call_async("os.path", {}))
+    assert result["status"] == "error" and result["stage"] == "import"
+    assert "manifest" in result["message"]
+    assert imported == []
+
+
+def test_calls_without_run_many_overlap_up_to_the_tool_limit(monkeypatch):
+    active = {"now": 0, "max": 0}
+
+    async def run(params):
+        active["now"] += 1
+        active["max"] = max(active["max"], active["now"])
+        await asyncio.sleep(0.01)
+        active["now"] -= 1
+        return {"status": "success", "x": params["x"]}
+
+    monkeypatch.setattr(tool_dispatcher, "_import_tool_module",
+                        lambda name: types.SimpleNamespace(run=run))
+    monkeypatch.setitem(tool_dispatcher.TOOL_REGISTRY, "slow", {"needs": [], "max_concurrency": 3})
+    events = _collect([ToolCall(tool_name="slow", tool_input={"x": i}) for i in range(6)])
+
+    assert sorted(e["result"]["x"] for e in events if e["type"] == "result") == list(range(6))
+    assert active["max"] == 3
+
+
+def test_short_run_many_still_answers_every_index(monkeypatch):
+    _fake_tools(monkeypatch)
+    monkeypatch.setattr(tool_dispatcher, "_import_tool_module", lambda name: types.SimpleNamespace(
+        run=lambda p: {"status": "success"},
+        run_many=lambda params_list: [{"status": "success", "q": params_list[0]["q"]}],
+    ))
+    events = _collect([ToolCall(tool_name="multi", tool_input={"q": q}) for q in ("a", "b", "c")])
+
+    results = {e["index"]: e["result"] for e in events if e["type"] == "result"}
+    assert sorted(results) == [0, 1, 2]
+    assert results[0]["q"] == "a"
+    assert results[1]["status"] == results[2]["status"] == "error"
@@ -1,5 +1,5 @@
 import pytest
-from agent.tool_call_parser import extract_tool_call
+from agent.tool_call_parser import IncrementalPlanParser, extract_tool_call
 
 
 def test_extract_simple_json():
@@ -44,3 +44,51 @@ def test_no_json_present():
     with pytest.raises(ValueError, match="Could not extract TOOL_CALL"):
         extract_tool_call(text)
 
+
+
+def _feed_all(tokens):
+    parser = IncrementalPlanParser()
+    for i, tok in enumerate(tokens):
+        if parser.feed(tok) is not None:
+            return parser.finish(), i
+    return parser.finish(), None
+
+
+def test_incremental_parser_cuts_at_end_of_line():
+    plan, stopped_at = _feed_all(['get', ':10', '.2', '\n', 'Sure! Here is why...'])
+    assert plan == 'get:10.2'
+    assert stopped_at == 3
+    assert _feed_all(['get:"10.6",', '"10.5"', '\n', 'x'])[1] == 2
+
+
+def test_incremental_parser_closes_single_quoted_get():
+    plan, stopped_at = _feed_all(['get', ':"10', '.2"', ' Sure! Here is why...'])
+    assert plan == 'get:"10.2"'
+    assert stopped_at == 2
+    assert _feed_all(['get:"', '3"', '\n'])[1] == 1
+
+
+def test_incremental_parser_closes_array_and_search_without_newline():
+    assert _feed_all(['get:["1', '0.5","10.6', '"]', ' trailing'])[0] == 'get:["10.5","10.6"]'
+    assert _feed_all(['search:"pci dss', ' mfa"', 'more'])[1] == 1
+
+
+def test_incremental_parser_waits_for_multiline_json():
+    plan, stopped_at = _feed_all(
+        ['[\n', '{"tool_name": "get",\n', '"tool_input": {"id": "3"}}', ']']
+    )
+    assert stopped_at == 3
+    assert extract_tool_call(plan) == [{"tool_name": "get", "tool_input": {"id": "3"}}]
+
+
+def test_incremental_parser_finish_returns_buffer_on_eos():
+    assert _feed_all(['  skip'])[0] == "skip"
+
+
+def test_related_verb():
+    assert _feed_all(['related:"10', '.2"', ' because'])[1] == 1
+    assert extract_tool_call('related:"10.2"') == [
+        {"tool_name": "related", "tool_input": {"id": "10.2"}}
+    ]
+    with pytest.raises(ValueError):
+        extract_tool_call('related:"logging"')
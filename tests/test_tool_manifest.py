@@ -0,0 +1,23 @@
+import importlib
+import pkgutil
+
+import tools
+
+
+def _type_name(annotation):
+    return annotation.__name__ if hasattr(annotation, "__name__") else str(annotation)
+
+
+def test_manifest_matches_tool_modules():
+    for name, meta in tools.TOOL_REGISTRY.items():
+        module = tools.get_tool_module(name)
+        assert module.__doc__.strip().split("\n")[0] == meta["description"], name
+        fields = module.InputSchema.model_fields
+        assert meta["input"] == {f: _type_name(fi.annotation) for f, fi in fields.items()}, name
+
+
+def test_every_tool_module_is_in_manifest():
+    for _, module_name, _ in pkgutil.iter_modules(tools.__path__):
+        module = importlib.import_module(f"tools.{module_name}")
+        if hasattr(module, "InputSchema") and hasattr(module, "run"):
+            assert module_name in tools.TOOL_REGISTRY, module_name
@@ -0,0 +1,40 @@
+import asyncio
+import json
+
+from telemetry import tracing
+
+
+def test_unsampled_requests_record_nothing():
+    with tracing.trace("ask_full", sample_rate=0) as root:
+        with tracing.span("tool.call") as s:
+            s.set(k=8)
+    assert root is tracing.NOOP_SPAN and s is tracing.NOOP_SPAN
+
+
+def test_spans_nest_across_tasks_and_threads(tmp_path, monkeypatch):
+    out = tmp_path / "traces.jsonl"
+    monkeypatch.setattr(tracing, "TRACE_EXPORT", "jsonl")
+    monkeypatch.setattr(tracing, "TRACE_JSONL_PATH", str(out))
+
+    @tracing.traced("sqlite.lookup")
+    def lookup(ids):
+        tracing.annotate(ids=len(ids))
+
+    async def tool():
+        with tracing.span("tool.call", tool="get"):
+            await asyncio.to_thread(lookup, ["1.1", "1.2"])
+
+    async def scenario():
+        tracing.set_request_id("req-1")
+        with tracing.trace("ask_full", sample_rate=1.0):
+            await asyncio.gather(asyncio.create_task(tool()))
+
+    asyncio.run(scenario())
+    tracing.flush()
+
+    spans = {d["name"]: d for d in map(json.loads, out.read_text().splitlines())}
+    assert set(spans) == {"ask_full", "tool.call", "sqlite.lookup"}
+    assert spans["tool.call"]["parent_id"] == spans["ask_full"]["span_id"]
+    assert spans["sqlite.lookup"]["parent_id"] == spans["tool.call"]["span_id"]
+    assert spans["sqlite.lookup"]["attrs"] == {"ids": 2}
+    assert {d["request_id"] for d in spans.values()} == {"req-1"}
@@ -0,0 +1,35 @@
+from mcp_server import warmup
+from mcp_server.capabilities import Capabilities
+
+
+def test_failed_step_skips_dependents(monkeypatch):
+    def boom():
+        raise RuntimeError("no model")
+
+    monkeypatch.setattr(warmup, "STEPS", [
+        ("sqlite", lambda: {"requirements": 3}, ()),
+        ("embedder", boom, ()),
+        ("search", lambda: {"hits": 1}, ("embedder", "sqlite")),
+    ])
+    caps = Capabilities()
+    report = warmup.run_warmup(warmup.WarmupReport(), log=lambda msg: None, caps=caps)
+    snap = report.snapshot()
+
+    assert snap["done"] is True
+    sqlite = snap["steps"]["sqlite"]
+    assert sqlite == {"status": "ok", "sec": sqlite["sec"], "requirements": 3}
+    assert snap["steps"]["embedder"]["status"] == "error"
+    assert "no model" in snap["steps"]["embedder"]["error"]
+    assert snap["steps"]["search"]["status"] == "skipped"
+    assert caps.state("sqlite") == "ready" and caps.state("embedder") == "unavailable"
+
+
+def test_gate_only_waits_for_pending_or_loading():
+    caps = Capabilities()
+    assert caps.waiting_for(["sqlite"]) == []  # not tracking outside the server
+    caps.track()
+    caps.set("llm", "ready")
+    caps.set("embedder", "unavailable")
+    assert caps.waiting_for(["llm", "sqlite", "embedder"]) == ["sqlite"]
+    caps.set("vector_index", "loading")
+    assert not caps.usable("vector_index") and caps.usable("sqlite")
@@ -1,64 +1,64 @@
+"""
+Tool registry backed by the declarative manifest in tools/manifest.json.
+
+The registry and the planner's tool overview come from the manifest alone, so
+importing `tools` is cheap. A tool module (and whatever it loads, e.g. the FAISS
+index behind `search`) is imported on first call, or by `load_tools()` during
+warmup. `needs` lists the capabilities (mcp_server/capabilities.py) a tool
+can't run without; `"planner": false` keeps a tool out of the planner prompt
+(callable via /tools/call only). tests/test_tool_manifest.py keeps the manifest
+in sync with each module's docstring and InputSchema.
+"""
+
 import importlib
-import inspect
+import json
 import logging
-import pkgutil
-from typing import Dict
-
-from pydantic import BaseModel
+from functools import lru_cache
+from pathlib import Path
+from types import ModuleType
+from typing import Dict, List
 
 logger = logging.getLogger(__name__)
 
+MANIFEST_PATH = Path(__file__).with_name("manifest.json")
 
-TOOL_REGISTRY: Dict[str, Dict[str, object]] = {}
 
+def _load_manifest() -> Dict[str, Dict[str, object]]:
+    entries = json.loads(MANIFEST_PATH.read_text(encoding="utf-8"))
+    return {entry["name"]: entry for entry in entries}
 
-def load_tools():
-    for _, module_name, _ in pkgutil.iter_modules(__path__):
-        if module_name == "__init__":
-            continue
 
-        try:
-            module = importlib.import_module(f"tools.{module_name}")
-        except Exception as e:
-            logger.warning(f"⚠️ Failed to import tools.{module_name}: {e}")
-            continue
+TOOL_REGISTRY: Dict[str, Dict[str, object]] = _load_manifest()
 
-        input_schema = getattr(module, "InputSchema", None)
 
-        raw_doc = getattr(module, "__doc__", None)
-        description = (
-            raw_doc.strip().split("\n")[0]
-            if isinstance(raw_doc, str) and raw_doc.strip()
-            else f"{module_name} tool"
-        )
+def get_tool_module(tool_name: str) -> ModuleType:
+    meta = TOOL_REGISTRY.get(tool_name)
+    if meta is None:
+        raise ModuleNotFoundError(f"Tool '{tool_name}' is not in tools/manifest.json")
+    return importlib.import_module(str(meta.get("module") or f"tools.{tool_name}"))
 
-        if (
-            input_schema
-            and inspect.isclass(input_schema)
-            and issubclass(input_schema, BaseModel)
-        ):
-            TOOL_REGISTRY[module_name] = {
-                "description": description,
-                "input_schema": input_schema,
-            }
 
-
-# Load at module import time
-load_tools()
+def load_tools() -> List[str]:
+    """Import every manifest tool (warmup); returns the names that loaded."""
+    loaded = []
+    for tool_name in TOOL_REGISTRY:
+        try:
+            get_tool_module(tool_name)
+        except Exception as e:
+            logger.warning(f"⚠️ Failed to import tools.{tool_name}: {e}")
+            continue
+        loaded.append(tool_name)
+    return loaded
 
 
+@lru_cache(maxsize=1)
 def get_tool_overview() -> str:
     lines = []
     for tool_name, meta in TOOL_REGISTRY.items():
+        if not meta.get("planner", True):
+            continue
         lines.append(f"🔧 **{tool_name}**: {meta['description']}")
-        fields = meta["input_schema"].model_fields
-        for field_name, field in fields.items():
-            f_type = (
-                field.annotation.__name__
-                if hasattr(field.annotation, "__name__")
-                else str(field.annotation)
-            )
+        for field_name, f_type in meta["input"].items():
             lines.append(f"  • `{field_name}`: {f_type}")
         lines.append("")
     return "\n".join(lines)
-
@@ -0,0 +1,101 @@
+"""Compare PCI DSS requirements by ID: texts, pairwise similarity and shared/differing tags."""
+
+from __future__ import annotations
+
+import os
+from typing import Any, Dict, List, Literal, Optional
+
+import numpy as np
+from pydantic import BaseModel, Field
+
+from agent.models.base import BaseToolOutputSchema
+from agent.models.requirement import RequirementEntry
+from retrieval.hierarchy import expand_requirement_ids
+from retrieval.retriever import get_retriever
+from tools.get import fetch_many
+
+# ---------------- Input/Output ----------------
+
+class InputSchema(BaseModel):
+    ids: List[str] = Field(..., min_length=2)
+    # Compare each ID's whole subtree (e.g. "10.2" -> 10.2, 10.2.1, ...)
+    expand: Optional[bool] = Field(default=None)
+
+class OutputSchema(BaseToolOutputSchema):
+    status: Literal["success", "not_found"]
+    tool_name: Literal["compare_requirements"]
+    result: List[RequirementEntry]
+    meta: Dict[str, Any] | None = None
+
+# ---------------- Config ----------------
+
+COMPARE_MAX_IDS = int(os.getenv("COMPARE_MAX_IDS", "300"))
+# Most/least similar pairs listed next to the matrix
+COMPARE_TOP_PAIRS = int(os.getenv("COMPARE_TOP_PAIRS", "5"))
+
+# ---------------- Helpers ----------------
+
+def similarity_matrix(vectors: np.ndarray) -> np.ndarray:
+    """Cosine similarity of every pair of rows (one matmul; rows are normalized first)."""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    unit = vectors / np.where(norms > 0, norms, 1.0)
+    return np.clip(unit @ unit.T, -1.0, 1.0)
+
+def ranked_pairs(ids: List[str], sim: np.ndarray, n: int) -> Dict[str, List[Dict[str, Any]]]:
+    rows, cols = np.triu_indices(len(ids), k=1)
+    scores = sim[rows, cols]
+    order = np.argsort(-scores, kind="stable")
+
+    def pairs(idx):
+        return [
+            {"a": ids[rows[i]], "b": ids[cols[i]], "score": round(float(scores[i]), 4)}
+            for i in idx
+        ]
+
+    return {"most_similar": pairs(order[:n]), "least_similar": pairs(order[::-1][:n])}
+
+def tag_overlap(entries: List[RequirementEntry]) -> Dict[str, Any]:
+    tag_sets = [set(e.tags) for e in entries]
+    shared = set.intersection(*tag_sets) if tag_sets else set()
+    return {
+        "shared_tags": sorted(shared),
+        "differing_tags": {
+            e.id: sorted(t - shared) for e, t in zip(entries, tag_sets) if t - shared
+        },
+    }
+
+# ---------------- Tool entry ----------------
+
+def run(params: Dict[str, Any]) -> OutputSchema:
+    inp = InputSchema(**(params or {}))
+    requested = list(dict.fromkeys(i.strip().rstrip(".") for i in inp.ids if i and i.strip()))
+    if inp.expand:
+        requested = list(dict.fromkeys(r for rid in requested for r in expand_requirement_ids(rid)))
+    if len(requested) > COMPARE_MAX_IDS:
+        raise ValueError(
+            f"Too many requirements to compare: {len(requested)} (max {COMPARE_MAX_IDS})"
+        )
+
+    # One faiss_map query + one reconstruct for the vectors, one SQLite query for the texts
+    found, vectors = get_retriever().get_vectors(requested)
+    by_id = fetch_many(found)
+    rows = [i for i, rid in enumerate(found) if rid in by_id]
+    ids = [found[i] for i in rows]
+    known = set(ids)
+    missing = [rid for rid in requested if rid not in known]
+    if len(ids) < 2:
+        return OutputSchema(status="not_found", tool_name="compare_requirements", result=[],
+                            meta={"ids": ids, "missing": missing,
+                                  "reason": "need at least two known IDs"})
+
+    sim = similarity_matrix(vectors[rows])
+    entries = [by_id[rid] for rid in ids]
+    meta = {
+        "ids": ids,
+        "similarity": np.round(sim.astype(np.float64), 4).tolist(),
+        **ranked_pairs(ids, sim, COMPARE_TOP_PAIRS),
+        **tag_overlap(entries),
+        "missing": missing,
+    }
+    return OutputSchema(status="success", tool_name="compare_requirements", result=entries,
+                        meta=meta)
@@ -3,6 +3,7 @@
 from __future__ import annotations
 
 from pathlib import Path
+import asyncio
 import os
 import sqlite3
 from typing import List, Optional, Literal, Dict, Any
@@ -11,6 +12,8 @@ from pydantic import BaseModel, Field
 
 from agent.models.base import BaseToolOutputSchema
 from agent.models.requirement import RequirementEntry
+from telemetry import tracing
+from telemetry.metrics import SQLITE_SECONDS, timed
 
 
 # ---- Input / Output Schemas -------------------------------------------------
@@ -61,9 +64,13 @@ def _row_to_entry(row: sqlite3.Row) -> RequirementEntry:
     return RequirementEntry(id=rid, text=text, tags=tags)
 
 
-def _fetch_many(ids: List[str]) -> Dict[str, RequirementEntry]:
+@timed(SQLITE_SECONDS, helper="get.fetch_many")
+@tracing.traced("sqlite.get.fetch_many")
+def fetch_many(ids: List[str]) -> Dict[str, RequirementEntry]:
+    """Requirements by id in one query; unknown ids are simply absent from the result."""
     if not ids:
         return {}
+    tracing.annotate(ids=len(ids))
 
     placeholders = ",".join("?" for _ in ids)
     sql = f"SELECT id, text, COALESCE(tags,'') AS tags FROM {TABLE} WHERE id IN ({placeholders})"
@@ -115,7 +122,7 @@ def main(input_data: InputSchema) -> OutputSchema:
     if len(clean_ids) > MAX_BATCH:
         raise ValueError(f"Too many IDs requested ({len(clean_ids)}). Max allowed is {MAX_BATCH}.")
 
-    by_id = _fetch_many(clean_ids)
+    by_id = fetch_many(clean_ids)
 
     # Single-ID path (preserve old behavior)
     if len(clean_ids) == 1:
@@ -164,7 +171,8 @@ async def run(params: Dict[str, Any]) -> Dict[str, Any]:
 
     try:
         input_model = InputSchema(id=pid, ids=pids)
-        out = main(input_model)
+        # SQLite I/O off the event loop so concurrent plan actions overlap
+        out = await asyncio.to_thread(main, input_model)
         return out.model_dump()
     except FileNotFoundError as e:
         return OutputSchema(
@@ -0,0 +1,248 @@
+"""Map a long policy document to the PCI DSS requirements each of its sections covers."""
+
+from __future__ import annotations
+
+import io
+import os
+import re
+import time
+from typing import Any, Dict, Iterator, List, Literal, Optional, Tuple
+
+import numpy as np
+from pydantic import BaseModel, Field
+
+from agent.models.base import BaseToolOutputSchema
+from retrieval.retriever import get_retriever
+from telemetry import tracing
+
+# ---------------- Input/Output ----------------
+
+class InputSchema(BaseModel):
+    text: str
+    k: Optional[int] = Field(default=None, ge=1, le=50)
+    min_score: Optional[float] = Field(default=None)
+    max_requirements: Optional[int] = Field(default=None, ge=1)
+
+class OutputSchema(BaseToolOutputSchema):
+    status: Literal["success", "not_found"]
+    tool_name: Literal["map_document"]
+    result: Dict[str, Any]
+    meta: Dict[str, Any] | None = None
+
+# ---------------- Config ----------------
+
+# Chunk size in characters (~ what the embedding model reads before truncating)
+MAP_CHUNK_CHARS = int(os.getenv("MAP_CHUNK_CHARS", "1000"))
+# Chunks per encode() call
+MAP_EMBED_BATCH = int(os.getenv("MAP_EMBED_BATCH", "256"))
+# Requirements retrieved per chunk
+MAP_TOP_K = int(os.getenv("MAP_TOP_K", "5"))
+# Hits below this similarity don't count as coverage
+MAP_MIN_SCORE = float(os.getenv("MAP_MIN_SCORE", "0.35"))
+# Columns in the returned coverage matrix (best-covered requirements first)
+MAP_MAX_REQUIREMENTS = int(os.getenv("MAP_MAX_REQUIREMENTS", "100"))
+# Refuse larger documents (characters); ~3k characters per page
+MAP_MAX_CHARS = int(os.getenv("MAP_MAX_CHARS", str(10 * 1024 * 1024)))
+CHARS_PER_PAGE = 3000
+
+# "# Title", "ACCESS CONTROL"
+_MARKED_HEADING = re.compile(r"^(#{1,6}\s+\S.*|[A-Z][A-Z0-9 ,&/()-]{3,80})$")
+# "3.2 Access Control", "Section 4 Scope", "1. Introduction"
+_NUMBERED_HEADING = re.compile(r"^(?i:section\s+)?(\d+(?:\.\d+)*)(\.?)\s+([A-Z].*)$")
+_SENTENCE_PUNCT = re.compile(r"[.,;:!?]")
+HEADING_MAX_WORDS = 8
+
+# ---------------- Chunking ----------------
+
+def _is_heading(line: str) -> bool:
+    """
+    A stripped line that opens a section. Numbered lines must read like titles
+    (short, no sentence punctuation) so list items ("1. Ensure logs are kept")
+    stay in their paragraph; a single "N." number also needs Title Case.
+    """
+    if not line or len(line) > 120:
+        return False
+    if _MARKED_HEADING.match(line):
+        return True
+    m = _NUMBERED_HEADING.match(line)
+    if m is None:
+        return False
+    number, dot, title = m.groups()
+    words = title.split()
+    if len(words) > HEADING_MAX_WORDS or _SENTENCE_PUNCT.search(title):
+        return False
+    if dot and "." not in number:
+        return all(w[0].isupper() for w in words if len(w) > 3)
+    return True
+
+def _split_long(paragraph: str, max_chars: int) -> Iterator[str]:
+    """Cut an oversized paragraph at whitespace near max_chars."""
+    while len(paragraph) > max_chars:
+        cut = paragraph.rfind(" ", max_chars // 2, max_chars)
+        cut = cut if cut > 0 else max_chars
+        yield paragraph[:cut].strip()
+        paragraph = paragraph[cut:].strip()
+    if paragraph:
+        yield paragraph
+
+def iter_chunks(text: str, max_chars: int = MAP_CHUNK_CHARS) -> Iterator[Tuple[int, str, str]]:
+    """
+    Stream (section index, section title, chunk text) over the document.
+    Headings start a new section; paragraphs are packed into chunks of at
+    most `max_chars` without crossing a section boundary.
+    """
+    section, title, emitted = 0, "", 0
+    buf: List[str] = []
+    para: List[str] = []
+
+    def pack(final: bool = False) -> Iterator[str]:
+        """Move the finished paragraph into `buf`, yielding every chunk that fills up."""
+        for piece in _split_long(" ".join(para), max_chars):
+            if buf and sum(len(b) + 1 for b in buf) + len(piece) > max_chars:
+                yield "\n".join(buf)
+                buf.clear()
+            buf.append(piece)
+        para.clear()
+        if final and buf:
+            yield "\n".join(buf)
+            buf.clear()
+
+    for line in io.StringIO(text):
+        line = line.strip()
+        heading = _is_heading(line)
+        if line and not heading:
+            para.append(line)
+            continue
+        # Blank line or heading: the paragraph is complete (and a heading closes the section)
+        for chunk in pack(final=heading):
+            yield section, title, chunk
+            emitted += 1
+        if heading:
+            name = line.lstrip("#").strip()
+            if emitted:
+                section, title, emitted = section + 1, name, 0
+            else:
+                # Nested headings with nothing in between name one section
+                title = f"{title} / {name}" if title else name
+    for chunk in pack(final=True):
+        yield section, title, chunk
+
+# ---------------- Aggregation ----------------
+
+def coverage_matrix(chunk_sections: np.ndarray, hits: List[List[Dict[str, Any]]],
+                    n_sections: int, min_score: float):
+    """
+    (requirement ids, sections x requirements max-score matrix, chunks per
+    requirement) from per-chunk hits; scores below `min_score` are dropped.
+    """
+    cols: Dict[str, int] = {}
+    chunk_idx, col_idx, scores = [], [], []
+    for i, row in enumerate(hits):
+        for h in row:
+            if h.get("score") is None or h["score"] < min_score:
+                continue
+            chunk_idx.append(i)
+            col_idx.append(cols.setdefault(str(h["id"]), len(cols)))
+            scores.append(h["score"])
+    matrix = np.zeros((n_sections, len(cols)), dtype=np.float32)
+    if not cols:
+        return [], matrix, np.zeros(0, dtype=np.int64)
+    ci = np.asarray(chunk_idx, dtype=np.int64)
+    rc = np.asarray(col_idx, dtype=np.int64)
+    np.maximum.at(matrix, (chunk_sections[ci], rc), np.asarray(scores, dtype=np.float32))
+    chunk_counts = np.bincount(rc, minlength=len(cols))
+    return list(cols), matrix, chunk_counts
+
+# ---------------- Tool entry ----------------
+
+def run(params: Dict[str, Any]) -> OutputSchema:
+    inp = InputSchema(**(params or {}))
+    k = inp.k or MAP_TOP_K
+    min_score = MAP_MIN_SCORE if inp.min_score is None else inp.min_score
+    max_reqs = inp.max_requirements or MAP_MAX_REQUIREMENTS
+    if len(inp.text) > MAP_MAX_CHARS:
+        raise ValueError(f"Document too large: {len(inp.text)} characters (max {MAP_MAX_CHARS})")
+
+    t0 = time.perf_counter()
+    retriever = get_retriever()
+    sections: List[Dict[str, Any]] = []
+    chunk_sections: List[int] = []
+    vectors: List[np.ndarray] = []
+    batch: List[str] = []
+    embed_sec = 0.0
+
+    def embed_batch():
+        nonlocal embed_sec
+        t = time.perf_counter()
+        vectors.append(retriever.embed_many(batch))
+        embed_sec += time.perf_counter() - t
+        batch.clear()
+
+    with tracing.span("map_document", chars=len(inp.text)) as span:
+        # Only the current batch of chunk texts is held; embeddings are d floats per chunk
+        for section, title, chunk in iter_chunks(inp.text):
+            if section == len(sections):
+                sections.append({"index": section, "title": title, "chunks": 0, "chars": 0})
+            sections[section]["chunks"] += 1
+            sections[section]["chars"] += len(chunk)
+            chunk_sections.append(section)
+            batch.append(chunk)
+            if len(batch) >= MAP_EMBED_BATCH:
+                embed_batch()
+        if batch:
+            embed_batch()
+
+        if not chunk_sections:
+            return OutputSchema(status="not_found", tool_name="map_document", result={},
+                                meta={"reason": "empty_document"})
+
+        t = time.perf_counter()
+        qv = np.concatenate(vectors) if len(vectors) > 1 else vectors[0]
+        hits = retriever.search_many_by_vectors(qv, k=k)
+        search_sec = time.perf_counter() - t
+
+        req_ids, matrix, chunk_counts = coverage_matrix(
+            np.asarray(chunk_sections, dtype=np.int64), hits, len(sections), min_score
+        )
+        span.set(chunks=len(chunk_sections), sections=len(sections), requirements=len(req_ids))
+
+    best = matrix.max(axis=0) if req_ids else np.zeros(0, dtype=np.float32)
+    order = np.argsort(-best, kind="stable")[:max_reqs]
+    matrix = matrix[:, order]
+    for s in sections:
+        row = matrix[s["index"]]
+        covered = np.flatnonzero(row)
+        ranked = covered[np.argsort(-row[covered], kind="stable")]
+        s["requirements"] = [req_ids[order[j]] for j in ranked]
+
+    requirements = [
+        {
+            "id": req_ids[j],
+            "score": round(float(best[j]), 4),
+            "sections": int(np.count_nonzero(matrix[:, n])),
+            "chunks": int(chunk_counts[j]),
+        }
+        for n, j in enumerate(order.tolist())
+    ]
+    meta = {
+        "chunks": len(chunk_sections),
+        "sections": len(sections),
+        "pages_est": round(len(inp.text) / CHARS_PER_PAGE, 1),
+        "k": k,
+        "min_score": min_score,
+        "embed_sec": round(embed_sec, 3),
+        "search_sec": round(search_sec, 3),
+        "total_sec": round(time.perf_counter() - t0, 3),
+    }
+    return OutputSchema(
+        status="success" if requirements else "not_found",
+        tool_name="map_document",
+        result={
+            "requirements": requirements,
+            "sections": sections,
+            # rows = sections, columns = requirements (same order);
+            # best chunk similarity, 0 = not covered
+            "matrix": np.round(matrix, 3).tolist(),
+        },
+        meta=meta,
+    )
@@ -0,0 +1,119 @@
+"""Find requirements related to a PCI DSS ID (similarity graph, optionally hierarchy siblings)."""
+
+from __future__ import annotations
+
+import os
+import sqlite3
+from typing import Any, Dict, List, Literal, Optional, Tuple
+
+from pydantic import BaseModel, Field
+
+from agent.models.base import BaseToolOutputSchema
+from agent.models.requirement import RequirementEntry
+from mcp_server.capabilities import capabilities
+from retrieval.retriever import get_retriever
+from telemetry import tracing
+from telemetry.metrics import SQLITE_SECONDS, timed
+from tools.get import DB_FILE, fetch_many
+
+# ---------------- Input/Output ----------------
+
+class InputSchema(BaseModel):
+    id: str
+    k: Optional[int] = Field(default=None, ge=1, le=50)
+    siblings: Optional[bool] = Field(default=None)
+
+class OutputSchema(BaseToolOutputSchema):
+    status: Literal["success", "not_found"]
+    tool_name: Literal["related"]
+    result: List[RequirementEntry]
+    meta: Dict[str, Any] | None = None
+
+# ---------------- Config ----------------
+
+RELATED_DEFAULT_K = int(os.getenv("RELATED_DEFAULT_K", "6"))
+RELATED_SIBLINGS_DEFAULT = os.getenv("RELATED_SIBLINGS", "1").lower() not in {"0", "false", "no"}
+# Siblings added after the graph neighbours, at most this many
+RELATED_MAX_SIBLINGS = int(os.getenv("RELATED_MAX_SIBLINGS", "4"))
+
+# ---------------- Helpers ----------------
+
+@timed(SQLITE_SECONDS, helper="related.lookup")
+@tracing.traced("sqlite.related.lookup")
+def _lookup(rid: str, k: int,
+            with_siblings: bool) -> Tuple[Optional[List[Tuple[str, float]]], List[str]]:
+    """
+    Graph neighbours (None when the DB has no `related` table yet) and
+    hierarchy siblings; both are primary-key/index reads on one connection.
+    """
+    conn = sqlite3.connect(str(DB_FILE))
+    try:
+        try:
+            neighbours = [
+                (n, float(s)) for n, s in conn.execute(
+                    "SELECT neighbor, score FROM related WHERE rid = ? ORDER BY rank LIMIT ?",
+                    (rid, k),
+                )
+            ]
+        except sqlite3.OperationalError:
+            neighbours = None
+        siblings: List[str] = []
+        if with_siblings:
+            siblings = [r for (r,) in conn.execute(
+                "SELECT id FROM requirements WHERE parent_id = "
+                "(SELECT parent_id FROM requirements WHERE id = ?) AND id != ? ORDER BY id",
+                (rid, rid),
+            )]
+        return neighbours, siblings
+    finally:
+        conn.close()
+
+def _ann_neighbours(rid: str, k: int) -> List[Tuple[str, float]]:
+    """Fallback for a DB built before the graph: search with the stored vector (no model)."""
+    if not capabilities.usable("vector_index"):
+        return []
+    retriever = get_retriever()
+    found, vectors = retriever.get_vectors([rid])
+    if not found:
+        return []
+    hits = retriever.search_many_by_vectors(vectors, k=k + 1)[0]
+    return [(h["id"], float(h["score"])) for h in hits if h["id"] != rid][:k]
+
+# ---------------- Tool entry ----------------
+
+def run(params: Dict[str, Any]) -> OutputSchema:
+    inp = InputSchema(**(params or {}))
+    rid = inp.id.strip().rstrip(".")
+    k = inp.k or RELATED_DEFAULT_K
+    with_siblings = RELATED_SIBLINGS_DEFAULT if inp.siblings is None else inp.siblings
+
+    neighbours, siblings = _lookup(rid, k, with_siblings)
+    meta: Dict[str, Any] = {"id": rid, "k": k, "source": "graph"}
+    if not neighbours:
+        meta["source"] = "ann_fallback"
+        try:
+            neighbours = _ann_neighbours(rid, k)
+        except Exception as e:
+            neighbours = []
+            meta["retriever_error"] = f"{e.__class__.__name__}: {e}"
+
+    scores = dict(neighbours)
+    sources = {n: "similar" for n in scores}
+    ordered = list(scores)
+    added = 0
+    for sib in siblings:
+        if sib in sources:
+            sources[sib] = "similar+sibling"
+        elif added < RELATED_MAX_SIBLINGS:
+            sources[sib] = "sibling"
+            ordered.append(sib)
+            added += 1
+
+    by_id = fetch_many(ordered)
+    entries = [
+        RequirementEntry(id=r, text=by_id[r].text, tags=by_id[r].tags, score=scores.get(r))
+        for r in ordered if r in by_id
+    ]
+    meta["sources"] = {e.id: sources[e.id] for e in entries}
+    return OutputSchema(status="success" if entries else "not_found", tool_name="related",
+                        result=entries, meta=meta)
@@ -9,8 +9,11 @@ from pathlib import Path
 
 from pydantic import BaseModel, Field, root_validator
 
-from retrieval.retriever import PCIDocumentRetriever
+from retrieval.retriever import get_retriever
+from mcp_server.capabilities import capabilities
 from agent.models.requirement import RequirementEntry
+from telemetry import tracing
+from telemetry.metrics import SQLITE_SECONDS, timed
 
 # ---------------- Input/Output ----------------
 
@@ -37,7 +40,6 @@ class OutputSchema(RequirementOutput):
 
 # ---------------- Config ----------------
 
-retriever = PCIDocumentRetriever()
 DEFAULT_K = int(os.getenv("SEARCH_TOP_K", "8"))
 ENRICH_DEFAULT = os.getenv("SEARCH_ENRICH_WITH_SQLITE", "1").lower() not in {"0","false","no"}
 ENRICH_MAX = int(os.getenv("SEARCH_ENRICH_MAX", "6"))
@@ -75,9 +77,12 @@ def _normalize_doc(doc: Dict[str, Any]) -> Dict[str, Any] | None:
         out["tags"] = tags
     return out
 
+@timed(SQLITE_SECONDS, helper="search.enrich")
+@tracing.traced("sqlite.search.enrich")
 def _enrich_with_sqlite(ids: List[str]) -> Dict[str, Dict[str, Any]]:
     if not ids:
         return {}
+    tracing.annotate(ids=len(ids))
     placeholders = ",".join("?" for _ in ids)
     sql = f"SELECT id, text, COALESCE(tags,'') AS tags FROM requirements WHERE id IN ({placeholders})"
     with _connect_db() as conn:
@@ -115,6 +120,8 @@ def _keywords(q: str) -> List[str]:
             seen.add(t)
     return uniq
 
+@timed(SQLITE_SECONDS, helper="search.keyword_fallback")
+@tracing.traced("sqlite.search.keyword_fallback")
 def _sqlite_keyword_fallback_smart(q: str, k: int) -> List[Dict[str, Any]]:
     """
     Progressive relaxation:
@@ -124,6 +131,7 @@ def _sqlite_keyword_fallback_smart(q: str, k: int) -> List[Dict[str, Any]]:
     Each token uses '%' suffix wildcard for light stemming.
     """
     kws = _keywords(q)
+    tracing.annotate(k=k, keywords=len(kws))
     fields = ["text", "title"]  # search both
     if not kws:
         like = f"%{q.replace('%','')}%"
@@ -190,25 +198,31 @@ def _sqlite_keyword_fallback_smart(q: str, k: int) -> List[Dict[str, Any]]:
 
 # ---------------- Tool entry ----------------
 
-def run(params: Dict[str, Any]) -> OutputSchema:
+def _parse_params(params: Dict[str, Any]):
     q = (params or {}).get("q") or (params or {}).get("query") or ""
     q = (q or "").strip()
     k = (params or {}).get("k") or DEFAULT_K
     do_enrich = (params or {}).get("enrich")
     if do_enrich is None:
         do_enrich = ENRICH_DEFAULT
+    return q, k, do_enrich
 
-    if not q:
-        return OutputSchema(status="not_found", tool_name="search", result=[], meta={"reason": "empty_query"})
-
-    # 1) Try ANN
-    ann_docs: List[Dict[str, Any]] = []
-    retriever_error = None
+def _ann_search_many(queries: List[str], k: int):
+    """One encode() + one FAISS search for all queries; (hits per query, error)."""
+    if not (capabilities.usable("vector_index") and capabilities.usable("embedder")):
+        # Index/model still loading (or broken): go straight to the lexical path
+        return [[] for _ in queries], (
+            f"vector search unavailable (vector_index {capabilities.state('vector_index')}, "
+            f"embedder {capabilities.state('embedder')})"
+        )
     try:
-        ann_docs = retriever.search(q, k=k)
+        # Loads the index on first use (or during warmup), not at import
+        return get_retriever().search_many(queries, k=k), None
     except Exception as e:
-        retriever_error = f"{e.__class__.__name__}: {e}"
+        return [[] for _ in queries], f"{e.__class__.__name__}: {e}"
 
+def _build_output(q: str, k: int, do_enrich: bool, ann_docs: List[Dict[str, Any]],
+                  retriever_error: Optional[str]) -> OutputSchema:
     if not ann_docs:
         # 2) Fallback SQLite
         sql_hits = _sqlite_keyword_fallback_smart(q, k)
@@ -229,6 +243,7 @@ def run(params: Dict[str, Any]) -> OutputSchema:
 
     # 3) Enrich FAISS hits via SQLite (best effort)
     ids = [str(d.get("id")) for d in ann_docs if d.get("id")]
+    scores = {str(d.get("id")): d.get("score") for d in ann_docs if d.get("id")}
     entries: List[RequirementEntry] = []
     if do_enrich:
         by_id = _enrich_with_sqlite(ids[:ENRICH_MAX])
@@ -237,9 +252,45 @@ def run(params: Dict[str, Any]) -> OutputSchema:
             text = src.get("text") or ""
             tags = src.get("tags") or []
             if text:
-                entries.append(RequirementEntry(id=rid, text=text, tags=tags))
+                entries.append(
+                    RequirementEntry(id=rid, text=text, tags=tags, score=scores.get(rid))
+                )
     if not entries:
         # Just return IDs if SQLite was unavailable
-        entries = [RequirementEntry(id=rid, text="", tags=[]) for rid in ids[:k]]
+        entries = [
+            RequirementEntry(id=rid, text="", tags=[], score=scores.get(rid)) for rid in ids[:k]
+        ]
 
     return OutputSchema(status="success", tool_name="search", result=entries, meta={"query": q, "k": k, "source": "faiss"})
+
+def run(params: Dict[str, Any]) -> OutputSchema:
+    return run_many([params])[0]
+
+def run_prefetched(params: Dict[str, Any], prefetched: List[Dict[str, Any]]) -> OutputSchema:
+    """Build the result from ANN hits the caller already has (no embedding, no FAISS search)."""
+    q, k, do_enrich = _parse_params(params)
+    if not q:
+        return OutputSchema(status="not_found", tool_name="search", result=[],
+                            meta={"reason": "empty_query"})
+    return _build_output(q, k, do_enrich, prefetched[:k], None)
+
+def run_many(params_list: List[Dict[str, Any]]) -> List[OutputSchema]:
+    """Several searches with one embedding batch and one ANN lookup (used by /tools/call_batch)."""
+    parsed = [_parse_params(p) for p in params_list]
+    live = [i for i, (q, _, _) in enumerate(parsed) if q]
+    # 1) Try ANN for every non-empty query at once, at the largest k
+    ann: Dict[int, List[Dict[str, Any]]] = {}
+    retriever_error = None
+    if live:
+        k_max = max(parsed[i][1] for i in live)
+        hits, retriever_error = _ann_search_many([parsed[i][0] for i in live], k_max)
+        ann = {i: h[:parsed[i][1]] for i, h in zip(live, hits)}
+
+    out: List[OutputSchema] = []
+    for i, (q, k, do_enrich) in enumerate(parsed):
+        if not q:
+            out.append(OutputSchema(status="not_found", tool_name="search", result=[],
+                                    meta={"reason": "empty_query"}))
+            continue
+        out.append(_build_output(q, k, do_enrich, ann.get(i, []), retriever_error))
+    return out